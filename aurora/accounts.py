@@ -0,0 +1,151 @@
+import csv
+import json
+import threading
+from aurora import clients, throttle
+
+# assumed role credentials last this long, botocore refreshes them shortly before they expire
+DEFAULT_DURATION_SECONDS = 3600
+DEFAULT_SESSION_NAME = 'aurora-inventory'
+# number of accounts inventoried at once
+DEFAULT_ACCOUNT_WORKERS = 4
+manifest_keys = ['account_id', 'role_arn', 'regions', 'external_id']
+# services whose answers don't depend on the account, always called with the default credentials
+shared_services = ['pricing']
+
+
+class Account(object):
+    """One line of an accounts manifest. region_names is None to use the regions given on the command line."""
+
+    def __init__(self, account_id, role_arn=None, region_names=None, external_id=None):
+        self.account_id = account_id
+        self.role_arn = role_arn
+        self.region_names = region_names
+        self.external_id = external_id
+
+    def __repr__(self):
+        return 'Account({!r}, role_arn={!r})'.format(self.account_id, self.role_arn)
+
+
+def parse_regions(regions):
+    # 'us-east-1 us-west-2', 'us-east-1;us-west-2' or a json list; empty or 'all' means every region
+    if regions is None or isinstance(regions, list):
+        return regions or None
+    region_names = regions.replace(';', ' ').replace(',', ' ').split()
+    if len(region_names) == 0 or region_names == ['all']:
+        return None
+    return region_names
+
+
+def load_manifest(path):
+    """
+    Read an accounts manifest, either a csv with (some of) the columns account_id, role_arn, regions and
+    external_id, or a json list of objects with those keys.
+
+    An account without a role_arn is inventoried with the default credentials.
+    """
+    with open(path, 'r', newline='') as f:
+        if path.lower().endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(row for row in f if row.strip() != '' and not row.startswith('#')))
+    accounts = []
+    for i, row in enumerate(rows):
+        account_id = str(row.get('account_id') or '').strip()
+        if account_id == '':
+            raise ValueError("{path}: entry {n} has no account_id".format(path=path, n=i + 1))
+        if account_id in [account.account_id for account in accounts]:
+            raise ValueError("{path}: account {account_id} is listed twice".format(path=path, account_id=account_id))
+        accounts.append(Account(account_id, role_arn=row.get('role_arn') or None,
+                                region_names=parse_regions(row.get('regions')),
+                                external_id=row.get('external_id') or None))
+    return accounts
+
+
+class AccountPool(clients.ClientPool):
+    """
+    Clients for one account, signed with credentials from assuming its role.
+
+    The role is assumed (with the default pool's credentials) the first time a client is needed, and botocore
+    assumes it again whenever the credentials are about to expire, so a long scan never runs on stale credentials.
+    The account's session shares the default session's event hooks (e.g. --profile) as they were when it was
+    created.
+    """
+
+    def __init__(self, account, base_pool=None, duration_seconds=DEFAULT_DURATION_SECONDS,
+                 session_name=DEFAULT_SESSION_NAME):
+        base_pool = base_pool if base_pool is not None else clients.get_default_pool()
+        super(AccountPool, self).__init__(max_pool_connections=base_pool.max_pool_connections,
+                                          max_attempts=base_pool.max_attempts)
+        self.account = account
+        self.base_pool = base_pool
+        self.duration_seconds = duration_seconds
+        self.session_name = session_name
+        self.assumed = 0
+
+    @property
+    def session(self):
+        if self._session is None:
+            base_session = self.base_pool.session
+            with self._lock:
+                if self._session is None:
+                    self._session = self._make_session(base_session)
+        return self._session
+
+    def _make_session(self, base_session):
+        import boto3.session
+        import botocore.credentials
+        import botocore.session
+
+        class AccountSession(boto3.session.Session):
+            def _register_default_handlers(self):
+                # the copied emitter already has boto3's handlers, registering them twice breaks e.g. s3 clients
+                pass
+
+        # a copy of the default session's event emitter, which already has botocore's and boto3's handlers (and any
+        # hooks like --profile's) registered
+        emitter = base_session._session.get_component('event_emitter')
+        botocore_session = botocore.session.Session(event_hooks=emitter.__copy__(), include_builtin_handlers=False)
+        botocore_session._credentials = botocore.credentials.RefreshableCredentials.create_from_metadata(
+            metadata=self._assume_role(), refresh_using=self._assume_role, method='sts-assume-role')
+        return AccountSession(botocore_session=botocore_session, region_name=base_session.region_name)
+
+    def _assume_role(self):
+        kwargs = {'RoleArn': self.account.role_arn,
+                  'RoleSessionName': self.session_name,
+                  'DurationSeconds': self.duration_seconds}
+        if self.account.external_id is not None:
+            kwargs['ExternalId'] = self.account.external_id
+        sts = self.base_pool.get_client('sts')
+        credentials = throttle.call('sts', sts.assume_role, **kwargs)['Credentials']
+        self.assumed += 1
+        return {'access_key': credentials['AccessKeyId'],
+                'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'],
+                'expiry_time': credentials['Expiration'].isoformat()}
+
+    def get_client(self, service_name, region_name=None):
+        if service_name in shared_services:
+            return self.base_pool.get_client(service_name, region_name=region_name)
+        return super(AccountPool, self).get_client(service_name, region_name=region_name)
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+def get_account_pool(account):
+    # one pool (and so one set of cached credentials) per account for the whole process
+    if account.role_arn is None:
+        return clients.get_default_pool()
+    with _pools_lock:
+        key = (account.account_id, account.role_arn, account.external_id)
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = AccountPool(account)
+    return pool
+
+
+def clear():
+    # forget every account's clients and credentials (e.g. after clients.configure())
+    with _pools_lock:
+        _pools.clear()
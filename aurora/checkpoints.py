@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import pickle
+import random
+import shutil
+import threading
+import click
+from aurora import pricing_cache
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(pricing_cache.DEFAULT_CACHE_DIR, 'runs')
+MANIFEST_NAME = 'manifest.json'
+
+
+def make_run_id():
+    return '{}-{:04x}'.format(time.strftime('%Y%m%d-%H%M%S'), random.getrandbits(16))
+
+
+class Run(object):
+    """
+    A run's checkpoint directory: the result of every finished unit of work (a region, a chunk of buckets) pickled
+    next to a manifest.json recording the status of each unit.
+
+    Resuming a run (run_id of an existing run) hands back the finished units instead of redoing them, so only the
+    failed or pending ones are collected again. The directory is removed once a run finishes without failures.
+    """
+
+    def __init__(self, run_id=None, root=DEFAULT_CHECKPOINT_DIR):
+        self.resumed = run_id is not None
+        self.run_id = run_id if run_id is not None else make_run_id()
+        self.path = os.path.join(root, self.run_id)
+        self._lock = threading.Lock()
+        if self.resumed:
+            if not os.path.isfile(os.path.join(self.path, MANIFEST_NAME)):
+                raise ValueError("no checkpointed run {run_id} in {root}".format(run_id=run_id, root=root))
+            with open(os.path.join(self.path, MANIFEST_NAME), 'r') as f:
+                self.manifest = json.load(f)
+        else:
+            os.makedirs(self.path)
+            self.manifest = {'run_id': self.run_id, 'created': time.time(), 'units': dict()}
+            self._write_manifest()
+
+    def _write_manifest(self):
+        # write then rename, so a crash mid-write never leaves a truncated manifest behind
+        tmp_path = os.path.join(self.path, MANIFEST_NAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_NAME))
+
+    def _set(self, key, **status):
+        with self._lock:
+            status['updated'] = time.time()
+            self.manifest['units'][key] = status
+            self._write_manifest()
+
+    def checkpoint(self, name):
+        return Checkpoint(self, name)
+
+    def failed(self):
+        return sorted(key for key, status in self.manifest['units'].items() if status['status'] == 'failed')
+
+    def finish(self, failed=()):
+        # keep the checkpoints of a run that had failures (plus any the caller knows of) so it can be resumed, and
+        # fail the command, otherwise tidy up
+        failed = self.failed() + list(failed)
+        if len(failed) > 0:
+            raise click.ClickException("run {run_id} finished with {n} failed units ({units}); retry them with "
+                                       "--resume {run_id}".format(run_id=self.run_id, n=len(failed),
+                                                                  units=", ".join(failed)))
+        self.discard()
+
+    def discard(self):
+        # remove the checkpoints whatever happened, for runs that are never resumed (aurora serve's refreshes)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def failed_services(self):
+        # the services (or services:accounts) with a failed unit, e.g. 'ec2/us-east-1' or 's3.sizes/3'
+        return sorted(set(key.split('/')[0].split('.')[0] for key in self.failed()))
+
+
+class Checkpoint(object):
+    """The units of one stage of a run, e.g. run.checkpoint('ec2') holds one unit per region."""
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def stage(self, name):
+        # e.g. run.checkpoint('s3').stage('sizes') for the units of a later stage of the same collector
+        return Checkpoint(self.run, '{}.{}'.format(self.name, name))
+
+    def _key(self, unit):
+        return '{}/{}'.format(self.name, unit)
+
+    def _file(self, unit):
+        return os.path.join(self.run.path, '{}.pickle'.format(self._key(unit).replace('/', '__').replace(':', '_')))
+
+    def done(self, unit):
+        status = self.run.manifest['units'].get(self._key(unit))
+        return status is not None and status['status'] == 'done'
+
+    def load(self, unit, default=None):
+        # the saved result of a unit, finished or not
+        if self._key(unit) not in self.run.manifest['units'] or not os.path.isfile(self._file(unit)):
+            return default
+        with open(self._file(unit), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, unit, value, done=True):
+        # done=False saves progress on a unit that's still being worked on
+        tmp_path = self._file(unit) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._file(unit))
+        self.run._set(self._key(unit), status='done' if done else 'partial')
+
+    def fail(self, unit, error):
+        self.run._set(self._key(unit), status='failed', error='{}: {}'.format(type(error).__name__, error))
+
+
+def start(resume=None):
+    # the Run for a command's --resume option
+    try:
+        run = Run(run_id=resume)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--resume')
+    if run.resumed:
+        print("Resuming run {}".format(run.run_id))
+    else:
+        print("Run {run_id} (if it fails partway, pick up where it left off with --resume {run_id})".format(
+            run_id=run.run_id))
+    return run
@@ -0,0 +1,316 @@
+import os
+import click
+import tools
+from aurora import (accounts, checkpoints, clients, history, offers, options, output, pricing_api_info,
+                    pricing_cache, profiling, scan, serve, snapshots, throttle)
+from aurora.options import (checkpoint_options, client_options, history_options, output_options, pricing_options,
+                            profile_options, scan_options, snapshot_options)
+
+SERVICES = ['ec2', 'ebs', 's3']
+# how each service's columns map onto the combined cost report
+report_columns = history.report_columns
+
+
+def parse_services(services):
+    service_names = [s.strip().lower() for s in services.split(',') if s.strip() != '']
+    unknown = [s for s in service_names if s not in SERVICES]
+    if len(unknown) > 0 or len(service_names) == 0:
+        raise click.BadParameter("must be a comma separated list of {}".format(", ".join(SERVICES)),
+                                 param_hint='--services')
+    return service_names
+
+
+def collect_service(service, region_names, days=4, agg='min', workers=scan.DEFAULT_WORKERS, snapshot=None,
+                    checkpoint=None):
+    with profiling.stage('inventory.{}'.format(service)):
+        return _collect_service(service, region_names, days=days, agg=agg, workers=workers, snapshot=snapshot,
+                                checkpoint=checkpoint)
+
+
+def _collect_service(service, region_names, days=4, agg='min', workers=scan.DEFAULT_WORKERS, snapshot=None,
+                     checkpoint=None):
+    if service == 'ec2':
+        from aurora import ec2_info
+        return ec2_info.collect(region_names, workers=workers, snapshot=snapshot, checkpoint=checkpoint)
+    elif service == 'ebs':
+        from aurora import ebs_info
+        return ebs_info.collect(region_names, workers=workers, snapshot=snapshot, checkpoint=checkpoint)
+    else:
+        from aurora import s3_info
+        return s3_info.collect(region_names, days=days, agg=agg, workers=workers, snapshot=snapshot,
+                               checkpoint=checkpoint)
+
+
+def inventory_services(service_names, region_names, service_snapshots, days=4, agg='min',
+                       workers=scan.DEFAULT_WORKERS, label='', service_checkpoints=None):
+    # run the collectors concurrently with the current context's clients, returns ({service: results}, failed)
+    from concurrent.futures import ThreadPoolExecutor
+    # every collector shares this process's pricing cache and region registry
+    with ThreadPoolExecutor(max_workers=len(service_names)) as executor:
+        futures = [(service, clients.submit(executor, collect_service, service, region_names,
+                                            days=days, agg=agg, workers=workers,
+                                            snapshot=service_snapshots[service],
+                                            checkpoint=(service_checkpoints or dict()).get(service)))
+                   for service in service_names]
+    service_dfs = dict()
+    failed = []
+    for service, future in futures:
+        try:
+            service_dfs[service] = future.result()
+        except Exception as e:
+            print("Warning: {service} inventory{label} failed ({error_type}: {error})".format(
+                service=service, label=label, error_type=type(e).__name__, error=e))
+            failed.append(service)
+    return service_dfs, failed
+
+
+def inventory_account(account, service_names, region_names, snapshot_store, incremental=False, days=4, agg='min',
+                      workers=scan.DEFAULT_WORKERS, run=None):
+    # one account's inventory, with its own clients and snapshots; every result gets an account_id column
+    service_snapshots = dict((service, snapshots.Snapshot('{}:{}'.format(service, account.account_id),
+                                                          store=snapshot_store, incremental=incremental,
+                                                          global_listing=service == 's3'))
+                             for service in service_names)
+    service_checkpoints = None
+    if run is not None:
+        service_checkpoints = dict((service, run.checkpoint('{}:{}'.format(service, account.account_id)))
+                                   for service in service_names)
+    print("Inventorying account {}".format(account.account_id))
+    pool = accounts.get_account_pool(account)
+    try:
+        # assume the role up front, so an account we can't get into fails once rather than in every region
+        pool.session
+    except Exception as e:
+        print("Warning: skipping account {account_id} ({error_type}: {error})".format(
+            account_id=account.account_id, error_type=type(e).__name__, error=e))
+        return dict(), list(service_names), service_snapshots
+    with clients.using_pool(pool):
+        service_dfs, failed = inventory_services(service_names, account.region_names or region_names,
+                                                 service_snapshots, days=days, agg=agg, workers=workers,
+                                                 label=' of account {}'.format(account.account_id),
+                                                 service_checkpoints=service_checkpoints)
+    for results_df in service_dfs.values():
+        results_df.insert(0, 'account_id', account.account_id)
+    return service_dfs, failed, service_snapshots
+
+
+def inventory_accounts(account_list, service_names, region_names, snapshot_store, incremental=False, days=4,
+                       agg='min', workers=scan.DEFAULT_WORKERS, account_workers=accounts.DEFAULT_ACCOUNT_WORKERS,
+                       run=None):
+    # inventory several accounts at once and merge each service's results across them
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(1, account_workers)) as executor:
+        futures = [executor.submit(inventory_account, account, service_names, region_names, snapshot_store,
+                                   incremental=incremental, days=days, agg=agg, workers=workers, run=run)
+                   for account in account_list]
+    account_dfs = dict()
+    failed = []
+    finished_snapshots = []
+    for account, future in zip(account_list, futures):
+        service_dfs, account_failed, service_snapshots = future.result()
+        for service, results_df in service_dfs.items():
+            account_dfs.setdefault(service, []).append(results_df)
+        failed.extend('{} ({})'.format(service, account.account_id) for service in account_failed)
+        finished_snapshots.extend(service_snapshots[service] for service in service_names
+                                  if service not in account_failed)
+    service_dfs = dict((service, output.concat_frames(account_dfs[service])) for service in service_names
+                       if service in account_dfs)
+    return service_dfs, failed, finished_snapshots
+
+
+def combine_reports(service_dfs):
+    import pandas as pd
+    from aurora.ec2_info import tags_keys
+    report_keys = ['service', 'resource_id', 'resource_type', 'region_name', 'usd_per_month'] + tags_keys
+    if any('account_id' in results_df.columns for results_df in service_dfs.values()):
+        report_keys = ['account_id'] + report_keys
+    frames = []
+    for service, results_df in service_dfs.items():
+        frame = results_df.rename(columns=report_columns[service])
+        frame['service'] = service
+        frames.append(frame.reindex(columns=report_keys))
+    if len(frames) == 0:
+        return pd.DataFrame(columns=report_keys)
+    report_df = pd.concat(frames, ignore_index=True)
+    report_df.sort_values(by='usd_per_month', inplace=True, ascending=False)
+    return report_df
+
+
+@click.group()
+def main():
+    """Inventory and assess AWS costs for EC2, EBS and S3."""
+
+
+@main.command()
+@click.argument('out')
+@click.option('--services', '-s', type=str, default=','.join(SERVICES), show_default=True,
+              help='Comma separated list of services to inventory.')
+@click.option('--region', '-r', 'in_region', type=str, default='all', show_default=True,
+              help="Region code, or 'all'.")
+@click.option('--per-service', is_flag=True, default=False,
+              help='Treat OUT as a directory and write one file per service instead of a combined report.')
+@click.option('--days', '-d', type=int, default=4, show_default=True,
+              help='S3: days of CloudWatch metrics to aggregate.')
+@click.option('--agg', '-a', type=click.Choice(['min', 'max', 'mean']), default='min', show_default=True,
+              help='S3: how to aggregate the daily bucket sizes.')
+@click.option('--accounts', 'accounts_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Accounts manifest (csv or json with account_id, role_arn and optionally regions and external_id) '
+                   'to inventory by assuming each role; results get an account_id column.')
+@click.option('--account-workers', type=int, default=accounts.DEFAULT_ACCOUNT_WORKERS, show_default=True,
+              help='Number of accounts to inventory in parallel.')
+@output_options
+@snapshot_options
+@pricing_options
+@scan_options
+@client_options
+@profile_options
+@checkpoint_options
+@history_options
+def inventory(out, services=','.join(SERVICES), in_region='all', per_service=False, days=4, agg='min',
+              accounts_path=None, account_workers=accounts.DEFAULT_ACCOUNT_WORKERS, fmt='csv', incremental=False,
+              diff_report=None, refresh_prices=False, price_ttl=pricing_cache.DEFAULT_TTL_DAYS,
+              workers=scan.DEFAULT_WORKERS, max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS,
+              max_attempts=clients.DEFAULT_MAX_ATTEMPTS, profile=False, profile_json=None, resume=None,
+              record_history=True, discover=True):
+    """Run the EC2, EBS and S3 inventories concurrently and write their costs to OUT."""
+
+    service_names = parse_services(services)
+    region_names = tools.resolve_regions(in_region)
+    account_list = None
+    if accounts_path is not None:
+        try:
+            account_list = accounts.load_manifest(accounts_path)
+        except (ValueError, KeyError) as e:
+            raise click.BadParameter(str(e), param_hint='--accounts')
+
+    options.configure(price_ttl=price_ttl, refresh_prices=refresh_prices, max_pool_connections=max_pool_connections,
+                      max_attempts=max_attempts, discover=discover, profile=profile, profile_json=profile_json)
+    snapshot_store = snapshots.SnapshotStore()
+    run = checkpoints.start(resume)
+    if accounts_path is None:
+        service_snapshots = dict((service, snapshots.Snapshot(service, store=snapshot_store, incremental=incremental,
+                                                              global_listing=service == 's3'))
+                                 for service in service_names)
+        service_dfs, failed = inventory_services(service_names, region_names, service_snapshots, days=days, agg=agg,
+                                                 workers=workers,
+                                                 service_checkpoints=dict((service, run.checkpoint(service))
+                                                                          for service in service_names))
+        # a failed service keeps its previous snapshot
+        finished_snapshots = [service_snapshots[service] for service in service_names if service not in failed]
+    else:
+        accounts.clear()
+        service_dfs, failed, finished_snapshots = inventory_accounts(account_list, service_names, region_names,
+                                                                     snapshot_store, incremental=incremental,
+                                                                     days=days, agg=agg, workers=workers,
+                                                                     account_workers=account_workers, run=run)
+    throttle.report()
+    snapshots.finish(finished_snapshots, diff_report=diff_report)
+
+    with profiling.stage('inventory.output'):
+        if per_service:
+            from aurora.ec2_info import sorted_keys
+            if not os.path.isdir(out):
+                os.makedirs(out)
+            for service, results_df in service_dfs.items():
+                if service == 'ec2' and fmt == 'csv':
+                    # same layout as ec2_info writes
+                    results_df = results_df[[k for k in ['account_id'] if k in results_df.columns] + sorted_keys]
+                output.write_frame(results_df, os.path.join(out, '{}.{}'.format(service, fmt)), fmt=fmt)
+        else:
+            output.write_frame(combine_reports(service_dfs), out, fmt=fmt)
+    if record_history and len(failed) > 0:
+        # a run only goes into the history once all of it has been collected (regions are checked by the recorder)
+        print("Leaving run {} out of the cost history until it finishes without failures".format(run.run_id))
+    elif record_history:
+        with profiling.stage('inventory.history'):
+            for service, results_df in service_dfs.items():
+                history.record(run, service, results_df)
+    profiling.report(json_path=profile_json)
+    # fails the command if any service, or any region of one, failed
+    run.finish(failed=failed)
+
+
+@main.group('history')
+def history_group():
+    """Query the local cost history of past runs."""
+
+
+def parse_where(ctx, param, value):
+    # ('team=maps', 'service=ebs', 'service=ec2') -> {'team': ['maps'], 'service': ['ebs', 'ec2']}
+    where = dict()
+    for condition in value:
+        key, sep, condition_value = condition.partition('=')
+        if sep == '' or key.strip() not in history.group_keys:
+            raise click.BadParameter("must be KEY=VALUE with KEY one of {}".format(", ".join(history.group_keys)))
+        where.setdefault(key.strip(), []).append(condition_value.strip())
+    return where
+
+
+@history_group.command('query')
+@click.option('--by', '-b', multiple=True, type=click.Choice(history.group_keys),
+              help='Column to group by (repeatable).')
+@click.option('--bucket', type=click.Choice(list(history.BUCKETS)), default='day', show_default=True,
+              help='Time bucket; each bucket averages the runs that fall in it.')
+@click.option('--days', type=int, default=None, help='Only the runs of the last DAYS days.')
+@click.option('--where', '-w', multiple=True, callback=parse_where, metavar='KEY=VALUE',
+              help='Only resources with this value, e.g. team=maps (repeatable; repeating a key matches any of its '
+                   'values).')
+@click.option('--out', '-o', 'out_csv', type=click.Path(dir_okay=False), default=None,
+              help='Write the result to this csv instead of printing it.')
+@click.option('--store', 'store_path', type=click.Path(dir_okay=False), default=history.DEFAULT_HISTORY_PATH,
+              show_default=True, help='History store to query.')
+def query_history(by=(), bucket='day', days=None, where=None, out_csv=None, store_path=history.DEFAULT_HISTORY_PATH):
+    """
+    Monthly costs per time bucket across past runs, e.g. a team's EBS spend by week over the last 90 days:
+
+    aurora history query --where service=ebs --where team=maps --bucket week --days 90
+    """
+    if not os.path.exists(store_path):
+        raise click.ClickException("no cost history at {}".format(store_path))
+    try:
+        results_df = history.HistoryStore(store_path).query(by=by, bucket=bucket, days=days, where=where)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if out_csv is not None:
+        results_df.to_csv(out_csv, index=False)
+        print("Wrote {n} rows to {path}".format(n=len(results_df), path=out_csv))
+    else:
+        click.echo(results_df.to_string(index=False))
+
+
+@main.group()
+def prices():
+    """Manage the local price data."""
+
+
+@prices.command('import')
+@click.argument('offer_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--store', 'store_path', type=click.Path(dir_okay=False), default=offers.DEFAULT_OFFERS_PATH,
+              show_default=True, help='Offer store to import into.')
+def import_prices(offer_file, store_path=offers.DEFAULT_OFFERS_PATH):
+    """
+    Import an AWS bulk price list offer file (AmazonEC2 or AmazonS3, csv or json) for offline pricing.
+
+    The file is streamed rather than loaded into memory, and only the on-demand prices the collectors use are kept.
+    Prices found in the store are used instead of querying the Pricing API.
+    """
+    print("Importing {}".format(offer_file))
+    try:
+        counts = offers.import_offer_file(offer_file, store_path=store_path)
+    except (ImportError, ValueError) as e:
+        raise click.ClickException(str(e))
+    print("Imported {ec2} EC2 instance prices, {ebs} EBS volume prices and {s3} S3 storage tiers into {path}".format(
+        path=store_path, **counts))
+    if store_path == offers.DEFAULT_OFFERS_PATH:
+        # cached Pricing API results would otherwise take precedence over the new prices until they expire
+        pricing_cache.get_cache().clear()
+
+
+# aurora prices attributes AmazonEC2 is the same command as pricing_api_info AmazonEC2
+prices.add_command(pricing_api_info.main, 'attributes')
+# long-running mode: refresh the inventory on a schedule and serve the results over HTTP
+main.add_command(serve.main, 'serve')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import threading
+import contextlib
+import contextvars
+
+# enough connections for every worker thread to have one per client without botocore discarding them
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_MAX_ATTEMPTS = 10
+# every call to these goes through throttle.call, which retries throttling (and transient errors) itself; botocore
+# retrying them as well would hide the throttling from the rate limiter, so their clients make a single attempt per call
+THROTTLED_SERVICES = ('pricing', 'cloudwatch')
+
+
+class ClientPool(object):
+    """
+    One boto3 session plus a cache of its clients keyed by (service_name, region_name).
+
+    Creating a client loads its service model, which is slow, and sessions are not thread safe, so clients are
+    created once under a lock and then shared (boto3 clients themselves are thread safe).
+    """
+
+    def __init__(self, session=None, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self._session = session
+        self.max_pool_connections = max_pool_connections
+        self.max_attempts = max_attempts
+        self._clients = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import boto3.session
+                    self._session = boto3.session.Session()
+        return self._session
+
+    def get_config(self, service_name):
+        import botocore.config
+        if service_name in THROTTLED_SERVICES:
+            retries = {'total_max_attempts': 1}
+        else:
+            # max_attempts counts the retries after the first attempt
+            retries = {'max_attempts': self.max_attempts}
+        return botocore.config.Config(max_pool_connections=self.max_pool_connections, retries=retries)
+
+    def get_client(self, service_name, region_name=None):
+        key = (service_name, region_name)
+        client = self._clients.get(key)
+        if client is None:
+            session = self.session
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = session.client(service_name, region_name=region_name, config=self.get_config(service_name))
+                    self._clients[key] = client
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+# overrides the process-wide pool within a context, e.g. one pool per account during a multi-account inventory
+_context_pool = contextvars.ContextVar('aurora_client_pool', default=None)
+
+
+def configure(session=None, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    # replace the process-wide pool (used by the --max-pool-connections and --max-attempts cli options)
+    global _default_pool
+    with _default_pool_lock:
+        if session is None and _default_pool is not None:
+            # keep the one session per process, only the clients need rebuilding with the new config
+            session = _default_pool._session
+        _default_pool = ClientPool(session=session, max_pool_connections=max_pool_connections,
+                                   max_attempts=max_attempts)
+    return _default_pool
+
+
+def get_pool():
+    pool = _context_pool.get()
+    if pool is not None:
+        return pool
+    return get_default_pool()
+
+
+def get_default_pool():
+    # the process-wide pool, whatever the current context is using
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = ClientPool()
+    return _default_pool
+
+
+@contextlib.contextmanager
+def using_pool(pool):
+    # with clients.using_pool(pool): ... get_client() (on this thread, or via submit()) takes clients from pool
+    token = _context_pool.set(pool)
+    try:
+        yield pool
+    finally:
+        _context_pool.reset(token)
+
+
+def submit(executor, func, *args, **kwargs):
+    # executor threads don't inherit the caller's context, so run func in a copy of it to keep using the same pool
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def get_client(service_name, region_name=None):
+    return get_pool().get_client(service_name, region_name=region_name)
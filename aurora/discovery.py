@@ -0,0 +1,136 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aurora import clients, scan
+
+# the smallest page describe_instances and describe_volumes allow, enough to tell whether a region has anything
+PROBE_PAGE_SIZE = 5
+
+
+def get_enabled_regions(ec2=None):
+    # regions the account can use: the ones that don't need opting in plus the ones it has opted in to
+    if ec2 is None:
+        ec2 = clients.get_client('ec2', region_name='us-east-1')
+    return [region['RegionName'] for region in ec2.describe_regions()['Regions']]
+
+
+def probe_ec2(region_name):
+    ec2 = clients.get_client('ec2', region_name=region_name)
+    response = ec2.describe_instances(MaxResults=PROBE_PAGE_SIZE)
+    # a page can come back empty with more to follow (e.g. only terminated instances so far)
+    return (any(len(reservation['Instances']) > 0 for reservation in response['Reservations']) or
+            bool(response.get('NextToken')))
+
+
+def probe_ebs(region_name):
+    ec2 = clients.get_client('ec2', region_name=region_name)
+    response = ec2.describe_volumes(MaxResults=PROBE_PAGE_SIZE)
+    return len(response['Volumes']) > 0 or bool(response.get('NextToken'))
+
+
+# services listed region by region; s3 lists every bucket in one call, so only its enabled regions are used
+probes = {'ec2': probe_ec2, 'ebs': probe_ebs}
+
+
+class RegionDiscovery(object):
+    """
+    Works out which regions are worth scanning for a service, for one set of credentials (i.e. one account).
+
+    The enabled regions come from a single describe_regions call, then every enabled region is probed concurrently
+    with a one page describe call. Both are remembered, so collectors running in the same process (e.g. aurora
+    inventory) share the answers. Anything that can't be determined errs on the side of scanning the region.
+    """
+
+    def __init__(self):
+        self.enabled = None
+        self.probed = dict()
+        self._lock = threading.Lock()
+        self._enabled_lock = threading.Lock()
+
+    def enabled_regions(self):
+        # None when the account's regions can't be listed (e.g. no ec2:DescribeRegions permission)
+        with self._enabled_lock:
+            if self.enabled is None:
+                try:
+                    self.enabled = get_enabled_regions()
+                except Exception as e:
+                    print("Warning: couldn't list the enabled regions, scanning every region ({error_type}: "
+                          "{error})".format(error_type=type(e).__name__, error=e))
+                    self.enabled = False
+            return self.enabled or None
+
+    def _probe(self, service, region_name):
+        try:
+            return probes[service](region_name)
+        except Exception:
+            # the scan itself will report what is wrong with the region
+            return True
+
+    def probe(self, service, region_names, workers=scan.DEFAULT_WORKERS):
+        # {region_name: whether the region has any resources of the service}
+        with self._lock:
+            missing = [region_name for region_name in region_names if (service, region_name) not in self.probed]
+        if len(missing) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as executor:
+                futures = [clients.submit(executor, self._probe, service, region_name) for region_name in missing]
+            with self._lock:
+                for region_name, future in zip(missing, futures):
+                    self.probed[(service, region_name)] = future.result()
+        with self._lock:
+            return dict((region_name, self.probed[(service, region_name)]) for region_name in region_names)
+
+    def filter_regions(self, service, region_names, workers=scan.DEFAULT_WORKERS, snapshot=None):
+        region_names = list(region_names)
+        enabled = self.enabled_regions()
+        if enabled is not None:
+            disabled = [region_name for region_name in region_names if region_name not in enabled]
+            if len(disabled) > 0:
+                print("Skipping {n} regions that aren't enabled: {names}".format(n=len(disabled),
+                                                                                names=", ".join(disabled)))
+            region_names = [region_name for region_name in region_names if region_name in enabled]
+        if service in probes and len(region_names) > 0:
+            has_resources = self.probe(service, region_names, workers=workers)
+            empty = [region_name for region_name in region_names if not has_resources[region_name]]
+            if len(empty) > 0:
+                print("Skipping {n} regions without any {service} resources".format(n=len(empty), service=service))
+            if snapshot is not None:
+                # an empty region has been listed in full, so anything the last run saw there is gone
+                for region_name in empty:
+                    snapshot.mark_done(region_name)
+            region_names = [region_name for region_name in region_names if has_resources[region_name]]
+        return region_names
+
+
+# off for library callers of the collectors, the cli commands turn it on (--discover)
+_enabled = False
+_discoveries = dict()
+_lock = threading.Lock()
+
+
+def configure(enabled=True):
+    # turn discovery on or off for the process (the --discover/--no-discover cli option) and forget past answers
+    global _enabled
+    _enabled = enabled
+    clear()
+
+
+def clear():
+    # forget the enabled regions and probe results (e.g. before aurora serve's next refresh)
+    with _lock:
+        _discoveries.clear()
+
+
+def get_discovery():
+    # one RegionDiscovery per client pool, since each account has its own regions and resources
+    pool = clients.get_pool()
+    with _lock:
+        discovery = _discoveries.get(pool)
+        if discovery is None:
+            discovery = _discoveries[pool] = RegionDiscovery()
+    return discovery
+
+
+def filter_regions(service, region_names, workers=scan.DEFAULT_WORKERS, snapshot=None):
+    # the regions worth scanning for service, all of region_names when discovery is turned off
+    if not _enabled:
+        return list(region_names)
+    return get_discovery().filter_regions(service, region_names, workers=workers, snapshot=snapshot)
@@ -1,10 +1,10 @@
-import boto3
-import pandas as pd
-import tqdm
 import tools
-import time
 import json
 import click
+from aurora import (checkpoints, clients, discovery, history, offers, options, output, pricing_api_info,
+                    pricing_cache, profiling, scan, snapshots, throttle)
+from aurora.options import (checkpoint_options, client_options, history_options, output_options, pricing_options,
+                            profile_options, scan_options, snapshot_options)
 
 ebs_name_map = {
     'standard': 'Magnetic',
@@ -14,91 +14,239 @@ ebs_name_map = {
     'sc1': 'Cold HDD'
 }
 tags_keys = ['Name', 'Team Owner', 'Team', 'Product Owner', 'Product', 'Creator']
+result_keys = ['id', 'volume_type', 'size_gb', 'region_name', 'region_desc', 'state', 'usd_per_gb', 'usd_per_month',
+               'ec2_instance_id']
+# low cardinality columns held as categorical codes
+categorical_keys = ['volume_type', 'region_name', 'region_desc', 'state']
+# number of instance ids looked up per describe_instances call
+INSTANCE_ID_CHUNK_SIZE = 200
 
-@click.command()
-@click.argument('in_region')
-@click.argument('out_csv')
-def main(in_region, out_csv):
 
-    pricing_region = 'us-east-1'
-    # connect to the pricing client
-    pricing = boto3.client('pricing', region_name=pricing_region)
-    ebs_price_lkup = {}
-    results = []
-
-    expected_region_names = tools.get_all_regions()
-    if in_region == 'all':
-        # process all regions
-        region_names = expected_region_names
-    else:
-        # check that the specified region is valid
-        if in_region not in expected_region_names:
-            raise ValueError("in_region not recognized: {}".format(in_region))
-        else:
-            region_names = [in_region]
-
-    for region_name in region_names:
-        # get the region description
-        region_description = tools.get_region_description(region_name)
+def get_ebs_price(pricing, region_description, ebs_code, cache=None):
+    # USD per GB-month for a volume type in a region (served from the local pricing cache when possible)
+    if cache is None:
+        cache = pricing_cache.get_cache()
+
+    def fetch():
+        store = offers.get_store()
+        if store is not None:
+            usd = store.get_ebs_price(region_description, ebs_name_map[ebs_code])
+            if usd is not None:
+                return usd
+        response = throttle.call('pricing', pricing.get_products, ServiceCode='AmazonEC2', Filters=[
+            {'Type': 'TERM_MATCH', 'Field': 'volumeType', 'Value': ebs_name_map[ebs_code]},
+            {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': region_description}])
+        # None (and not cached) when the region has no price for the volume type, its volumes are left unpriced
+        usd = None
+        for result in response['PriceList']:
+            json_result = json.loads(result)
+            for json_result_level_1 in json_result['terms']['OnDemand'].values():
+                for json_result_level_2 in json_result_level_1['priceDimensions'].values():
+                    for price_value in json_result_level_2['pricePerUnit'].values():
+                        usd = float(price_value)
+        return usd
+
+    return cache.get_or_fetch(cache.make_key('ebs', region_description, ebs_code), fetch)
+
+
+def iter_volumes(ec2):
+    # follow NextToken through every page of describe_volumes
+    paginator = ec2.get_paginator('describe_volumes')
+    for page in paginator.paginate():
+        for volume in page['Volumes']:
+            yield volume
+
+
+def get_instance_tags(ec2, instance_ids, chunk_size=INSTANCE_ID_CHUNK_SIZE):
+    import botocore.exceptions
+    # look up the tags of many instances with a handful of batched describe_instances calls
+    instance_tags = dict()
+    for i in range(0, len(instance_ids), chunk_size):
+        chunk = instance_ids[i:i + chunk_size]
+        try:
+            response = ec2.describe_instances(InstanceIds=chunk)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+                raise
+            # an instance was terminated after its volume was listed, the instance-id filter just skips it
+            response = ec2.describe_instances(Filters=[{'Name': 'instance-id', 'Values': chunk}])
+        for reservation_info in response['Reservations']:
+            for instance in reservation_info['Instances']:
+                instance_tags[instance['InstanceId']] = {x['Key']: x['Value'] for x in instance.get('Tags', [])
+                                                         if x['Key'] in tags_keys}
+
+    return instance_tags
+
+
+def rate_table(ebs_price_lkup):
+    import pandas as pd
+    # volume types without a price (None) get NaN rates
+    return pd.DataFrame(list(ebs_price_lkup.items()), columns=['volume_type', 'rate_usd_per_gb']).astype(
+        {'rate_usd_per_gb': float})
+
+
+def tags_frame(instance_tags):
+    # one row of tags_keys columns per instance id
+    import pandas as pd
+    return pd.DataFrame.from_dict(instance_tags, orient='index').reindex(columns=tags_keys).astype(object)
+
+
+def scan_region(region_name, pricing, progress=True, snapshot=None):
+    import tqdm
+    import numpy as np
+    import pandas as pd
+    # get the region description
+    region_description = tools.get_region_description(region_name)
+
+    # get all of the volumes in this region
+    print("Finding EBS Volumes in Region {desc} ({name})".format(desc=region_description,
+                                                                 name=region_name))
+    ec2 = clients.get_client('ec2', region_name=region_name)
+    # list out all volumes in this region
+    volumes = list(tqdm.tqdm(iter_volumes(ec2), disable=not progress))
+    if len(volumes) == 0:
+        print("No EBS Volumes found in this region.")
+        if snapshot is not None:
+            snapshot.mark_done(region_name)
+        return pd.DataFrame(columns=result_keys)
+
+    # raw resource table, one row per volume
+    volumes_df = pd.DataFrame({'id': [volume['VolumeId'] for volume in volumes],
+                               'volume_type': [volume['VolumeType'] for volume in volumes],
+                               'size_gb': [volume['Size'] for volume in volumes],
+                               'state': [volume['State'] for volume in volumes],
+                               'ec2_instance_id': [volume['Attachments'][0]['InstanceId']
+                                                   if len(volume['Attachments']) > 0 else 'NA'
+                                                   for volume in volumes]})
+    volumes_df['region_name'] = region_name
+    volumes_df['region_desc'] = region_description
+
+    # get associated ec2 info for every attached instance at once
+    instance_ids = sorted(set(volumes_df['ec2_instance_id'].values[(volumes_df['ec2_instance_id'] != 'NA').values]))
+    if len(instance_ids) > 0:
+        print("Getting tags for {n} attached EC2s".format(n=len(instance_ids)))
+    with profiling.stage('ebs.enrichment'):
+        instance_tags = get_instance_tags(ec2, instance_ids)
+    volume_tags_df = tags_frame(instance_tags).reindex(volumes_df['ec2_instance_id']).reset_index(drop=True)
+
+    # volumes that are unchanged since the last run keep their price; the tags reported for a volume are its
+    # instance's, so those are part of the fingerprint (a renamed instance tag shows up as a changed volume)
+    fingerprints = [snapshots.make_fingerprint(volume['VolumeType'], volume['Size'], volume['State'], instance_id,
+                                               [None if pd.isnull(tag) else tag for tag in volume_tags])
+                    for volume, instance_id, volume_tags in zip(volumes, volumes_df['ec2_instance_id'],
+                                                                volume_tags_df.values.tolist())]
+    carried = dict()
+    if snapshot is not None:
+        for row, (volume_id, fingerprint) in enumerate(zip(volumes_df['id'], fingerprints)):
+            previous = snapshot.lookup(volume_id, fingerprint)
+            if previous is not None:
+                carried[row] = previous
+    usd_per_gb = np.full(len(volumes_df), np.nan)
+    for row, previous in carried.items():
+        usd_per_gb[row] = previous['usd_per_gb']
+
+    if len(carried) < len(volumes):
         print("Getting EBS Pricing for Region {desc} ({name})".format(desc=region_description,
                                                                       name=region_name))
-        # initialize a dictionary to hold the pricing info for this region
-        ebs_price_lkup[region_name] = dict()
         # get the pricing info
-        for ebs_code in ebs_name_map:
-            response = pricing.get_products(ServiceCode='AmazonEC2', Filters=[
-                {'Type': 'TERM_MATCH', 'Field': 'volumeType', 'Value': ebs_name_map[ebs_code]},
-                {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': region_description}])
-            for result in response['PriceList']:
-                json_result = json.loads(result)
-                for json_result_level_1 in json_result['terms']['OnDemand'].values():
-                    for json_result_level_2 in json_result_level_1['priceDimensions'].values():
-                        for price_value in json_result_level_2['pricePerUnit'].values():
-                            continue
-            ebs_price_lkup[region_name][ebs_code] = float(price_value)
-
-        # get all of the volumes in this region
-        print("Finding EBS Volumes in Region {desc} ({name})".format(desc=region_description,
-                                                                     name=region_name))
-        ec2 = boto3.resource('ec2', region_name=region_name)
-        # list out all volumes in this region
-        volumes = list(ec2.volumes.all())
-        if len(volumes) > 0:
-            for volume in tqdm.tqdm(volumes):
-                # pause for a beat so print statements and tqdm don't get jumbled
-                time.sleep(0.5)
-                volume_info = dict()
-                volume_info['id'] = volume.id
-                volume_info['volume_type'] = volume.volume_type
-                volume_info['size_gb'] = volume.size
-                volume_info['region_name'] = region_name
-                volume_info['region_desc'] = region_description
-                volume_info['state'] = volume.state
-                volume_info['usd_per_gb'] = ebs_price_lkup[region_name][volume_info['volume_type']]
-                volume_info['usd_per_month'] = volume_info['usd_per_gb'] * volume_info['size_gb']
-                # get associated ec2 info
-                if len(volume.attachments) > 0:
-                    volume_info['ec2_instance_id'] = volume.attachments[0]['InstanceId']
-                    instance = ec2.Instance(id=volume_info['ec2_instance_id'])
-                    if instance.tags is not None:
-                        instance_tags = dict([x.values() for x in instance.tags if list(x.values())[0] in tags_keys])
-                        volume_info.update(instance_tags)
-                else:
-                    volume_info['ec2_instance_id'] = 'NA'
-                results.append(volume_info)
-        else:
-            print("No EBS Volumes found in this region.")
-
-    results_df = pd.DataFrame(results)
-    # results_df = results_df[:]
-    results_df.sort_values(by='usd_per_month', inplace=True, ascending=False)
-    results_df.to_csv(out_csv, index=False)
+        with profiling.stage('ebs.pricing'):
+            rates_df = rate_table(dict((ebs_code, get_ebs_price(pricing, region_description, ebs_code))
+                                       for ebs_code in ebs_name_map))
+        # price every volume at once with a join on volume type (volume types we have no price for stay empty)
+        rates = volumes_df[['volume_type']].merge(rates_df, how='left', on='volume_type')['rate_usd_per_gb'].values
+        usd_per_gb = np.where(np.isnan(usd_per_gb), rates, usd_per_gb)
+    volumes_df['usd_per_gb'] = usd_per_gb
+    volumes_df['usd_per_month'] = volumes_df['usd_per_gb'] * volumes_df['size_gb']
 
-if __name__ == '__main__':
-    main()
+    # like the instance listing, only report the tags some attached instance actually has
+    volume_tags_df = volume_tags_df.dropna(axis='columns', how='all')
+    volumes_df = pd.concat([volumes_df.reindex(columns=result_keys), volume_tags_df], axis='columns')
 
+    if snapshot is not None:
+        for volume_info, fingerprint in zip(volumes_df.to_dict('records'), fingerprints):
+            snapshot.add(region_name, volume_info['id'], fingerprint, volume_info)
+        snapshot.mark_done(region_name)
 
+    return output.categorize(volumes_df, categorical_keys)
 
 
+def iter_region_results(region_names, workers=scan.DEFAULT_WORKERS, snapshot=None, checkpoint=None):
+    region_names = discovery.filter_regions('ebs', region_names, workers=workers, snapshot=snapshot)
+    pricing_region = 'us-east-1'
+    # connect to the pricing client
+    pricing = clients.get_client('pricing', region_name=pricing_region)
+    pricing_api_info.check_filter_values('AmazonEC2', 'volumeType', list(ebs_name_map.values()))
+
+    # the volume listing progress bars only make sense when regions are processed one at a time
+    region_scan = scan.RegionScan(lambda region_name: scan_region(region_name, pricing, progress=workers <= 1,
+                                                                  snapshot=snapshot),
+                                  region_names, workers=workers, checkpoint=checkpoint)
+    for region_name, region_df in region_scan:
+        yield region_name, region_df
+    region_scan.report()
+
 
+def collect(region_names, workers=scan.DEFAULT_WORKERS, snapshot=None, checkpoint=None):
+    frames = []
+    with profiling.stage('ebs.regions'):
+        for region_name, region_df in iter_region_results(region_names, workers=workers, snapshot=snapshot,
+                                                          checkpoint=checkpoint):
+            if len(region_df) > 0:
+                frames.append(region_df)
+
+    results_df = output.concat_frames(frames, columns=result_keys + [k for k in tags_keys if any(
+        k in frame.columns for frame in frames)])
+    results_df.sort_values(by='usd_per_month', inplace=True, ascending=False)
+    return results_df
 
+
+@click.command()
+@click.argument('in_region')
+@click.argument('out_csv')
+@click.option('--sort/--no-sort', default=True, show_default=True,
+              help='Sort the finished csv by usd_per_month, most expensive first (in chunks on disk, so memory use '
+                   'stays flat).')
+@output_options
+@snapshot_options
+@pricing_options
+@scan_options
+@client_options
+@profile_options
+@checkpoint_options
+@history_options
+def main(in_region, out_csv, sort=True, fmt='csv', incremental=False, diff_report=None, refresh_prices=False,
+         price_ttl=pricing_cache.DEFAULT_TTL_DAYS, workers=scan.DEFAULT_WORKERS,
+         max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS, max_attempts=clients.DEFAULT_MAX_ATTEMPTS,
+         profile=False, profile_json=None, resume=None, record_history=True,
+         discover=True):
+
+    region_names = tools.resolve_regions(in_region)
+
+    options.configure(price_ttl=price_ttl, refresh_prices=refresh_prices, max_pool_connections=max_pool_connections,
+                      max_attempts=max_attempts, discover=discover, profile=profile, profile_json=profile_json)
+    snapshot = snapshots.Snapshot('ebs', incremental=incremental)
+    run = checkpoints.start(resume)
+
+    # write each region's volumes as soon as that region is done, so only one region is held in memory at a time
+    writer = output.open_writer(out_csv, fmt, columns=result_keys + tags_keys)
+    if record_history:
+        writer = history.recorder(run, 'ebs', writer=writer)
+    with profiling.stage('ebs.regions'):
+        for region_name, region_df in iter_region_results(region_names, workers=workers, snapshot=snapshot,
+                                                          checkpoint=run.checkpoint('ebs')):
+            if len(region_df) > 0:
+                with profiling.stage('ebs.output'):
+                    writer.write(region_df, region_name)
+    writer.close()
+    if fmt != 'parquet' and sort:
+        with profiling.stage('ebs.output'):
+            # only keep the tag columns some attached instance actually has; sorted as text, so the 'NA' of
+            # unattached volumes (and tags like 'None') aren't turned into empty values
+            output.sort_csv(out_csv, 'usd_per_month', ascending=False, drop_empty=tags_keys)
+    throttle.report()
+    snapshots.finish([snapshot], diff_report=diff_report)
+    profiling.report(json_path=profile_json)
+    run.finish()
+
+if __name__ == '__main__':
+    main()
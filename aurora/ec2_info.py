@@ -1,81 +1,225 @@
-import boto3
-import pandas as pd
-import tqdm
 import tools
-import time
 import click
+from aurora import (checkpoints, clients, discovery, history, options, output, pricing_cache, profiling, scan,
+                    snapshots, throttle)
+from aurora.options import (checkpoint_options, client_options, history_options, output_options, pricing_options,
+                            profile_options, scan_options, snapshot_options)
 
 keys = ['InstanceType',  'State', 'InstanceId', 'KeyName', 'LaunchTime', 'Placement', 'Platform','StateTransitionReason', 'SubnetId', 'VpcId', 'Architecture', 'Tags']
 tags_keys = ['Name', 'Team Owner', 'Team', 'Product Owner', 'Product', 'Creator']
 sorted_keys = tags_keys + ['usd_per_hr', 'usd_per_month'] + keys
+# low cardinality columns held as categorical codes
+categorical_keys = ['InstanceType', 'Platform', 'region_name']
+
+
+# describe_instances accepts between 5 and 1000 results per page
+DEFAULT_MAX_RESULTS = 1000
+
+
+def iter_instance_pages(ec2, max_results=DEFAULT_MAX_RESULTS):
+    # follow NextToken through every page of describe_instances, one page in memory at a time
+    paginator = ec2.get_paginator('describe_instances')
+    for page in paginator.paginate(PaginationConfig={'PageSize': max_results}):
+        instances = [instance for reservation_info in page['Reservations']
+                     for instance in reservation_info['Instances']]
+        if len(instances) > 0:
+            yield instances
+
+
+def instances_frame(instances, region_name):
+    # raw resource table for a page of describe_instances results, one row per instance
+    import pandas as pd
+    # nested structures go straight to json text so the table doesn't keep every page's dicts alive
+    instances_df = pd.DataFrame([[output.json_text(instance.get(k, '')) for k in keys] for instance in instances],
+                                columns=keys)
+    # pull the tags we report on out of the long (instance, key, value) list in one go
+    tags_df = pd.DataFrame([(i, tag['Key'], tag['Value']) for i, instance in enumerate(instances)
+                            for tag in instance.get('Tags', [])], columns=['row', 'Key', 'Value'])
+    tags_df = tags_df[tags_df['Key'].isin(tags_keys)].drop_duplicates(subset=['row', 'Key'], keep='last')
+    instances_df = instances_df.join(tags_df.pivot(index='row', columns='Key', values='Value').reindex(
+        columns=tags_keys))
+    instances_df['Platform'] = instances_df['Platform'].replace('', 'Linux')
+    # not written to the ec2_info csv, but needed to combine it with other services
+    instances_df['region_name'] = region_name
+    return instances_df
+
+
+def rate_table(price_index):
+    import pandas as pd
+    return pd.DataFrame([(instance_type, platform, float(usd)) for (instance_type, platform), usd in
+                         price_index.items()], columns=['InstanceType', 'Platform', 'rate_usd_per_hr'])
+
+
+def price_instances(instances_df, rates_df, region_name, region_description):
+    # fill in usd_per_hr for every instance that doesn't have one yet with a join against the region's rate table
+    import numpy as np
+    unpriced = instances_df['usd_per_hr'].isnull().values
+    if unpriced.any():
+        lookup_df = instances_df.loc[unpriced, ['InstanceType', 'Platform']]
+        # the EC2 api reports Platform as lower case (e.g. 'windows') while the Pricing API capitalizes it
+        lookup_df = lookup_df.assign(PricingPlatform=lookup_df['Platform'].str.capitalize())
+        rates = lookup_df.merge(rates_df, how='left', on=['InstanceType', 'Platform'])['rate_usd_per_hr'].values
+        capitalized = lookup_df.merge(rates_df.rename(columns={'Platform': 'PricingPlatform'}), how='left',
+                                      on=['InstanceType', 'PricingPlatform'])['rate_usd_per_hr'].values
+        rates = np.where(np.isnan(rates), capitalized, rates)
+        missing = np.isnan(rates)
+        if missing.any():
+            # not in the regional index, fall back to asking for each of these instance types directly
+            missing_rows = np.flatnonzero(missing)
+            for (instance_type, platform), rows in lookup_df[missing].groupby(['InstanceType',
+                                                                               'Platform']).indices.items():
+                with profiling.stage('ec2.pricing'):
+                    price = tools.get_price(region_name=region_name,
+                                            instance_type=instance_type,
+                                            platform=platform,
+                                            region_description=region_description)
+                rates[missing_rows[rows]] = float(price)
+        instances_df.loc[unpriced, 'usd_per_hr'] = rates
+    instances_df['usd_per_hr'] = instances_df['usd_per_hr'].astype(float)
+    instances_df['usd_per_month'] = instances_df['usd_per_hr'] * 24 * 30
+    return instances_df
+
+
+def instance_fingerprint(instance):
+    tags = dict((tag['Key'], tag['Value']) for tag in instance.get('Tags', []) if tag['Key'] in tags_keys)
+    return snapshots.make_fingerprint(instance['InstanceType'], instance.get('State', {}).get('Name'),
+                                      instance.get('Platform') or 'Linux', tags)
+
+
+def scan_region(region_name, max_results=DEFAULT_MAX_RESULTS, progress=True, snapshot=None):
+    import tqdm
+    # get the region name (needed later for pricing)
+    region_description = tools.get_region_description(region_name=region_name)
+    print("Finding EC2s in Region {region_description} ({region_name})".format(region_description=region_description,
+                                                                               region_name=region_name))
+    # create ec2 client for this region
+    ec2 = clients.get_client('ec2',
+                             region_name=region_name)
+    # get info on all of the EC2s, yielding a priced table for each page as it comes in
+    found = False
+    rates_df = None
+    with tqdm.tqdm(disable=not progress) as progress_bar:
+        for instances in iter_instance_pages(ec2, max_results=max_results):
+            found = True
+            progress_bar.update(len(instances))
+            instances_df = instances_frame(instances, region_name)
+            instances_df['usd_per_hr'] = float('nan')
+            if snapshot is not None:
+                fingerprints = [instance_fingerprint(instance) for instance in instances]
+                for row, (instance, fingerprint) in enumerate(zip(instances, fingerprints)):
+                    previous = snapshot.lookup(instance['InstanceId'], fingerprint)
+                    if previous is not None:
+                        # unchanged since the last run, so its price is too
+                        instances_df.at[row, 'usd_per_hr'] = previous['usd_per_hr']
+            if rates_df is None and instances_df['usd_per_hr'].isnull().any():
+                # only fetch pricing for regions that actually have (new or changed) EC2s
+                print("Getting EC2 Pricing")
+                with profiling.stage('ec2.pricing'):
+                    rates_df = rate_table(tools.get_price_index(region_description=region_description))
+                print("Getting EC2 Information")
+            instances_df = price_instances(instances_df, rates_df, region_name, region_description)
+            if snapshot is not None:
+                for instance_summary, fingerprint in zip(instances_df.to_dict('records'), fingerprints):
+                    snapshot.add(region_name, instance_summary['InstanceId'], fingerprint, instance_summary)
+            yield output.categorize(instances_df, categorical_keys)
+
+    if not found:
+        print("No EC2s found in this region.")
+    if snapshot is not None:
+        snapshot.mark_done(region_name)
+
+
+def iter_frames(region_names, max_results=DEFAULT_MAX_RESULTS, workers=scan.DEFAULT_WORKERS, snapshot=None,
+                checkpoint=None):
+    region_names = discovery.filter_regions('ec2', region_names, workers=workers, snapshot=snapshot)
+    # the per-instance progress bars only make sense when regions are processed one at a time
+    region_scan = scan.RegionScan(lambda region_name: scan_region(region_name,
+                                                                  max_results=max_results,
+                                                                  progress=workers <= 1,
+                                                                  snapshot=snapshot),
+                                  region_names, workers=workers, checkpoint=checkpoint)
+    for region_name, instance_frames in region_scan:
+        for instances_df in instance_frames:
+            yield region_name, instances_df
+    region_scan.report()
+
+
+def collect(region_names, max_results=DEFAULT_MAX_RESULTS, workers=scan.DEFAULT_WORKERS, snapshot=None,
+            checkpoint=None):
+    # the whole inventory as a DataFrame, for callers that want everything in memory anyway
+    frames = [instances_df for _, instances_df in iter_frames(region_names, max_results=max_results,
+                                                              workers=workers, snapshot=snapshot,
+                                                              checkpoint=checkpoint)]
+    results_df = output.concat_frames(frames, columns=sorted_keys + ['region_name'])
+    results_df.sort_values(by='usd_per_month', inplace=True)
+    return results_df
+
+
+def write_frames(region_names, writer, max_results=DEFAULT_MAX_RESULTS, workers=scan.DEFAULT_WORKERS,
+                 chunk_size=output.DEFAULT_ROW_GROUP_SIZE, snapshot=None, checkpoint=None):
+    # pages arrive grouped by region, so flush each region (or each chunk_size rows of it) in one write; a region is
+    # only handed over once all of its pages are in (see scan.RegionScan), so memory peaks at the largest region
+    chunk = []
+    chunk_rows = 0
+    for region_name, instances_df in iter_frames(region_names, max_results=max_results, workers=workers,
+                                                 snapshot=snapshot, checkpoint=checkpoint):
+        if chunk_rows > 0 and (chunk_rows >= chunk_size or chunk[-1][0] != region_name):
+            writer.write(output.concat_frames([frame for _, frame in chunk]), chunk[-1][0])
+            chunk = []
+            chunk_rows = 0
+        chunk.append((region_name, instances_df))
+        chunk_rows += len(instances_df)
+    if chunk_rows > 0:
+        writer.write(output.concat_frames([frame for _, frame in chunk]), chunk[-1][0])
+    writer.close()
 
 
 @click.command()
 @click.argument('in_region')
 @click.argument('out_csv')
-def main(in_region, out_csv):
+@click.option('--max-results', type=click.IntRange(5, 1000), default=DEFAULT_MAX_RESULTS, show_default=True,
+              help='Page size for describe_instances.')
+@click.option('--sort/--no-sort', default=True, show_default=True,
+              help='Sort the finished csv by usd_per_month (in chunks on disk, so memory use stays flat).')
+@output_options
+@snapshot_options
+@pricing_options
+@scan_options
+@client_options
+@profile_options
+@checkpoint_options
+@history_options
+def main(in_region, out_csv, max_results=DEFAULT_MAX_RESULTS, sort=True, fmt='csv', incremental=False,
+         diff_report=None, refresh_prices=False, price_ttl=pricing_cache.DEFAULT_TTL_DAYS,
+         workers=scan.DEFAULT_WORKERS, max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS,
+         max_attempts=clients.DEFAULT_MAX_ATTEMPTS, profile=False, profile_json=None, resume=None,
+         record_history=True, discover=True):
+
+    region_names = tools.resolve_regions(in_region)
 
-    expected_region_names = tools.get_all_regions()
-    if in_region == 'all':
-        # process all regions
-        region_names = expected_region_names
+    options.configure(price_ttl=price_ttl, refresh_prices=refresh_prices, max_pool_connections=max_pool_connections,
+                      max_attempts=max_attempts, discover=discover, profile=profile, profile_json=profile_json)
+    snapshot = snapshots.Snapshot('ec2', incremental=incremental)
+    run = checkpoints.start(resume)
+
+    if fmt == 'parquet':
+        # columnar output is left unsorted, query engines sort on read
+        writer = output.open_writer(out_csv, 'parquet', columns=sorted_keys + ['region_name'])
     else:
-        # check that the specified region is valid
-        if in_region not in expected_region_names:
-            raise ValueError("in_region not recognized: {}".format(in_region))
-        else:
-            region_names = [in_region]
-
-    results = []
-    for region_name in region_names:
-        # get the region name (needed later for pricing)
-        region_description = tools.get_region_description(region_name=region_name)
-        print("Finding EC2s in Region {region_description} ({region_name})".format(region_description=region_description,
-                                                                                   region_name=region_name))
-        # create ec2 client for this region
-        ec2 = boto3.client('ec2',
-                           region_name=region_name)
-        # get info on all of the EC2s
-        instance_info = ec2.describe_instances()
-        if len(instance_info['Reservations']) > 0:
-            print("Getting EC2 Information")
-            # pause for a beat so print statements and tqdm don't get jumbled
-            time.sleep(0.5)
-            # loop over EC2s and parse out the info needed
-            instances = []
-            for reservation_info in instance_info['Reservations']:
-                instances.extend(reservation_info['Instances'])
-            for instance in tqdm.tqdm(instances):
-                instance_summary = {k: '' for k in keys}
-                if 'Tags' in instance.keys():
-                    tags = dict([x.values() for x in instance['Tags'] if list(x.values())[0] in tags_keys])
-                else:
-                    tags = dict()
-                instance_summary.update(tags)
-                for k in keys:
-                    if k in instance.keys():
-                        instance_summary[k] = instance[k]
-                # get pricing info
-                instance_type = instance_summary['InstanceType']
-                if instance_summary['Platform'] == '':
-                    instance_summary['Platform'] = 'Linux'
-                platform = instance_summary['Platform']
-                # Get current price for a given instance, region and os
-                price = tools.get_price(region_name=region_name,
-                                        instance_type=instance_type,
-                                        platform=platform,
-                                        region_description=region_description)
-                instance_summary['usd_per_hr'] = float(price)
-                instance_summary['usd_per_month'] = float(price) * 24 * 30
-                results.append(instance_summary)
-        else:
-            print("No EC2s found in this region.")
-
-    results_df = pd.DataFrame(results)
-    results_df = results_df[sorted_keys]
-    results_df.sort_values(by='usd_per_month', inplace=True)
-    results_df.to_csv(out_csv, index=False)
+        # write each page out as it arrives rather than holding the whole fleet in memory
+        writer = output.open_writer(out_csv, 'csv', columns=sorted_keys)
+    if record_history:
+        writer = history.recorder(run, 'ec2', writer=writer)
+    with profiling.stage('ec2.regions'):
+        write_frames(region_names, writer, max_results=max_results, workers=workers, snapshot=snapshot,
+                     checkpoint=run.checkpoint('ec2'))
+    if fmt != 'parquet' and sort:
+        with profiling.stage('ec2.output'):
+            output.sort_csv(out_csv, 'usd_per_month')
+    throttle.report()
+    snapshots.finish([snapshot], diff_report=diff_report)
+    profiling.report(json_path=profile_json)
+    run.finish()
 
 if __name__ == '__main__':
     main()
-
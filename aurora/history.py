@@ -0,0 +1,242 @@
+import os
+import time
+from aurora import pricing_cache, store
+
+DEFAULT_HISTORY_PATH = os.path.join(pricing_cache.DEFAULT_CACHE_DIR, 'history.sqlite')
+# how each service's columns map onto the cost history (and the combined cost report)
+report_columns = {
+    'ec2': {'InstanceId': 'resource_id', 'InstanceType': 'resource_type'},
+    'ebs': {'id': 'resource_id', 'volume_type': 'resource_type'},
+    's3': {'bucket_name': 'resource_id', 'volume_type': 'resource_type'},
+}
+# the report's tag columns (ec2_info.tags_keys) under names that don't need quoting
+tag_columns = ['name', 'team_owner', 'team', 'product_owner', 'product', 'creator']
+resource_keys = ['account_id', 'service', 'resource_id', 'resource_type', 'region_name', 'usd_per_month'] + tag_columns
+group_keys = ['service', 'account_id', 'region_name', 'resource_type'] + tag_columns
+# time buckets, as expressions over the run_date column
+BUCKETS = {
+    'run': 'run_id',
+    'day': 'run_date',
+    'week': "date(run_date, 'weekday 0', '-6 days')",
+    'month': 'substr(run_date, 1, 7)',
+}
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT NOT NULL,
+    service TEXT NOT NULL,
+    run_at REAL NOT NULL,
+    run_date TEXT NOT NULL,
+    resources INTEGER NOT NULL,
+    usd_per_month REAL,
+    PRIMARY KEY (run_id, service)
+);
+CREATE INDEX IF NOT EXISTS runs_run_date ON runs (run_date);
+CREATE TABLE IF NOT EXISTS costs (
+    run_id TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    account_id TEXT,
+    service TEXT NOT NULL,
+    resource_id TEXT,
+    resource_type TEXT,
+    region_name TEXT,
+    usd_per_month REAL,
+    name TEXT,
+    team_owner TEXT,
+    team TEXT,
+    product_owner TEXT,
+    product TEXT,
+    creator TEXT
+);
+CREATE INDEX IF NOT EXISTS costs_run ON costs (run_id, service);
+CREATE INDEX IF NOT EXISTS costs_run_date ON costs (run_date);
+CREATE INDEX IF NOT EXISTS costs_service ON costs (service, run_date);
+CREATE INDEX IF NOT EXISTS costs_region_name ON costs (region_name, run_date);
+CREATE INDEX IF NOT EXISTS costs_account_id ON costs (account_id, run_date);
+"""
+SCHEMA += ''.join('CREATE INDEX IF NOT EXISTS costs_{key} ON costs ({key}, run_date);\n'.format(key=key)
+                  for key in tag_columns)
+
+
+def make_run_date(run_at):
+    # runs are bucketed by their UTC date
+    return time.strftime('%Y-%m-%d', time.gmtime(run_at))
+
+
+def history_frame(service, results_df):
+    # a collector's results in the history's columns, with None for anything missing
+    from aurora.ec2_info import tags_keys
+    frame = results_df.rename(columns=report_columns[service])
+    frame = frame.rename(columns=dict(zip(tags_keys, tag_columns)))
+    frame = frame.reindex(columns=resource_keys)
+    frame['service'] = service
+    frame = frame.astype(object)
+    return frame.where(frame.notnull(), None)
+
+
+class HistoryStore(store.SQLiteStore):
+    """
+    Append-only SQLite file of the costs of every resource seen by every run, one row per (run, resource).
+
+    A run's rows only count once its entry in the runs table is written (see Recorder), so an interrupted run
+    never shows up half-recorded. Queries group and time-bucket in SQL, so the history is never loaded into
+    memory as a whole.
+    """
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        super(HistoryStore, self).__init__(path)
+
+    def begin(self, run_id, service):
+        # forget whatever an earlier attempt at this run (see --resume) recorded for the service
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM runs WHERE run_id = ? AND service = ?', (run_id, service))
+            conn.execute('DELETE FROM costs WHERE run_id = ? AND service = ?', (run_id, service))
+            conn.commit()
+
+    def add(self, run_id, run_date, rows):
+        # rows of resource_keys values
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(rows), BATCH_SIZE):
+                conn.executemany('INSERT INTO costs (run_id, run_date, {}) VALUES (?, ?, {})'.format(
+                    ', '.join(resource_keys), ', '.join(['?'] * len(resource_keys))),
+                    [(run_id, run_date) + tuple(row) for row in rows[i:i + BATCH_SIZE]])
+            conn.commit()
+
+    def finish(self, run_id, service, run_at, resources, usd_per_month):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+                         (run_id, service, run_at, make_run_date(run_at), resources, usd_per_month))
+            conn.commit()
+
+    def record(self, run_id, service, results_df, run_at=None):
+        # record an already collected DataFrame in one go
+        recorder = Recorder(self, run_id, service, run_at=run_at)
+        recorder.write(results_df)
+        recorder.close()
+
+    def query(self, by=(), bucket='day', days=None, where=None):
+        """
+        Monthly cost per time bucket and group, e.g. by=['team'], bucket='week', where={'service': ['ebs']}.
+
+        Each run is a snapshot of the monthly cost at the time, so a bucket holding several runs of a service gets
+        their average rather than their sum. where maps a group key to the values to keep; days keeps the runs of
+        the last n days.
+        """
+        import pandas as pd
+        by = list(by)
+        where = dict(where or dict())
+        unknown = [key for key in by + list(where) if key not in group_keys]
+        if len(unknown) > 0:
+            raise ValueError("unknown column {} (choose from {})".format(", ".join(unknown), ", ".join(group_keys)))
+        if bucket not in BUCKETS:
+            raise ValueError("unknown bucket {} (choose from {})".format(bucket, ", ".join(BUCKETS)))
+
+        run_filters = []
+        run_params = []
+        if days is not None:
+            run_filters.append("run_date >= date('now', ?)")
+            run_params.append('-{:d} days'.format(days))
+        if 'service' in where:
+            run_filters.append('service IN ({})'.format(', '.join(['?'] * len(where['service']))))
+            run_params.extend(where['service'])
+        cost_filters = list(run_filters)
+        cost_params = list(run_params)
+        for key, values in where.items():
+            if key != 'service':
+                cost_filters.append('{} IN ({})'.format(key, ', '.join(['?'] * len(values))))
+                cost_params.extend(values)
+
+        def where_clause(filters):
+            return 'WHERE ' + ' AND '.join(filters) if len(filters) > 0 else ''
+
+        group_by = ''.join(', {}'.format(key) for key in by)
+        # cost of each group in each run, then averaged over the runs of the service in the bucket
+        sql = """
+            WITH bucket_runs AS (
+                SELECT {bucket} AS bucket, service, COUNT(*) AS n_runs FROM runs {run_where} GROUP BY 1, 2
+            ), run_costs AS (
+                SELECT {bucket} AS bucket, run_id, service{group_by}, SUM(costs.usd_per_month) AS usd_per_month,
+                       COUNT(*) AS resources
+                FROM costs JOIN runs USING (run_id, service, run_date) {cost_where}
+                GROUP BY bucket, run_id, service{group_by}
+            )
+            SELECT bucket{group_by}, SUM(usd_per_month / n_runs) AS usd_per_month,
+                   SUM(resources * 1.0 / n_runs) AS resources
+            FROM run_costs JOIN bucket_runs USING (bucket, service)
+            GROUP BY bucket{group_by}
+            ORDER BY bucket, usd_per_month DESC
+        """.format(bucket=BUCKETS[bucket], group_by=group_by, run_where=where_clause(run_filters),
+                   cost_where=where_clause(cost_filters))
+        with self._lock:
+            return pd.read_sql_query(sql, self._connect(), params=run_params + cost_params).rename(
+                columns={'bucket': bucket})
+
+
+class Recorder(object):
+    """
+    Records one service's results of a run in the history, optionally passing every chunk on to another writer.
+
+    It has the same write()/close() interface as the writers in aurora.output, so a streaming collector can record
+    its results as it writes them out. When recording a checkpointed run (see aurora.checkpoints), close() leaves the
+    run out of the history if any of its units failed; resuming the run records it again from the start.
+    """
+
+    def __init__(self, store, run_id, service, run_at=None, writer=None, run=None):
+        self.store = store
+        self.run_id = run_id
+        self.service = service
+        self.run_at = run_at if run_at is not None else time.time()
+        self.writer = writer
+        self.run = run
+        self.resources = 0
+        self.usd_per_month = 0.0
+        self.store.begin(run_id, service)
+
+    def write(self, results_df, region_name=None):
+        frame = history_frame(self.service, results_df)
+        if region_name is not None:
+            frame['region_name'] = frame['region_name'].fillna(region_name)
+        self.store.add(self.run_id, make_run_date(self.run_at), list(frame.itertuples(index=False, name=None)))
+        self.resources += len(frame)
+        self.usd_per_month += float(results_df['usd_per_month'].sum()) if len(results_df) > 0 else 0.0
+        if self.writer is not None:
+            self.writer.write(results_df, region_name)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.run is not None and len(self.run.failed()) > 0:
+            # the rows written so far never count without the runs entry
+            print("Leaving {service} out of the cost history until run {run_id} finishes without failures".format(
+                service=self.service, run_id=self.run_id))
+            return
+        self.store.finish(self.run_id, self.service, self.run_at, self.resources, self.usd_per_month)
+
+
+_default_store = store.DefaultStore(HistoryStore)
+
+
+def configure(path=DEFAULT_HISTORY_PATH):
+    return _default_store.configure(path=path)
+
+
+def get_store():
+    return _default_store.get()
+
+
+def recorder(run, service, writer=None):
+    # a Recorder for one service of a collector's run (see aurora.checkpoints), dated when the run first started
+    return Recorder(get_store(), run.run_id, service, run_at=run.manifest['created'], writer=writer, run=run)
+
+
+def record(run, service, results_df):
+    # record an already collected DataFrame for one service of a run
+    service_recorder = recorder(run, service)
+    service_recorder.write(results_df)
+    service_recorder.close()
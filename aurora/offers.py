@@ -0,0 +1,238 @@
+import os
+import csv
+from aurora import pricing_cache, store
+
+# prices imported from the AWS bulk price list offer files (see `aurora prices import`)
+DEFAULT_OFFERS_PATH = os.path.join(pricing_cache.DEFAULT_CACHE_DIR, 'offers.sqlite')
+# rows inserted per executemany while importing
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ec2_prices (
+    location TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    operating_system TEXT NOT NULL,
+    usd TEXT NOT NULL,
+    PRIMARY KEY (location, instance_type, operating_system)
+);
+CREATE TABLE IF NOT EXISTS ebs_prices (
+    location TEXT NOT NULL,
+    volume_type TEXT NOT NULL,
+    usd REAL NOT NULL,
+    PRIMARY KEY (location, volume_type)
+);
+CREATE TABLE IF NOT EXISTS s3_tiers (
+    location TEXT NOT NULL,
+    volume_type TEXT NOT NULL,
+    begin_range REAL NOT NULL,
+    end_range REAL NOT NULL,
+    usd REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS s3_tiers_key ON s3_tiers (location, volume_type);
+"""
+
+# offer file csv columns -> the attribute names used by the json offer files and the Pricing API
+csv_attributes = {'serviceCode': 'servicecode',
+                  'Product Family': 'productFamily',
+                  'Location': 'location',
+                  'Instance Type': 'instanceType',
+                  'Operating System': 'operatingSystem',
+                  'Tenancy': 'tenancy',
+                  'Pre Installed S/W': 'preInstalledSw',
+                  'Capacity Status': 'capacitystatus',
+                  'Volume Type': 'volumeType'}
+
+
+def classify(attributes):
+    """
+    Which table (if any) a product's prices belong in, and its key there.
+
+    Only keeps the products the collectors would have asked the Pricing API for: shared tenancy on-demand instances
+    with no pre-installed software, EBS storage by volume type and S3 storage by storage class.
+    """
+    service_code = attributes.get('servicecode')
+    family = attributes.get('productFamily')
+    location = attributes.get('location')
+    if not location:
+        return None
+    if service_code == 'AmazonEC2' and attributes.get('instanceType'):
+        if attributes.get('tenancy', '').lower() != 'shared' or attributes.get('preInstalledSw', 'NA') != 'NA':
+            return None
+        if attributes.get('capacitystatus', 'Used') != 'Used':
+            # capacity reservation line items
+            return None
+        return 'ec2', (location, attributes['instanceType'], attributes.get('operatingSystem', ''))
+    if family == 'Storage' and attributes.get('volumeType'):
+        if service_code == 'AmazonEC2':
+            return 'ebs', (location, attributes['volumeType'])
+        if service_code == 'AmazonS3':
+            return 's3', (location, attributes['volumeType'])
+    return None
+
+
+class OfferImporter(object):
+    """Accumulates on-demand price dimensions from an offer file and writes them to an OfferStore."""
+
+    def __init__(self, store):
+        self.store = store
+        self.ec2 = dict()
+        self.ebs = dict()
+        self.s3 = dict()
+        self.rows = 0
+
+    def add(self, kind, key, sku, begin_range, end_range, usd):
+        self.rows += 1
+        if kind == 'ec2':
+            # like tools.get_price_dims, keep the first price unless it is $0 and another one comes along
+            if key not in self.ec2 or float(self.ec2[key]) == 0:
+                self.ec2[key] = usd
+        elif kind == 'ebs':
+            if key not in self.ebs or self.ebs[key] == 0:
+                self.ebs[key] = float(usd)
+        else:
+            # like get_s3_price_tiers, the tiers all come from the first product listed for the storage class
+            tiers = self.s3.setdefault(key, (sku, []))
+            if tiers[0] == sku:
+                tiers[1].append((float(begin_range), float(end_range), float(usd)))
+
+    def read_csv(self, f):
+        reader = csv.reader(f)
+        # the offer csv starts with a few lines of metadata before the header
+        for header in reader:
+            if len(header) > 0 and header[0] == 'SKU':
+                break
+        else:
+            raise ValueError("not an AWS offer csv (no SKU header row)")
+        columns = dict((name, i) for i, name in enumerate(header))
+        attribute_columns = [(columns[name], attribute) for name, attribute in csv_attributes.items()
+                             if name in columns]
+        sku, term_type, price = columns['SKU'], columns['TermType'], columns['PricePerUnit']
+        begin_range, end_range = columns.get('StartingRange'), columns.get('EndingRange')
+        for row in reader:
+            if row[term_type] != 'OnDemand':
+                continue
+            classified = classify(dict((attribute, row[i]) for i, attribute in attribute_columns))
+            if classified is None:
+                continue
+            self.add(classified[0], classified[1], row[sku],
+                     row[begin_range] if begin_range is not None and row[begin_range] != '' else 0,
+                     row[end_range] if end_range is not None and row[end_range] != '' else 'Inf',
+                     row[price])
+
+    def read_json(self, path):
+        try:
+            import ijson
+        except ImportError:
+            raise ImportError("importing a json offer file requires ijson (pip install ijson), "
+                              "or import the csv version of the offer file instead")
+        # two streaming passes: the products we care about, then their on-demand terms
+        products = dict()
+        with open(path, 'rb') as f:
+            for sku, product in ijson.kvitems(f, 'products'):
+                attributes = dict(product.get('attributes', {}))
+                attributes['productFamily'] = product.get('productFamily')
+                classified = classify(attributes)
+                if classified is not None:
+                    products[sku] = classified
+        with open(path, 'rb') as f:
+            for sku, offer_terms in ijson.kvitems(f, 'terms.OnDemand'):
+                if sku not in products:
+                    continue
+                kind, key = products[sku]
+                for offer_term in offer_terms.values():
+                    for price_dim in offer_term['priceDimensions'].values():
+                        self.add(kind, key, sku, price_dim.get('beginRange', 0), price_dim.get('endRange', 'Inf'),
+                                 str(price_dim['pricePerUnit']['USD']))
+
+    def read(self, path):
+        if path.lower().endswith('.json'):
+            self.read_json(path)
+        else:
+            with open(path, 'r', newline='') as f:
+                self.read_csv(f)
+
+    def save(self):
+        s3_rows = [key + tier for key, (_, tiers) in self.s3.items() for tier in tiers]
+        self.store.replace('ec2_prices', [key + (usd,) for key, usd in self.ec2.items()])
+        self.store.replace('ebs_prices', [key + (usd,) for key, usd in self.ebs.items()])
+        self.store.replace('s3_tiers', s3_rows, delete_keys=list(self.s3))
+        return {'ec2': len(self.ec2), 'ebs': len(self.ebs), 's3': len(s3_rows)}
+
+
+class OfferStore(store.SQLiteStore):
+    """
+    SQLite file of the prices extracted from AWS offer files, indexed by the same keys the collectors look up.
+
+    A lookup that finds nothing returns None so the caller can fall back to the Pricing API.
+    """
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path=DEFAULT_OFFERS_PATH):
+        super(OfferStore, self).__init__(path)
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def replace(self, table, rows, delete_keys=None):
+        # overwrite the rows for every key being imported, leaving everything else (e.g. other offer files) alone
+        with self._lock:
+            conn = self._connect()
+            if delete_keys is not None:
+                conn.executemany('DELETE FROM {} WHERE location = ? AND volume_type = ?'.format(table), delete_keys)
+            placeholders = ', '.join(['?'] * (len(rows[0]) if len(rows) > 0 else 1))
+            for i in range(0, len(rows), BATCH_SIZE):
+                conn.executemany('INSERT OR REPLACE INTO {} VALUES ({})'.format(table, placeholders),
+                                 rows[i:i + BATCH_SIZE])
+            conn.commit()
+
+    def get_ec2_price(self, location, instance_type, operating_system):
+        rows = self._query('SELECT usd FROM ec2_prices WHERE location = ? AND instance_type = ? AND '
+                           'operating_system = ?', (location, instance_type, operating_system))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_ec2_index(self, location):
+        # {(instance_type, operating_system): usd}, the same shape as tools.build_price_index
+        rows = self._query('SELECT instance_type, operating_system, usd FROM ec2_prices WHERE location = ?',
+                           (location,))
+        if len(rows) == 0:
+            return None
+        return dict(((instance_type, operating_system), usd) for instance_type, operating_system, usd in rows)
+
+    def get_ebs_price(self, location, volume_type):
+        rows = self._query('SELECT usd FROM ebs_prices WHERE location = ? AND volume_type = ?',
+                           (location, volume_type))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_s3_tiers(self, location, volume_type):
+        rows = self._query('SELECT begin_range, end_range, usd FROM s3_tiers WHERE location = ? AND volume_type = ? '
+                           'ORDER BY begin_range', (location, volume_type))
+        if len(rows) == 0:
+            return None
+        return [{'min_bytes': begin_range, 'max_bytes': end_range, 'price_per_gb': usd}
+                for begin_range, end_range, usd in rows]
+
+    def counts(self):
+        return dict((table, self._query('SELECT COUNT(*) FROM {}'.format(table), ())[0][0])
+                    for table in ['ec2_prices', 'ebs_prices', 's3_tiers'])
+
+
+_default_store = store.DefaultStore(OfferStore)
+
+
+def get_store():
+    # the imported offer store, or None if nothing has been imported
+    if _default_store.store is None and not os.path.exists(DEFAULT_OFFERS_PATH):
+        return None
+    return _default_store.get()
+
+
+def import_offer_file(offer_path, store_path=DEFAULT_OFFERS_PATH):
+    offer_store = OfferStore(store_path)
+    importer = OfferImporter(offer_store)
+    importer.read(offer_path)
+    counts = importer.save()
+    if store_path == DEFAULT_OFFERS_PATH:
+        _default_store.set(offer_store)
+    return counts
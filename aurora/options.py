@@ -0,0 +1,80 @@
+import click
+from aurora import checkpoints, clients, discovery, output, pricing_cache, profiling, scan
+
+
+# options shared by the ec2_info, ebs_info and s3_info commands
+def pricing_options(func):
+    func = click.option('--price-ttl', type=float, default=pricing_cache.DEFAULT_TTL_DAYS, show_default=True,
+                        help='Number of days a cached price is considered current.')(func)
+    func = click.option('--refresh-prices', is_flag=True, default=False,
+                        help='Ignore cached prices and re-fetch them from the Pricing API.')(func)
+    return func
+
+
+def scan_options(func):
+    func = click.option('--discover/--no-discover', default=True, show_default=True,
+                        help='Skip the regions the account has not enabled and, for EC2 and EBS, the regions a '
+                             'quick describe call finds empty.')(func)
+    func = click.option('--workers', '-w', type=int, default=scan.DEFAULT_WORKERS, show_default=True,
+                        help='Number of regions to scan in parallel.')(func)
+    return func
+
+
+def client_options(func):
+    func = click.option('--max-attempts', type=int, default=clients.DEFAULT_MAX_ATTEMPTS, show_default=True,
+                        help='Times botocore retries a failed API call before giving up (pricing and CloudWatch '
+                             'calls are retried by the rate limiter instead).')(func)
+    func = click.option('--max-pool-connections', type=int, default=clients.DEFAULT_MAX_POOL_CONNECTIONS,
+                        show_default=True, help='Connections kept open per AWS client.')(func)
+    return func
+
+
+def output_options(func):
+    func = click.option('--format', '-f', 'fmt', type=click.Choice(output.FORMATS), default='csv', show_default=True,
+                        help='Output format; parquet writes a directory partitioned by region_name '
+                             '(requires pyarrow).')(func)
+    return func
+
+
+def snapshot_options(func):
+    func = click.option('--diff-report', type=click.Path(dir_okay=False), default=None,
+                        help='Write the resources added, removed or changed since the last run to this csv.')(func)
+    func = click.option('--incremental', is_flag=True, default=False,
+                        help='Only enrich and price resources that are new or changed since the last run; carry '
+                             'the rest forward from the local snapshot.')(func)
+    return func
+
+
+def profile_options(func):
+    func = click.option('--profile-json', type=click.Path(dir_okay=False), default=None,
+                        help='Also write the profile to this JSON file (implies --profile).')(func)
+    func = click.option('--profile', is_flag=True, default=False,
+                        help='Time every AWS call and the main stages of the run and print a summary at the '
+                             'end.')(func)
+    return func
+
+
+def checkpoint_options(func):
+    func = click.option('--resume', type=str, default=None, metavar='RUN_ID',
+                        help='Resume an earlier run that had failures, only collecting the regions (or chunks of '
+                             'buckets) it did not finish. Checkpoints are kept under {}.'.format(
+                                 checkpoints.DEFAULT_CHECKPOINT_DIR))(func)
+    return func
+
+
+def history_options(func):
+    func = click.option('--history/--no-history', 'record_history', default=True, show_default=True,
+                        help='Add the costs of this run to the local cost history (see aurora history query).')(func)
+    return func
+
+
+def configure(price_ttl=pricing_cache.DEFAULT_TTL_DAYS, refresh_prices=False,
+              max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS, max_attempts=clients.DEFAULT_MAX_ATTEMPTS,
+              discover=None, profile=False, profile_json=None):
+    # set up the process-wide price cache, client pool, region discovery and profiler from the options above
+    pricing_cache.configure(ttl_days=price_ttl, refresh=refresh_prices)
+    clients.configure(max_pool_connections=max_pool_connections, max_attempts=max_attempts)
+    if discover is not None:
+        discovery.configure(enabled=discover)
+    if profile or profile_json is not None:
+        profiling.enable()
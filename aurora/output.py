@@ -0,0 +1,238 @@
+import os
+import json
+
+FORMATS = ['csv', 'parquet']
+# rows per parquet row group
+DEFAULT_ROW_GROUP_SIZE = 50000
+# columns that hold timestamps in the collectors' output
+datetime_keys = ['LaunchTime']
+# columns that hold prices, which are missing (all nulls) in a region the price list has nothing for
+numeric_keys = ['usd_per_hr', 'usd_per_month', 'usd_per_gb']
+# rows held in memory at a time while sorting a csv
+SORT_CHUNK_ROWS = 100000
+
+
+def _import_parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("--format parquet requires pyarrow (pip install aurora[parquet])")
+    return pyarrow, pyarrow.parquet
+
+
+def normalize_frame(results_df):
+    # give every column one consistent type so the parquet schema is the same for every region
+    import pandas as pd
+    results_df = results_df.copy()
+    for column in results_df.columns:
+        values = results_df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        if column in datetime_keys:
+            results_df[column] = pd.to_datetime(values.map(lambda v: None if v == '' else v), utc=True)
+        elif column in numeric_keys:
+            results_df[column] = pd.to_numeric(values, errors='coerce').astype(float)
+        elif values.dtype == object:
+            # nested api structures (Placement, State, Tags) are stored as json; '' placeholders become nulls
+            results_df[column] = values.map(_to_text)
+        if column not in datetime_keys + numeric_keys and results_df[column].isnull().all():
+            # a column of nothing but nulls fits whatever type the other regions gave it (prices and timestamps
+            # keep their declared type, so a region without prices doesn't turn usd_per_month into text)
+            results_df[column] = pd.Series([None] * len(results_df), index=results_df.index, dtype=object)
+    return results_df
+
+
+def categorize(results_df, columns):
+    # store low cardinality text columns (region, type, state, ...) as categorical codes rather than one string each
+    for column in columns:
+        if column in results_df.columns:
+            results_df[column] = results_df[column].astype('category')
+    return results_df
+
+
+def concat_frames(frames, columns=None):
+    # pd.concat only keeps a categorical column categorical when every frame has the same categories
+    import pandas as pd
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns)
+    for column in frames[0].columns:
+        if not all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)
+                   for frame in frames):
+            continue
+        categories = pd.api.types.union_categoricals([frame[column] for frame in frames]).categories
+        frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    results_df = pd.concat(frames, ignore_index=True, sort=False)
+    if columns is not None:
+        results_df = results_df.reindex(columns=columns)
+    return results_df
+
+
+def json_text(value):
+    # nested api structures (Placement, State, Tags) as compact json text, anything else as is
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str, sort_keys=True)
+    return value
+
+
+def _to_text(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (dict, list)):
+        return json_text(value)
+    if isinstance(value, float) and value != value:
+        return None
+    return str(value)
+
+
+class CsvWriter(object):
+    """Appends each chunk to a single csv as it arrives."""
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns
+        self._header_written = False
+
+    def write(self, results_df, region_name=None):
+        if self.columns is not None:
+            results_df = results_df.reindex(columns=self.columns)
+        results_df.to_csv(self.path, mode='a' if self._header_written else 'w', header=not self._header_written,
+                          index=False)
+        self._header_written = True
+
+    def close(self):
+        if not self._header_written and self.columns is not None:
+            # still leave a (header only) file behind when there was nothing to write
+            import pandas as pd
+            self.write(pd.DataFrame(columns=self.columns))
+
+
+class ParquetWriter(object):
+    """
+    Writes a region-partitioned parquet dataset (path/region_name=us-east-1/part-00000.parquet, ...).
+
+    Each write becomes a new compressed part file made of row groups, so chunks can be written as each region
+    finishes rather than once the whole account has been collected.
+    """
+
+    def __init__(self, path, columns=None, compression='snappy', row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        self.path = path
+        self.columns = columns
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self._parts = dict()
+        self.schema = None
+        self._pa, self._pq = _import_parquet()
+
+    def write(self, results_df, region_name=None):
+        if self.columns is not None:
+            results_df = results_df.reindex(columns=self.columns)
+        if region_name is None and 'region_name' not in results_df.columns:
+            # nothing to partition by, so the parts go straight into path
+            self._write_part(normalize_frame(results_df), self.path, '')
+            return
+        if region_name is None:
+            # split a mixed chunk into its regions
+            for chunk_region_name, region_df in results_df.groupby('region_name', sort=False):
+                self.write(region_df, chunk_region_name)
+            return
+        # the region is recorded in the partition directory rather than as a column
+        results_df = normalize_frame(results_df.drop(columns=['region_name'], errors='ignore'))
+        self._write_part(results_df, os.path.join(self.path, 'region_name={}'.format(region_name)), region_name)
+
+    def _write_part(self, results_df, partition_dir, partition):
+        if not os.path.isdir(partition_dir):
+            os.makedirs(partition_dir)
+        part = self._parts.get(partition, 0)
+        self._parts[partition] = part + 1
+        if self.schema is None:
+            # the first chunk fixes the schema of the whole dataset (all-null text columns are assumed to be text)
+            schema = self._pa.Schema.from_pandas(results_df, preserve_index=False)
+            self.schema = self._pa.schema([self._pa.field(f.name, self._pa.string()) if f.type == self._pa.null()
+                                           else f for f in schema])
+        table = self._pa.Table.from_pandas(results_df, schema=self.schema, preserve_index=False)
+        self._pq.write_table(table, os.path.join(partition_dir, 'part-{:05d}.parquet'.format(part)),
+                             compression=self.compression, row_group_size=self.row_group_size)
+
+    def close(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+
+def _sorted_run(rows, sort_key, run_dir, n):
+    import csv
+    run_path = os.path.join(run_dir, 'run-{:05d}.csv'.format(n))
+    with open(run_path, 'w', newline='') as f:
+        csv.writer(f, lineterminator='\n').writerows(sorted(rows, key=sort_key))
+    return run_path
+
+
+def sort_csv(path, by, ascending=True, drop_empty=(), chunk_rows=SORT_CHUNK_ROWS):
+    """
+    Sort a csv in place by its numeric column by, holding at most chunk_rows rows in memory.
+
+    Chunks are sorted into temporary files next to path, which are then merged. Values are copied as text, so
+    nothing is re-parsed on the way (e.g. an 'NA' stays 'NA'). Rows without a value for by go last either way, like
+    DataFrame.sort_values, and the columns in drop_empty that are empty on every row are left out.
+    """
+    import csv
+    import heapq
+    import shutil
+    import tempfile
+
+    def sort_key(row):
+        value = float(row[index]) if row[index] != '' else float('nan')
+        if value != value:
+            return 1, 0.0
+        return 0, value if ascending else -value
+
+    run_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        runs = []
+        with open(path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            index = header.index(by)
+            empty = set(header.index(column) for column in drop_empty if column in header)
+            chunk = []
+            for row in reader:
+                if len(empty) > 0:
+                    empty.difference_update([i for i in empty if row[i] != ''])
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    runs.append(_sorted_run(chunk, sort_key, run_dir, len(runs)))
+                    chunk = []
+            runs.append(_sorted_run(chunk, sort_key, run_dir, len(runs)))
+        keep = [i for i in range(len(header)) if i not in empty]
+        run_files = [open(run_path, 'r', newline='') for run_path in runs]
+        sorted_path = os.path.join(run_dir, 'sorted.csv')
+        try:
+            with open(sorted_path, 'w', newline='') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow([header[i] for i in keep])
+                for row in heapq.merge(*[csv.reader(run_file) for run_file in run_files], key=sort_key):
+                    writer.writerow([row[i] for i in keep])
+        finally:
+            for run_file in run_files:
+                run_file.close()
+        os.replace(sorted_path, path)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def open_writer(path, fmt='csv', columns=None):
+    if fmt == 'parquet':
+        return ParquetWriter(path, columns=columns)
+    return CsvWriter(path, columns=columns)
+
+
+def write_frame(results_df, path, fmt='csv'):
+    # write an already collected DataFrame in the requested format
+    if fmt == 'csv':
+        results_df.to_csv(path, index=False)
+        return
+    writer = open_writer(path, fmt=fmt, columns=list(results_df.columns))
+    writer.write(results_df)
+    writer.close()
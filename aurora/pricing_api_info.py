@@ -1,22 +1,120 @@
-import boto3
-
-service_code = 'Amazons3'
+import json
+import click
+from concurrent.futures import ThreadPoolExecutor
+from aurora import clients, options, pricing_cache, scan, throttle
+from aurora.options import client_options, pricing_options
 
 pricing_region = 'us-east-1'
-# connect to the pricing client
-pricing = boto3.client('pricing', region_name=pricing_region)
+# get_attribute_values returns at most 100 values per page
+PAGE_SIZE = 100
+
 
-print("Selected {} Attributes & Values".format(service_code))
-print("================================")
-response = pricing.describe_services(ServiceCode=service_code)
-attrs = response['Services'][0]['AttributeNames']
+def get_attribute_names(pricing, service_code):
+    response = throttle.call('pricing', pricing.describe_services, ServiceCode=service_code)
+    if len(response['Services']) == 0:
+        raise ValueError("unknown ServiceCode: {}".format(service_code))
+    return response['Services'][0]['AttributeNames']
 
-for attr in attrs:
-    response = pricing.get_attribute_values(ServiceCode=service_code,
-                                            AttributeName=attr)
 
+def get_attribute_values(pricing, service_code, attribute_name):
+    # follow NextToken through every page (location, usagetype etc. run to thousands of values)
     values = []
-    for attr_value in response['AttributeValues']:
-        values.append(attr_value['Value'])
+    kwargs = {'ServiceCode': service_code, 'AttributeName': attribute_name, 'MaxResults': PAGE_SIZE}
+    while True:
+        response = throttle.call('pricing', pricing.get_attribute_values, **kwargs)
+        values.extend(attr_value['Value'] for attr_value in response['AttributeValues'])
+        if not response.get('NextToken'):
+            break
+        kwargs['NextToken'] = response['NextToken']
+    return values
+
+
+def catalog_key(cache, service_code, attribute_name):
+    return cache.make_key('attributes', service_code, attribute_name)
+
+
+def get_catalog(service_code, attribute_names=None, workers=scan.DEFAULT_WORKERS, pricing=None, cache=None):
+    """
+    {attribute_name: [values]} for a Pricing API service code, every attribute when attribute_names is None.
+
+    Each attribute's values are cached locally (with the pricing cache's TTL) and the ones that aren't are fetched in
+    parallel.
+    """
+    if cache is None:
+        cache = pricing_cache.get_cache()
+    if pricing is None:
+        pricing = clients.get_client('pricing', region_name=pricing_region)
+    if attribute_names is None:
+        attribute_names = cache.get_or_fetch(catalog_key(cache, service_code, ''),
+                                             lambda: get_attribute_names(pricing, service_code))
+
+    def get_values(attribute_name):
+        return cache.get_or_fetch(catalog_key(cache, service_code, attribute_name),
+                                  lambda: sorted(get_attribute_values(pricing, service_code, attribute_name)))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(zip(attribute_names, executor.map(get_values, attribute_names)))
+
+
+def find_unknown_values(service_code, attribute_name, values, cache=None):
+    """
+    The values that aren't in the cached catalog for this attribute (e.g. a volumeType renamed by AWS).
+
+    Never calls the API: returns None when the attribute's catalog hasn't been cached by pricing_api_info.
+    """
+    if cache is None:
+        cache = pricing_cache.get_cache()
+    known = cache.get(catalog_key(cache, service_code, attribute_name))
+    if known is None:
+        return None
+    known = set(known)
+    return [value for value in values if value not in known]
+
+
+def check_filter_values(service_code, attribute_name, values):
+    # warn about Pricing API filter values that would match nothing, so a missing price has an explanation
+    unknown = find_unknown_values(service_code, attribute_name, values)
+    if unknown:
+        print("Warning: {service_code} has no {attribute} {values} in the cached attribute catalog "
+              "(see pricing_api_info)".format(service_code=service_code, attribute=attribute_name,
+                                              values=", ".join(repr(value) for value in unknown)))
+    return unknown
+
+
+@click.command()
+@click.argument('service_code')
+@click.option('--attribute', '-a', 'attributes', multiple=True,
+              help='Attribute to dump (repeatable); every attribute of the service by default.')
+@click.option('--out', '-o', 'out_json', type=click.Path(dir_okay=False), default=None,
+              help='Write the catalog to this JSON file instead of stdout.')
+@pricing_options
+@click.option('--workers', '-w', type=int, default=scan.DEFAULT_WORKERS, show_default=True,
+              help='Number of attributes to fetch in parallel.')
+@client_options
+def main(service_code, attributes=(), out_json=None, refresh_prices=False, price_ttl=pricing_cache.DEFAULT_TTL_DAYS,
+         workers=scan.DEFAULT_WORKERS, max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS,
+         max_attempts=clients.DEFAULT_MAX_ATTEMPTS):
+    """
+    Dump the Pricing API attributes of SERVICE_CODE (e.g. AmazonEC2, AmazonS3) and all of their values as JSON.
+
+    The catalog is cached locally, which also lets the collectors check their pricing filters without extra calls.
+    """
+    options.configure(price_ttl=price_ttl, refresh_prices=refresh_prices, max_pool_connections=max_pool_connections,
+                      max_attempts=max_attempts)
+    try:
+        catalog = get_catalog(service_code, attribute_names=list(attributes) or None, workers=workers)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    catalog_json = json.dumps({'ServiceCode': service_code, 'attributes': catalog}, indent=2, sort_keys=True)
+    if out_json is None:
+        click.echo(catalog_json)
+    else:
+        with open(out_json, 'w') as f:
+            f.write(catalog_json)
+        print("Wrote {n} attributes of {service_code} to {path}".format(n=len(catalog), service_code=service_code,
+                                                                        path=out_json))
+        throttle.report()
+
 
-    print("  " + attr + ": " + ", ".join(values))
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import threading
+from aurora import store
+
+# prices change roughly once a month, so a week-old price is still good enough for inventory reports
+DEFAULT_TTL_DAYS = 7
+DEFAULT_CACHE_DIR = os.environ.get('AURORA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.aurora'))
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, 'pricing_cache.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    service TEXT NOT NULL,
+    region_description TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    os TEXT NOT NULL,
+    value TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (service, region_description, item_type, os)
+)
+"""
+
+
+class PricingCache(store.SQLiteStore):
+    """
+    Local cache of Pricing API results, keyed by (service, region_description, item_type, os).
+
+    Values are persisted to a SQLite file with a TTL and memoized in-process on top of that, so repeated
+    lookups within a run never touch the disk or the API twice. Setting refresh=True ignores anything
+    already stored and re-fetches (and re-stores) every price the first time it is requested in this process.
+    """
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS, refresh=False):
+        super(PricingCache, self).__init__(path)
+        self.ttl_seconds = ttl_days * 24 * 3600
+        self.refresh = refresh
+        self._memo = dict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(service, region_description, item_type='', os=''):
+        return (service, region_description, item_type or '', os or '')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+            if self.refresh:
+                return None
+            row = self._connect().execute('SELECT value, fetched_at FROM prices WHERE service = ? AND '
+                                          'region_description = ? AND item_type = ? AND os = ?', key).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                return None
+            value = json.loads(row[0])
+            self._memo[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._memo[key] = value
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?)',
+                         key + (json.dumps(value), time.time()))
+            conn.commit()
+
+    def get_or_fetch(self, key, fetch):
+        # fetch is only called on a miss; it must return something json serializable
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            conn = self._connect()
+            conn.execute('DELETE FROM prices')
+            conn.commit()
+
+
+_default_cache = store.DefaultStore(PricingCache)
+
+
+def configure(path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS, refresh=False):
+    # replace the process-wide cache (used by the --refresh-prices and --price-ttl cli options)
+    return _default_cache.configure(path=path, ttl_days=ttl_days, refresh=refresh)
+
+
+def get_cache():
+    return _default_cache.get()
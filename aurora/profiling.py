@@ -0,0 +1,178 @@
+import json
+import time
+import bisect
+import threading
+import contextlib
+from aurora import clients
+
+# upper bounds (seconds) of the api latency histogram buckets, anything slower goes in a final overflow bucket
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class Timing(object):
+
+    def __init__(self, histogram=False):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1) if histogram else None
+
+    def add(self, seconds, error=False):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errors += 1
+        if self.histogram is not None:
+            self.histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if self.histogram is not None:
+            self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def percentile(self, q):
+        # upper bound of the histogram bucket holding the q-th percentile call
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS + [self.max], self.histogram):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        timing = {'count': self.count, 'total_seconds': self.total, 'max_seconds': self.max}
+        if self.histogram is not None:
+            timing['errors'] = self.errors
+            timing['histogram'] = dict(zip(['le_{}'.format(b) for b in LATENCY_BUCKETS] + ['gt_{}'.format(
+                LATENCY_BUCKETS[-1])], self.histogram))
+        return timing
+
+
+class Profiler(object):
+    """
+    Collects per (service, operation, region) call counts and latencies from botocore's before-call/after-call
+    events, plus the time spent in named stages of the collectors (see stage()).
+
+    Stage times are summed over every thread, so a stage run for 8 regions in parallel can add up to more than the
+    wall time of the run.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.started = clock()
+        self.api_calls = dict()
+        self.stages = dict()
+        self._lock = threading.Lock()
+
+    def install(self, session):
+        # register_first, so the start time is recorded even when another before-call handler answers the call
+        session.events.register_first('before-call', self._before_call)
+        session.events.register('after-call', self._after_call)
+
+    def _before_call(self, context, **kwargs):
+        context['aurora_profile_start'] = self._clock()
+
+    def _after_call(self, http_response, model, context, **kwargs):
+        start = context.get('aurora_profile_start')
+        if start is None:
+            return
+        key = (model.service_model.service_name, model.name, context.get('client_region') or '')
+        error = http_response is None or http_response.status_code >= 300
+        with self._lock:
+            timing = self.api_calls.get(key)
+            if timing is None:
+                timing = self.api_calls[key] = Timing(histogram=True)
+            timing.add(self._clock() - start, error=error)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            timing = self.stages.get(name)
+            if timing is None:
+                timing = self.stages[name] = Timing()
+            timing.add(seconds)
+
+    def to_dict(self):
+        with self._lock:
+            return {'wall_seconds': self._clock() - self.started,
+                    'stages': dict((name, timing.to_dict()) for name, timing in self.stages.items()),
+                    'api_calls': [dict(service=service_name, operation=operation_name, region=region_name,
+                                       **timing.to_dict())
+                                  for (service_name, operation_name, region_name), timing
+                                  in sorted(self.api_calls.items())]}
+
+    def report(self, max_rows=10):
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1].total)
+            api_calls = sorted(self.api_calls.items(), key=lambda item: -item[1].total)
+            # the same calls rolled up over every region
+            operations = dict()
+            for (service_name, operation_name, _), timing in api_calls:
+                operation = '{}.{}'.format(service_name, operation_name)
+                operations.setdefault(operation, Timing(histogram=True)).merge(timing)
+        print("\nProfile ({:.2f}s wall time)".format(self._clock() - self.started))
+        if len(stages) > 0:
+            print("{:<28} {:>8} {:>10}".format('stage', 'count', 'seconds'))
+            for name, timing in stages:
+                print("{:<28} {:>8} {:>10.2f}".format(name, timing.count, timing.total))
+        if len(api_calls) > 0:
+            rows = [(operation, 'all', timing) for operation, timing in
+                    sorted(operations.items(), key=lambda item: -item[1].total)]
+            rows += [('{}.{}'.format(service_name, operation_name), region_name or '-', timing)
+                     for (service_name, operation_name, region_name), timing in api_calls[:max_rows]]
+            print("{:<40} {:<16} {:>7} {:>6} {:>9} {:>8} {:>8} {:>8}".format(
+                'api call', 'region', 'calls', 'errors', 'seconds', 'mean ms', 'p95 ms', 'max ms'))
+            for operation, region_name, timing in rows:
+                print("{:<40} {:<16} {:>7} {:>6} {:>9.2f} {:>8.1f} {:>8.1f} {:>8.1f}".format(
+                    operation, region_name, timing.count, timing.errors, timing.total,
+                    1000 * timing.total / timing.count, 1000 * timing.percentile(0.95), 1000 * timing.max))
+            if len(api_calls) > max_rows:
+                print("... {} more by region (see --profile-json)".format(len(api_calls) - max_rows))
+
+
+_profiler = None
+
+
+def enable(session=None):
+    # start profiling every client created from the pool's session from now on
+    global _profiler
+    _profiler = Profiler()
+    _profiler.install(session if session is not None else clients.get_pool().session)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextlib.contextmanager
+def stage(name):
+    # e.g. with profiling.stage('ebs.pricing'): ... (does nothing unless profiling is enabled)
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        profiler.add_stage(name, time.time() - start)
+
+
+def report(json_path=None):
+    if _profiler is None:
+        return
+    _profiler.report()
+    if json_path is not None:
+        with open(json_path, 'w') as f:
+            json.dump(_profiler.to_dict(), f, indent=2, sort_keys=True)
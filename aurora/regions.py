@@ -0,0 +1,103 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from aurora import pricing_cache
+
+# index written the first time botocore's endpoints.json is parsed, so later runs don't need to parse it at all
+DEFAULT_INDEX_PATH = os.path.join(pricing_cache.DEFAULT_CACHE_DIR, 'regions.json')
+PARTITION = 'aws'
+
+_lock = threading.Lock()
+_registry = None
+
+
+def _botocore_data_dir():
+    # locate botocore's data without importing anything beyond the (light) top-level package
+    import botocore
+    return os.path.join(os.path.dirname(botocore.__file__), 'data')
+
+
+def _botocore_version():
+    import botocore
+    return botocore.__version__
+
+
+class RegionRegistry(object):
+    """
+    In-memory lookups between region codes (us-east-1) and region descriptions (US East (N. Virginia)).
+
+    The descriptions are the location names used by the Pricing API, so both directions are needed: code to
+    description when building pricing filters, description to code when reading price lists.
+    """
+
+    def __init__(self, descriptions):
+        self.descriptions = OrderedDict(descriptions)
+        self.codes = {description: region_name for region_name, description in self.descriptions.items()}
+
+    @classmethod
+    def from_endpoints(cls, endpoint_file=None):
+        if endpoint_file is None:
+            endpoint_file = os.path.join(_botocore_data_dir(), 'endpoints.json')
+        with open(endpoint_file, 'r') as f:
+            data = json.load(f)
+        partition = [p for p in data['partitions'] if p['partition'] == PARTITION][0]
+        return cls((region_name, region['description']) for region_name, region in partition['regions'].items())
+
+    @classmethod
+    def from_index(cls, index_path=DEFAULT_INDEX_PATH):
+        # returns None if there's no index, or it was built against a different botocore
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        if index.get('botocore_version') != _botocore_version():
+            return None
+        return cls(index['regions'])
+
+    def save(self, index_path=DEFAULT_INDEX_PATH):
+        index_dir = os.path.dirname(os.path.abspath(index_path))
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        # write then rename, so a process starting up alongside never reads a half written index
+        tmp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'botocore_version': _botocore_version(),
+                       'regions': list(self.descriptions.items())}, f)
+        os.replace(tmp_path, index_path)
+
+    def get_all_regions(self):
+        return list(self.descriptions.keys())
+
+    def get_description(self, region_name):
+        if len(region_name.split('-')[2]) > 1:
+            # reformat to drop the last letter (e.g. an availability zone like us-east-1a)
+            region_name = region_name[:-1]
+        return self.descriptions[region_name]
+
+    def get_region_name(self, description):
+        return self.codes[description]
+
+
+def get_registry(index_path=DEFAULT_INDEX_PATH):
+    # read the index (or parse the endpoints data, and index it for next time) once per process
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                registry = RegionRegistry.from_index(index_path)
+                if registry is None:
+                    registry = RegionRegistry.from_endpoints()
+                    try:
+                        registry.save(index_path)
+                    except (IOError, OSError):
+                        # the index only saves time, so carry on without it (e.g. a read-only home directory)
+                        pass
+                _registry = registry
+    return _registry
+
+
+def build_index(index_path=DEFAULT_INDEX_PATH):
+    registry = RegionRegistry.from_endpoints()
+    registry.save(index_path)
+    return registry
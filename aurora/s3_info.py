@@ -1,170 +1,366 @@
-import boto3
-import pandas as pd
-import tqdm
 import tools
 import json
 import click
 import datetime
-import numpy as np
-import botocore
+from collections import OrderedDict
+from aurora import (checkpoints, clients, discovery, history, offers, options, output, pricing_api_info,
+                    pricing_cache, profiling, scan, snapshots, throttle)
+from aurora.options import (checkpoint_options, client_options, history_options, output_options, pricing_options,
+                            profile_options, scan_options, snapshot_options)
 
-@click.command()
-@click.argument('out_csv')
-@click.option('--in_region', '-r', type=str, default='all')
-@click.option('--days', '-d', type=int, default=4)
-@click.option('--agg', '-a', type=str, default='min')
-def main(out_csv, in_region='all', days=4, agg='min'):
+volume_types = {'StandardIAStorage': 'Standard - Infrequent Access',
+                'GlacierStorage': 'Amazon Glacier',
+                'GlacierDeep': 'Glacier Deep Archive',
+                'OneZoneIAStorage': 'One Zone - Infrequent Access',
+                'ReducedRedundancyStorage': 'Reduced Redundancy',
+                'IntelligentTieringFAStorage': 'Intelligent-Tiering Frequent Access',
+                'IntelligentTieringIAStorage': 'Intelligent-Tiering Infrequent Access',
+                'StandardStorage': 'Standard'
+                }
+result_keys = ['bucket_name', 'bucket_size_bytes', 'bucket_size_gb', 'price_per_gb', 'usd_per_month', 'region_name',
+               'volume_type']
+# low cardinality columns held as categorical codes
+categorical_keys = ['region_name', 'volume_type']
+# bucket region lookups checkpointed at a time
+BUCKET_CHUNK_SIZE = 500
 
-    allowable_agg_vals = ['min', 'max', 'mean']
-    if agg.lower() == 'min':
-        agg_func = np.min
-    elif agg.lower() == 'max':
-        agg_func = np.max
-    elif agg.lower() == 'mean':
-        agg_func = np.mean
-    else:
-        raise ValueError("Invalid input for agg: must be one of {}".format(allowable_agg_vals))
+
+def get_s3_price_tiers(pricing, region_description, volume_desc, cache=None):
+    # list of {min_bytes, max_bytes, price_per_gb} tiers for a storage class (served from the local pricing cache when possible)
+    if cache is None:
+        cache = pricing_cache.get_cache()
+
+    def fetch():
+        store = offers.get_store()
+        if store is not None:
+            tiers = store.get_s3_tiers(region_description, volume_desc)
+            if tiers is not None:
+                return tiers
+        response = throttle.call('pricing', pricing.get_products, ServiceCode='AmazonS3', Filters=[
+            {'Type': 'TERM_MATCH', 'Field': 'productFamily', 'Value': 'Storage'},
+            {'Type': 'TERM_MATCH', 'Field': 'volumeType', 'Value': volume_desc},
+            # assume general purpose storage
+            {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': region_description}])
+        tiers = []
+        if len(response['PriceList']) > 0:
+            price_list = json.loads(response['PriceList'][0])
+            price_dims = list(list(price_list['terms']['OnDemand'].values())[0]['priceDimensions'].values())
+            for price_dim in price_dims:
+                tiers.append({'min_bytes': float(price_dim['beginRange']),
+                              'max_bytes': float(price_dim['endRange']),
+                              'price_per_gb': float(price_dim['pricePerUnit']['USD'])})
+        return tiers
+
+    return cache.get_or_fetch(cache.make_key('s3', region_description, volume_desc), fetch)
+
+
+# GetMetricData accepts at most 500 queries per request
+MAX_METRIC_DATA_QUERIES = 500
+
+
+def get_bucket_sizes(cloudwatch, bucket_names, start_time, end_time, agg_func):
+    # BucketSizeBytes for every (bucket, storage type) in one region, packed into as few GetMetricData calls as possible
+    metric_data_queries = []
+    query_keys = dict()
+    for bucket_name in bucket_names:
+        for volume_type in volume_types.keys():
+            metric = {'Namespace': 'AWS/S3',
+                      'MetricName': 'BucketSizeBytes',
+                      'Dimensions': [{'Name': 'StorageType', 'Value': volume_type},
+                                     {'Name': 'BucketName', 'Value': bucket_name}]}
+            # ids have to start with a lower case letter, so map them back to the bucket and storage type afterwards
+            query_id = 'q{}'.format(len(metric_data_queries))
+            query_keys[query_id] = (bucket_name, volume_type)
+            metric_data_queries.append({'Id'        : query_id,
+                                        'MetricStat': {'Metric': metric,
+                                                       'Period': 3600,
+                                                       'Stat'  : 'Average',
+                                                       'Unit'  : 'Bytes'}
+                                        })
+
+    values = dict()
+    for i in range(0, len(metric_data_queries), MAX_METRIC_DATA_QUERIES):
+        kwargs = {'MetricDataQueries': metric_data_queries[i:i + MAX_METRIC_DATA_QUERIES],
+                  'StartTime': start_time,
+                  'EndTime': end_time}
+        while True:
+            metric_data = throttle.call('cloudwatch', cloudwatch.get_metric_data, **kwargs)
+            for result in metric_data['MetricDataResults']:
+                values.setdefault(result['Id'], []).extend(result['Values'])
+            if not metric_data.get('NextToken'):
+                break
+            kwargs['NextToken'] = metric_data['NextToken']
+
+    bucket_sizes = dict()
+    for query_id, query_values in values.items():
+        if len(query_values) > 0:
+            bucket_sizes[query_keys[query_id]] = agg_func(list(map(float, query_values)))
+
+    return bucket_sizes
+
+
+def get_bucket_region(client, bucket_name):
+    # None if we're forbidden from finding out
+    import botocore.exceptions
+    try:
+        return client.head_bucket(Bucket=bucket_name)['ResponseMetadata']['HTTPHeaders']['x-amz-bucket-region']
+    except botocore.exceptions.ClientError:
+        try:
+            region_name = client.get_bucket_location(Bucket=bucket_name)['LocationConstraint']
+            if region_name is None:
+                region_name = 'us-east-1'
+            return region_name
+        except botocore.exceptions.ClientError:
+            return None
+
+
+def resolve_bucket_regions(client, buckets, workers=scan.DEFAULT_WORKERS, snapshot=None, checkpoint=None,
+                           chunk_size=BUCKET_CHUNK_SIZE):
+    import tqdm
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    # known buckets keep the region from the last run (see --incremental), the rest are looked up concurrently
+    fingerprints = dict()
+    known_regions = dict()
+    for bucket in buckets:
+        fingerprints[bucket['Name']] = snapshots.make_fingerprint(bucket.get('CreationDate'))
+        previous = snapshot.lookup(bucket['Name'], fingerprints[bucket['Name']]) if snapshot is not None else None
+        if previous is not None:
+            # a bucket can't change region without being re-created, so the last run's answer still holds
+            known_regions[bucket['Name']] = previous['region_name']
+    # lookups finished by an earlier attempt at this run (see --resume) aren't repeated
+    found_regions = checkpoint.load('bucket_regions', dict()) if checkpoint is not None else dict()
+    bucket_names = [bucket['Name'] for bucket in buckets
+                    if bucket['Name'] not in known_regions and bucket['Name'] not in found_regions]
+    if len(bucket_names) > 0:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(bucket_names)))) as executor, \
+                tqdm.tqdm(total=len(bucket_names), desc='Bucket regions', unit='bucket') as progress_bar:
+            for i in range(0, len(bucket_names), chunk_size):
+                futures = dict((executor.submit(get_bucket_region, client, bucket_name), bucket_name)
+                               for bucket_name in bucket_names[i:i + chunk_size])
+                for future in as_completed(futures):
+                    found_regions[futures[future]] = future.result()
+                    progress_bar.update(1)
+                if checkpoint is not None:
+                    checkpoint.save('bucket_regions', found_regions, done=False)
+    if checkpoint is not None:
+        checkpoint.save('bucket_regions', found_regions)
+
+    # walk the buckets in listing order so a forbidden bucket falls back to the previous bucket's region as before
+    bucket_regions = OrderedDict()
+    region_name = 'us-east-1'
+    for bucket in buckets:
+        bucket_name = bucket['Name']
+        if bucket_name in known_regions:
+            region_name = known_regions[bucket_name]
+        elif found_regions[bucket_name] is not None:
+            region_name = found_regions[bucket_name]
+        else:
+            msg = "Warning: Forbidden from determining region_name of {}. Assuming it is us-east-1".format(bucket_name)
+            print(msg)
+        bucket_regions[bucket_name] = region_name
+        if snapshot is not None:
+            snapshot.add(region_name, bucket_name, fingerprints[bucket_name], {'bucket_name': bucket_name,
+                                                                               'region_name': region_name})
+    return bucket_regions
+
+
+def build_tier_index(s3_price_lkup_df):
+    # compile the price table once into sorted tier boundaries per (region, storage type), in GB like the price list's
+    # beginRange/endRange (despite the min_bytes/max_bytes column names)
+    tier_index = dict()
+    if len(s3_price_lkup_df) == 0:
+        return tier_index
+    for (region_name, storage_type), tiers in s3_price_lkup_df.groupby(['region_name', 'storage_type']):
+        tiers = tiers.sort_values(by=['max_bytes', 'min_bytes'])
+        tier_index[(region_name, storage_type)] = (tiers['min_bytes'].values,
+                                                   tiers['max_bytes'].values,
+                                                   tiers['price_per_gb'].values)
+    return tier_index
+
+
+def lookup_tier_prices(tier_index, region_names, storage_types, sizes_gb):
+    # vectorized equivalent of finding the tier with min_bytes <= size_gb <= max_bytes for every row
+    import numpy as np
+    import pandas as pd
+    prices = np.full(len(sizes_gb), np.nan)
+    groups = pd.DataFrame({'region_name': region_names, 'storage_type': storage_types}).groupby(
+        ['region_name', 'storage_type']).indices
+    for key, rows in groups.items():
+        if key not in tier_index:
+            continue
+        min_bytes, max_bytes, price_per_gb = tier_index[key]
+        group_sizes = sizes_gb[rows]
+        # the first tier whose upper bound covers the size (the lower tier wins on a shared boundary)
+        tier = np.searchsorted(max_bytes, group_sizes, side='left')
+        found = tier < len(max_bytes)
+        tier = np.minimum(tier, len(max_bytes) - 1)
+        found &= min_bytes[tier] <= group_sizes
+        prices[rows[found]] = price_per_gb[tier[found]]
+    return prices
+
+
+def price_buckets(bucket_regions, bucket_sizes, s3_price_lkup_df):
+    import numpy as np
+    import pandas as pd
+    # one list per column rather than a dict per row
+    columns = OrderedDict((k, []) for k in ['bucket_name', 'bucket_size_bytes', 'region_name', 'volume_type'])
+    no_data = []
+    for bucket_name, region_name in bucket_regions.items():
+        found = False
+        for volume_type in volume_types.keys():
+            if (bucket_name, volume_type) in bucket_sizes:
+                found = True
+                for k, v in zip(columns, [bucket_name, bucket_sizes[(bucket_name, volume_type)], region_name,
+                                          volume_type]):
+                    columns[k].append(v)
+        # if no results for this bucket, just append one record for the bucket listing it as zero cost/storage
+        if not found:
+            no_data.append(len(columns['bucket_name']))
+            for k, v in zip(columns, [bucket_name, 0, region_name, volume_type]):
+                columns[k].append(v)
+    results_df = pd.DataFrame(columns)
+    # price every bucket and storage type in one pass
+    results_df['bucket_size_gb'] = results_df['bucket_size_bytes'] / 1e9
+    results_df['price_per_gb'] = lookup_tier_prices(build_tier_index(s3_price_lkup_df),
+                                                    results_df['region_name'].values,
+                                                    results_df['volume_type'].values,
+                                                    results_df['bucket_size_gb'].values.astype(float))
+    results_df['usd_per_month'] = results_df['price_per_gb'] * results_df['bucket_size_gb']
+    unpriced = results_df['price_per_gb'].isnull() & (results_df['bucket_size_bytes'] > 0)
+    for bucket_name in results_df.loc[unpriced, 'bucket_name'].unique():
+        print("Warning: could not determine price_per_gb for bucket {}".format(bucket_name))
+    results_df.loc[no_data, 'price_per_gb'] = np.nan
+    return output.categorize(results_df.reindex(columns=result_keys), categorical_keys)
+
+
+def collect(region_names, days=4, agg='min', workers=scan.DEFAULT_WORKERS, snapshot=None, checkpoint=None):
+    import numpy as np
+    import pandas as pd
+    import tqdm
+    agg_func = {'min': np.min, 'max': np.max, 'mean': np.mean}[agg.lower()]
 
     pricing_region = 'us-east-1'
     # connect to the pricing client
-    pricing = boto3.client('pricing', region_name=pricing_region)
+    pricing = clients.get_client('pricing', region_name=pricing_region)
 
-    expected_region_names = tools.get_all_regions()
-    if in_region == 'all':
-        # process all regions
-        region_names = expected_region_names
-    else:
-        # check that the specified region is valid
-        if in_region not in expected_region_names:
-            raise ValueError("in_region not recognized: {}".format(in_region))
-        else:
-            region_names = [in_region]
-
-    s3_price_lkup = []
-    volume_types = {'StandardIAStorage': 'Standard - Infrequent Access',
-                    'GlacierStorage': 'Amazon Glacier',
-                    'GlacierDeep': 'Glacier Deep Archive',
-                    'OneZoneIAStorage': 'One Zone - Infrequent Access',
-                    'ReducedRedundancyStorage': 'Reduced Redundancy',
-                    'IntelligentTieringFAStorage': 'Intelligent-Tiering Frequent Access',
-                    'IntelligentTieringIAStorage': 'Intelligent-Tiering Infrequent Access',
-                    'StandardStorage': 'Standard'
-                    }
-    for region_name in region_names:
+    def get_region_prices(region_name):
         # get the region description
         region_description = tools.get_region_description(region_name)
         print("Getting S3 Pricing for Region {desc} ({name})".format(desc=region_description,
                                                                      name=region_name))
-
-        region_description = tools.get_region_description(region_name)
+        region_prices = []
         for volume_type, volume_desc in volume_types.items():
-            response = pricing.get_products(ServiceCode='AmazonS3', Filters=[
-                {'Type': 'TERM_MATCH', 'Field': 'productFamily', 'Value': 'Storage'},
-                {'Type': 'TERM_MATCH', 'Field': 'volumeType', 'Value': volume_desc},
-                # assume general purpose storage
-                {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': region_description}])
-            if len(response['PriceList']) > 0:
-                price_list = json.loads(response['PriceList'][0])
-                price_dims = list(list(price_list['terms']['OnDemand'].values())[0]['priceDimensions'].values())
-                for price_dim in price_dims:
-                    prices = {'region_name': region_name,
-                              'min_bytes': float(price_dim['beginRange']),
-                              'max_bytes': float(price_dim['endRange']),
-                              'price_per_gb': float(price_dim['pricePerUnit']['USD']),
-                              'storage_type': volume_type
-                              }
-                    s3_price_lkup.append(prices)
+            for tier in get_s3_price_tiers(pricing, region_description, volume_desc):
+                prices = {'region_name': region_name,
+                          'min_bytes': tier['min_bytes'],
+                          'max_bytes': tier['max_bytes'],
+                          'price_per_gb': tier['price_per_gb'],
+                          'storage_type': volume_type
+                          }
+                region_prices.append(prices)
+        return region_prices
 
-    s3_price_lkup_df = pd.DataFrame(s3_price_lkup)
+    pricing_api_info.check_filter_values('AmazonS3', 'volumeType', list(volume_types.values()))
+    region_names = discovery.filter_regions('s3', region_names, workers=workers)
 
     results = []
-    client = boto3.client('s3')
+    client = clients.get_client('s3')
 
     print("Finding all S3 Buckets.")
     buckets = client.list_buckets()['Buckets']
     if len(buckets) > 0:
-        print("Calculating bucket storage and costs.")
-        for bucket in tqdm.tqdm(buckets):
-            bucket_name = bucket['Name']
-            try:
-                region_name = client.head_bucket(Bucket=bucket_name)['ResponseMetadata']['HTTPHeaders']['x-amz-bucket-region']
-            except botocore.exceptions.ClientError:
-                try:
-                    region_name = client.get_bucket_location(Bucket=bucket_name)['LocationConstraint']
-                    if region_name is None:
-                        region_name = 'us-east-1'
-                except botocore.exceptions.ClientError:
-                    msg = "Warning: Forbidden from determining region_name of {}. Assuming it is us-east-1".format(bucket_name)
-                    print(msg)
-            bucket_results = []
-            for volume_type in volume_types.keys():
-                metric = {'Namespace': 'AWS/S3',
-                          'MetricName': 'BucketSizeBytes',
-                          'Dimensions': [{'Name': 'StorageType', 'Value': volume_type},
-                                         {'Name': 'BucketName', 'Value': bucket_name}]}
-
-                metric_data_queries = [{'Id'        : 'a',
-                                        'MetricStat': {'Metric': metric,
-                                                       'Period': 3600,
-                                                       'Stat'  : 'Average',
-                                                       'Unit'  : 'Bytes'}
-                                        }]
-                cloudwatch = boto3.client('cloudwatch',
-                                          region_name=region_name)
-                metric_data = cloudwatch.get_metric_data(MetricDataQueries=metric_data_queries,
-                                                         StartTime=datetime.datetime.now()-datetime.timedelta(days=days),
-                                                         EndTime=datetime.datetime.now())
-
-                if len(metric_data['MetricDataResults']) > 0 and len(metric_data['MetricDataResults'][0]['Values']) > 0:
-                    bucket_size_bytes = agg_func(list(map(float, metric_data['MetricDataResults'][0]['Values'])))
-
-
-                    bucket_size_gb = bucket_size_bytes / 1e9
-                    if not np.isnan(bucket_size_bytes):
-                        # look up the costs
-                        query_string = "region_name == '{region_name}' &  min_bytes <= {bucket_size_bytes} & max_bytes >= {bucket_size_bytes} & storage_type == '{volume_type}' ".format(
-                                bucket_size_bytes=bucket_size_bytes,
-                                region_name=region_name,
-                                volume_type=volume_type
-                        )
-                        try:
-                            price_per_gb = s3_price_lkup_df.query(query_string)['price_per_gb'].tolist()[0]
-                        except IndexError:
-                            print("Warning: could not determine price_per_gb for bucket {}".format(bucket_name))
-                            print("Cause: could be a bad query -- {}".format(query_string))
-                            price_per_gb = np.nan
-                    else:
-                        price_per_gb = np.nan
-
-                    usd_per_month = price_per_gb * bucket_size_gb
-                    bucket_results.append({'bucket_name': bucket_name,
-                                           'bucket_size_bytes': bucket_size_bytes,
-                                           'bucket_size_gb': bucket_size_gb,
-                                           'price_per_gb': price_per_gb,
-                                           'usd_per_month': usd_per_month,
-                                           'region_name': region_name,
-                                           'volume_type': volume_type})
-            # if no results for this bucket, just append one record for the bucket listing it as zero cost/storage
-            if len(bucket_results) == 0:
-                bucket_results.append({'bucket_name'      : bucket_name,
-                                       'bucket_size_bytes': 0,
-                                       'bucket_size_gb'   : 0,
-                                       'price_per_gb'     : price_per_gb,
-                                       'usd_per_month'    : 0,
-                                       'region_name'      : region_name,
-                                       'volume_type'      : volume_type})
-            results.extend(bucket_results)
+        print("Finding bucket regions.")
+        with profiling.stage('s3.bucket_regions'):
+            bucket_regions = resolve_bucket_regions(client, buckets, workers=workers, snapshot=snapshot,
+                                                    checkpoint=checkpoint)
+
+        # group the buckets by region so the CloudWatch metrics for each region can be fetched in bulk
+        region_buckets = OrderedDict()
+        for bucket_name, region_name in bucket_regions.items():
+            region_buckets.setdefault(region_name, []).append(bucket_name)
+
+        # only the regions that hold buckets need their prices
+        s3_price_lkup = []
+        region_scan = scan.RegionScan(get_region_prices, [region_name for region_name in region_names
+                                                          if region_name in region_buckets], workers=workers)
+        with profiling.stage('s3.pricing'):
+            for region_name, region_prices in region_scan:
+                s3_price_lkup.extend(region_prices)
+        region_scan.report()
+        s3_price_lkup_df = pd.DataFrame(s3_price_lkup)
+
+        print("Calculating bucket storage.")
+        end_time = datetime.datetime.now()
+        start_time = end_time - datetime.timedelta(days=days)
+
+        def get_region_sizes(region_name):
+            cloudwatch = clients.get_client('cloudwatch',
+                                            region_name=region_name)
+            return get_bucket_sizes(cloudwatch, region_buckets[region_name], start_time, end_time, agg_func)
+
+        # a region whose metrics can't be read leaves its buckets without size data rather than failing the run
+        bucket_sizes = dict()
+        size_scan = scan.RegionScan(get_region_sizes, list(region_buckets), workers=workers,
+                                    checkpoint=checkpoint.stage('sizes') if checkpoint is not None else None)
+        with profiling.stage('s3.sizing'):
+            for region_name, region_sizes in tqdm.tqdm(size_scan, total=len(region_buckets), desc='Bucket sizes',
+                                                       unit='region'):
+                bucket_sizes.update(region_sizes)
+        size_scan.report()
+
+        print("Calculating bucket costs.")
+        with profiling.stage('s3.costs'):
+            results_df = price_buckets(bucket_regions, bucket_sizes, s3_price_lkup_df)
     else:
         print("No S3 Buckets found.")
+        results_df = pd.DataFrame(results, columns=result_keys)
 
-
-    results_df = pd.DataFrame(results)
     results_df.sort_values(by='usd_per_month', inplace=True, ascending=False)
-    results_df.to_csv(out_csv, index=False)
+    return results_df
 
-if __name__ == '__main__':
-    main()
 
+@click.command()
+@click.argument('out_csv')
+@click.option('--in_region', '-r', type=str, default='all')
+@click.option('--days', '-d', type=int, default=4)
+@click.option('--agg', '-a', type=str, default='min')
+@output_options
+@snapshot_options
+@pricing_options
+@scan_options
+@client_options
+@profile_options
+@checkpoint_options
+@history_options
+def main(out_csv, in_region='all', days=4, agg='min', fmt='csv', incremental=False, diff_report=None,
+         refresh_prices=False, price_ttl=pricing_cache.DEFAULT_TTL_DAYS,
+         workers=scan.DEFAULT_WORKERS, max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS,
+         max_attempts=clients.DEFAULT_MAX_ATTEMPTS, profile=False, profile_json=None, resume=None,
+         record_history=True, discover=True):
+
+    allowable_agg_vals = ['min', 'max', 'mean']
+    if agg.lower() not in allowable_agg_vals:
+        raise ValueError("Invalid input for agg: must be one of {}".format(allowable_agg_vals))
+
+    region_names = tools.resolve_regions(in_region)
 
+    options.configure(price_ttl=price_ttl, refresh_prices=refresh_prices, max_pool_connections=max_pool_connections,
+                      max_attempts=max_attempts, discover=discover, profile=profile, profile_json=profile_json)
 
+    # bucket sizes change daily so every bucket is always re-measured; incremental only skips region lookups
+    snapshot = snapshots.Snapshot('s3', incremental=incremental, global_listing=True)
+    run = checkpoints.start(resume)
+    results_df = collect(region_names, days=days, agg=agg, workers=workers, snapshot=snapshot,
+                         checkpoint=run.checkpoint('s3'))
+    with profiling.stage('s3.output'):
+        output.write_frame(results_df, out_csv, fmt=fmt)
+    if record_history:
+        with profiling.stage('s3.history'):
+            history.record(run, 's3', results_df)
+    throttle.report()
+    snapshots.finish([snapshot], diff_report=diff_report)
+    profiling.report(json_path=profile_json)
+    run.finish()
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import types
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from aurora import clients
+
+DEFAULT_WORKERS = 8
+
+
+class RegionScan(object):
+    """
+    Runs scan_func(region_name) for every region on a bounded thread pool.
+
+    Iterating yields (region_name, result) in the order the regions were given, regardless of the order in which
+    they finish. If scan_func returns a generator it is drained into a list before the region is handed back, so a
+    region that fails partway never shows up half-collected. A region that raises (e.g. an opt-in region that isn't
+    enabled, or access denied) is reported and recorded in self.errors instead of aborting the rest of the scan.
+
+    With a checkpoint (see aurora.checkpoints) every region's result is saved as soon as the region is done, and
+    regions already done in a resumed run are handed back from the checkpoint without calling scan_func.
+    """
+
+    def __init__(self, scan_func, region_names, workers=DEFAULT_WORKERS, checkpoint=None):
+        self.scan_func = scan_func
+        self.region_names = list(region_names)
+        self.workers = max(1, workers)
+        self.checkpoint = checkpoint
+        self.errors = OrderedDict()
+
+    def _scan(self, region_name):
+        if self.checkpoint is not None and self.checkpoint.done(region_name):
+            return self.checkpoint.load(region_name), None
+        try:
+            result = self.scan_func(region_name)
+            if isinstance(result, types.GeneratorType):
+                # a generator only does its work when consumed, and a region only counts once all of it is done
+                result = list(result)
+            if self.checkpoint is not None:
+                self.checkpoint.save(region_name, result)
+            return result, None
+        except Exception as e:
+            return None, e
+
+    def _record_error(self, region_name, error):
+        self.errors[region_name] = error
+        if self.checkpoint is not None:
+            self.checkpoint.fail(region_name, error)
+        print("Warning: skipping region {name} ({error_type}: {error})".format(name=region_name,
+                                                                              error_type=type(error).__name__,
+                                                                              error=error))
+
+    def __iter__(self):
+        if not self.parallel:
+            # no need for a pool, just go region by region
+            for region_name in self.region_names:
+                result, error = self._scan(region_name)
+                if error is not None:
+                    self._record_error(region_name, error)
+                else:
+                    yield region_name, result
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(self.region_names))) as executor:
+            # results are handed back in submission order, so the output is deterministic
+            futures = [clients.submit(executor, self._scan, region_name) for region_name in self.region_names]
+            for region_name, future in zip(self.region_names, futures):
+                result, error = future.result()
+                if error is not None:
+                    self._record_error(region_name, error)
+                else:
+                    yield region_name, result
+
+    @property
+    def parallel(self):
+        return self.workers > 1 and len(self.region_names) > 1
+
+    def report(self):
+        if len(self.errors) > 0:
+            print("Finished with errors in {n} of {total} regions: {names}".format(n=len(self.errors),
+                                                                                  total=len(self.region_names),
+                                                                                  names=", ".join(self.errors)))
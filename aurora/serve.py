@@ -0,0 +1,314 @@
+import json
+import time
+import hashlib
+import threading
+import click
+from aurora import (checkpoints, clients, discovery, history, options, pricing_cache, profiling, scan, snapshots,
+                    throttle)
+from aurora.options import client_options, history_options, pricing_options, scan_options
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_INTERVAL_MINUTES = 60
+FORMATS = ['json', 'csv']
+content_types = {'json': 'application/json', 'csv': 'text/csv; charset=utf-8'}
+
+
+def filter_report(report_df, services=(), regions=(), tags=None):
+    # tags maps a tag column to the values to keep (see parse_tags)
+    conditions = []
+    if len(services) > 0:
+        conditions.append(report_df['service'].isin(services))
+    if len(regions) > 0:
+        conditions.append(report_df['region_name'].isin(regions))
+    for key, values in (tags or dict()).items():
+        conditions.append(report_df[key].isin(values))
+    if len(conditions) == 0:
+        return report_df
+    mask = conditions[0]
+    for condition in conditions[1:]:
+        mask = mask & condition
+    return report_df[mask]
+
+
+def parse_tags(tag_filters, tag_keys):
+    # ['Team:maps', 'team:search'] -> {'Team': ['maps', 'search']}, tag keys are matched case-insensitively
+    tags = dict()
+    lower_keys = dict((key.lower(), key) for key in tag_keys)
+    for tag_filter in tag_filters:
+        key, sep, value = tag_filter.partition(':')
+        if sep == '' or key.strip().lower() not in lower_keys:
+            raise ValueError("tag must be KEY:VALUE with KEY one of {}".format(", ".join(tag_keys)))
+        tags.setdefault(lower_keys[key.strip().lower()], []).append(value)
+    return tags
+
+
+class CostTables(object):
+    """
+    The latest cost report served by aurora serve, replaced as a whole after every refresh.
+
+    A service that fails to refresh keeps its rows from the last refresh that succeeded, so a throttled scan never
+    blanks a dashboard. Every refresh gets a new etag, which the responses' ETags are derived from.
+    """
+
+    def __init__(self):
+        self.service_dfs = dict()
+        self.report_df = None
+        self.etag = None
+        self.updated_at = None
+        self.refreshes = 0
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def update(self, service_dfs, failed=(), run_id=None):
+        from aurora.cli import combine_reports
+        service_dfs = dict(service_dfs)
+        for service in failed:
+            if service in self.service_dfs:
+                service_dfs[service] = self.service_dfs[service]
+        report_df = combine_reports(service_dfs)
+        run_id = run_id if run_id is not None else checkpoints.make_run_id()
+        with self._lock:
+            self.service_dfs = service_dfs
+            self.report_df = report_df
+            self.etag = hashlib.sha1(run_id.encode('utf-8')).hexdigest()[:16]
+            self.updated_at = time.time()
+            self.refreshes += 1
+            self.failed = list(failed)
+
+    def get(self):
+        # (report_df, etag, updated_at), report_df is None until the first refresh has finished
+        with self._lock:
+            return self.report_df, self.etag, self.updated_at
+
+    def status(self):
+        with self._lock:
+            return {'refreshes': self.refreshes,
+                    'updated_at': self.updated_at,
+                    'failed': self.failed,
+                    'resources': dict((service, len(results_df)) for service, results_df in self.service_dfs.items())}
+
+
+class Refresher(threading.Thread):
+    """
+    Re-runs the inventory every interval seconds on a background thread and publishes the results to tables.
+
+    Everything the collectors cache in-process (the region registry, AWS clients and prices) stays warm between
+    refreshes; prices are re-read from the pricing cache once they are older than its TTL, and the regions worth
+    scanning (see aurora.discovery) are worked out again for every refresh.
+
+    A service that failed in any region counts as failed for the whole refresh: it keeps its last complete rows and
+    stays out of the cost history, rather than publishing and recording a partial inventory.
+    """
+
+    def __init__(self, tables, service_names, region_names, interval=DEFAULT_INTERVAL_MINUTES * 60, days=4,
+                 agg='min', workers=scan.DEFAULT_WORKERS, incremental=False, record_history=True,
+                 price_ttl=pricing_cache.DEFAULT_TTL_DAYS, checkpoint_root=checkpoints.DEFAULT_CHECKPOINT_DIR):
+        super(Refresher, self).__init__(name='aurora-refresh')
+        self.daemon = True
+        self.tables = tables
+        self.service_names = service_names
+        self.region_names = region_names
+        self.interval = interval
+        self.days = days
+        self.agg = agg
+        self.workers = workers
+        self.incremental = incremental
+        self.record_history = record_history
+        self.price_ttl = price_ttl
+        self.checkpoint_root = checkpoint_root
+        self.prices_loaded_at = time.time()
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        from aurora.cli import inventory_services
+        if time.time() - self.prices_loaded_at > self.price_ttl * 24 * 3600:
+            # drop the in-process prices so stale ones are fetched again
+            pricing_cache.configure(ttl_days=self.price_ttl)
+            self.prices_loaded_at = time.time()
+        # regions get enabled and emptied between refreshes, so look again every time
+        discovery.clear()
+        # refreshes are never resumed, the run's checkpoints are only there to tell which regions failed
+        run = checkpoints.Run(root=self.checkpoint_root)
+        run_id = run.run_id
+        run_at = time.time()
+        print("Refreshing {} (run {})".format(", ".join(self.service_names), run_id))
+        snapshot_store = snapshots.SnapshotStore()
+        service_snapshots = dict((service, snapshots.Snapshot(service, store=snapshot_store,
+                                                              incremental=self.incremental,
+                                                              global_listing=service == 's3'))
+                                 for service in self.service_names)
+        try:
+            with profiling.stage('serve.refresh'):
+                service_dfs, failed = inventory_services(self.service_names, self.region_names, service_snapshots,
+                                                         days=self.days, agg=self.agg, workers=self.workers,
+                                                         service_checkpoints=dict((service, run.checkpoint(service))
+                                                                                  for service in self.service_names))
+            partial = [service for service in run.failed_services() if service not in failed]
+        finally:
+            run.discard()
+        throttle.report()
+        if len(partial) > 0:
+            print("Warning: {} failed in some regions, keeping their last complete results".format(
+                ", ".join(partial)))
+            failed = failed + partial
+            service_dfs = dict((service, results_df) for service, results_df in service_dfs.items()
+                               if service not in partial)
+        snapshots.finish([service_snapshots[service] for service in self.service_names if service not in failed])
+        if self.record_history:
+            for service, results_df in service_dfs.items():
+                history.get_store().record(run_id, service, results_df, run_at=run_at)
+        self.tables.update(service_dfs, failed=failed, run_id=run_id)
+        print("Refreshed in {:.0f}s".format(time.time() - run_at))
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Warning: refresh failed ({error_type}: {error})".format(error_type=type(e).__name__, error=e))
+            # refreshes start interval seconds apart, or back to back when one takes longer than that
+            self.stopped.wait(max(0, self.interval - (time.time() - started)))
+
+    def stop(self):
+        self.stopped.set()
+
+
+def make_handler(tables):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import parse_qs, urlsplit
+    from aurora.ec2_info import tags_keys
+
+    class CostRequestHandler(BaseHTTPRequestHandler):
+        """
+        GET /costs[?service=ec2&region=us-east-1&tag=Team:maps&format=csv] serves the latest cost report (repeat a
+        parameter to match any of its values), GET /status reports on the refreshes.
+        """
+
+        def send_body(self, status, body, content_type='application/json', headers=()):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def send_error_json(self, status, message, headers=()):
+            self.send_body(status, json.dumps({'error': message}), headers=headers)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/status':
+                self.send_body(200, json.dumps(tables.status()))
+            elif url.path == '/costs':
+                self.get_costs(parse_qs(url.query))
+            else:
+                self.send_error_json(404, 'not found, try /costs or /status')
+
+        do_HEAD = do_GET
+
+        def get_costs(self, params):
+            report_df, etag, updated_at = tables.get()
+            if report_df is None:
+                self.send_error_json(503, 'the first refresh has not finished yet', headers=[('Retry-After', '60')])
+                return
+            fmt = params.get('format', ['json'])[-1]
+            if fmt not in FORMATS:
+                self.send_error_json(400, 'format must be one of {}'.format(", ".join(FORMATS)))
+                return
+            try:
+                tags = parse_tags(params.get('tag', []), tags_keys)
+            except ValueError as e:
+                self.send_error_json(400, str(e))
+                return
+            # the same query against the same refresh always gets the same answer
+            query = json.dumps(sorted((key, sorted(values)) for key, values in params.items()))
+            response_etag = '"{}-{}"'.format(etag, hashlib.sha1(query.encode('utf-8')).hexdigest()[:16])
+            headers = [('ETag', response_etag), ('Cache-Control', 'no-cache'),
+                       ('Last-Modified', self.date_time_string(updated_at))]
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match is not None and (if_none_match.strip() == '*' or response_etag in
+                                              [value.strip() for value in if_none_match.split(',')]):
+                self.send_response(304)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                return
+            results_df = filter_report(report_df, services=params.get('service', []),
+                                       regions=params.get('region', []), tags=tags)
+            if fmt == 'csv':
+                body = results_df.to_csv(index=False)
+            else:
+                body = results_df.to_json(orient='records')
+            self.send_body(200, body, content_type=content_types[fmt], headers=headers)
+
+    return CostRequestHandler
+
+
+def make_server(tables, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, port), make_handler(tables))
+    server.daemon_threads = True
+    return server
+
+
+@click.command()
+@click.option('--services', '-s', type=str, default='ec2,ebs,s3', show_default=True,
+              help='Comma separated list of services to inventory.')
+@click.option('--region', '-r', 'in_region', type=str, default='all', show_default=True,
+              help="Region code, or 'all'.")
+@click.option('--interval', type=float, default=DEFAULT_INTERVAL_MINUTES, show_default=True,
+              help='Minutes between the start of one refresh and the next.')
+@click.option('--host', type=str, default=DEFAULT_HOST, show_default=True, help='Address to listen on.')
+@click.option('--port', type=int, default=DEFAULT_PORT, show_default=True, help='Port to listen on.')
+@click.option('--days', '-d', type=int, default=4, show_default=True,
+              help='S3: days of CloudWatch metrics to aggregate.')
+@click.option('--agg', '-a', type=click.Choice(['min', 'max', 'mean']), default='min', show_default=True,
+              help='S3: how to aggregate the daily bucket sizes.')
+@click.option('--incremental', is_flag=True, default=False,
+              help='Only enrich and price resources that are new or changed since the previous refresh.')
+@history_options
+@pricing_options
+@scan_options
+@client_options
+def main(services='ec2,ebs,s3', in_region='all', interval=DEFAULT_INTERVAL_MINUTES, host=DEFAULT_HOST,
+         port=DEFAULT_PORT, days=4, agg='min', incremental=False, record_history=True, refresh_prices=False,
+         price_ttl=pricing_cache.DEFAULT_TTL_DAYS, workers=scan.DEFAULT_WORKERS,
+         max_pool_connections=clients.DEFAULT_MAX_POOL_CONNECTIONS, max_attempts=clients.DEFAULT_MAX_ATTEMPTS,
+         discover=True):
+    """
+    Keep the EC2, EBS and S3 cost tables up to date in the background and serve them over HTTP.
+
+    GET /costs returns the latest combined cost report (format=json or csv), filtered by the service, region and
+    tag (KEY:VALUE) parameters, with an ETag so unchanged results cost a 304. GET /status reports on the refreshes.
+    Readers never trigger a scan.
+    """
+    import tools
+    from aurora.cli import parse_services
+    service_names = parse_services(services)
+    region_names = tools.resolve_regions(in_region)
+
+    options.configure(price_ttl=price_ttl, refresh_prices=refresh_prices, max_pool_connections=max_pool_connections,
+                      max_attempts=max_attempts, discover=discover)
+    tables = CostTables()
+    refresher = Refresher(tables, service_names, region_names, interval=interval * 60, days=days, agg=agg,
+                          workers=workers, incremental=incremental, record_history=record_history,
+                          price_ttl=price_ttl)
+    server = make_server(tables, host=host, port=port)
+    print("Serving cost tables on http://{}:{}/costs".format(host, server.server_address[1]))
+    refresher.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        refresher.stop()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
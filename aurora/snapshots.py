@@ -0,0 +1,153 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+from aurora import pricing_cache, store
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(pricing_cache.DEFAULT_CACHE_DIR, 'snapshots.sqlite')
+CHANGES = ['added', 'removed', 'changed']
+diff_keys = ['service', 'change', 'resource_id', 'region_name']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    service TEXT NOT NULL,
+    resource_id TEXT NOT NULL,
+    region_name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    record TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (service, resource_id)
+)
+"""
+
+
+def make_fingerprint(*values):
+    # stable hash of whatever identifies a resource's cost (type, size, state, platform, tags, ...)
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class SnapshotStore(store.SQLiteStore):
+    """
+    SQLite file holding the resources seen by the previous run of each service, keyed by (service, resource_id).
+
+    Each resource is stored with its region, a fingerprint of the attributes that affect its cost and the record
+    that was written out for it, so an unchanged resource can be carried forward without re-enriching it.
+    """
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH):
+        super(SnapshotStore, self).__init__(path)
+
+    def load(self, service):
+        # resource_id -> (region_name, fingerprint, record json), records are only decoded when they are used
+        with self._lock:
+            rows = self._connect().execute('SELECT resource_id, region_name, fingerprint, record FROM resources '
+                                           'WHERE service = ?', (service,)).fetchall()
+        return {resource_id: (region_name, fingerprint, record)
+                for resource_id, region_name, fingerprint, record in rows}
+
+    def replace(self, service, region_names, resources):
+        # resources is resource_id -> (region_name, fingerprint, record json)
+        # swap the stored resources of these regions (all regions when region_names is None) for the new ones
+        with self._lock:
+            conn = self._connect()
+            if region_names is None:
+                conn.execute('DELETE FROM resources WHERE service = ?', (service,))
+            else:
+                conn.executemany('DELETE FROM resources WHERE service = ? AND region_name = ?',
+                                 [(service, region_name) for region_name in region_names])
+            now = time.time()
+            conn.executemany('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?)',
+                             [(service, resource_id, region_name, fingerprint, record, now)
+                              for resource_id, (region_name, fingerprint, record) in resources.items()])
+            conn.commit()
+
+
+class Snapshot(object):
+    """
+    One run's view of a service's snapshot.
+
+    Collectors call lookup() to get the previous record of an unchanged resource (only when incremental), add() for
+    every resource they find and mark_done() once a region has been fully listed. commit() then works out what was
+    added, removed or changed since the previous run and stores this run as the new snapshot. Resources in regions
+    that were not listed (skipped or failed) are left untouched rather than reported as removed.
+    """
+
+    def __init__(self, service, store=None, incremental=False, global_listing=False):
+        self.service = service
+        self.store = store if store is not None else SnapshotStore()
+        self.incremental = incremental
+        # for services like s3 where one listing covers every region
+        self.global_listing = global_listing
+        self.previous = self.store.load(service)
+        self.current = dict()
+        self.done = set()
+        self.carried = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, resource_id, fingerprint):
+        if not self.incremental:
+            return None
+        previous = self.previous.get(resource_id)
+        if previous is None or previous[1] != fingerprint:
+            return None
+        with self._lock:
+            self.carried += 1
+        return json.loads(previous[2])
+
+    def add(self, region_name, resource_id, fingerprint, record):
+        # kept as json text, a fraction of the size of the record itself for the whole run
+        record = json.dumps(record, default=str)
+        with self._lock:
+            self.current[resource_id] = (region_name, fingerprint, record)
+
+    def mark_done(self, region_name):
+        with self._lock:
+            self.done.add(region_name)
+
+    def diff(self):
+        diff_rows = []
+        for resource_id, (region_name, fingerprint, _) in self.current.items():
+            previous = self.previous.get(resource_id)
+            if previous is None:
+                diff_rows.append({'change': 'added', 'resource_id': resource_id, 'region_name': region_name})
+            elif previous[1] != fingerprint or previous[0] != region_name:
+                diff_rows.append({'change': 'changed', 'resource_id': resource_id, 'region_name': region_name})
+        for resource_id, (region_name, _, _) in self.previous.items():
+            if resource_id not in self.current and (self.global_listing or region_name in self.done):
+                diff_rows.append({'change': 'removed', 'resource_id': resource_id, 'region_name': region_name})
+        for diff_row in diff_rows:
+            diff_row['service'] = self.service
+        diff_rows.sort(key=lambda row: (CHANGES.index(row['change']), row['region_name'], row['resource_id']))
+        return diff_rows
+
+    def commit(self):
+        diff_rows = self.diff()
+        self.store.replace(self.service, None if self.global_listing else sorted(self.done), self.current)
+        return diff_rows
+
+
+def finish(snapshot_list, diff_report=None):
+    # store every service's new snapshot, print what changed and optionally write the diff report
+    diff_rows = []
+    for snapshot in snapshot_list:
+        service_rows = snapshot.commit()
+        counts = dict((change, len([row for row in service_rows if row['change'] == change])) for change in CHANGES)
+        print("{service}: {added} added, {removed} removed, {changed} changed since the last run "
+              "({carried} unchanged carried forward)".format(service=snapshot.service, carried=snapshot.carried,
+                                                             **counts))
+        diff_rows.extend(service_rows)
+    if diff_report is not None:
+        write_report(diff_rows, diff_report)
+    return diff_rows
+
+
+def write_report(diff_rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=diff_keys)
+        writer.writeheader()
+        for diff_row in diff_rows:
+            writer.writerow(diff_row)
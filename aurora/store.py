@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore(object):
+    """
+    Base for the SQLite files aurora keeps under its cache directory (e.g. the price cache and the snapshots).
+
+    Subclasses set SCHEMA. The file, its directory and its tables are created on first use, and the one connection
+    is shared by every thread, so subclasses hold self._lock whenever they use it.
+    """
+
+    SCHEMA = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            if self.path != ':memory:':
+                store_dir = os.path.dirname(os.path.abspath(self.path))
+                if not os.path.isdir(store_dir):
+                    os.makedirs(store_dir)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(self.SCHEMA)
+            self._conn.commit()
+        return self._conn
+
+
+class DefaultStore(object):
+    """
+    Holds the process-wide instance of a store class, behind each module's configure() and get_*() functions.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.store = None
+        self._lock = threading.Lock()
+
+    def configure(self, *args, **kwargs):
+        # replace the process-wide store, e.g. with the one the cli options ask for
+        with self._lock:
+            self.store = self.factory(*args, **kwargs)
+            return self.store
+
+    def set(self, store):
+        with self._lock:
+            self.store = store
+
+    def get(self):
+        # the process-wide store, created with the factory's defaults on first use
+        if self.store is None:
+            with self._lock:
+                if self.store is None:
+                    self.store = self.factory()
+        return self.store
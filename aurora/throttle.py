@@ -0,0 +1,180 @@
+import time
+import random
+import threading
+
+THROTTLING_ERROR_CODES = ('Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+                          'TooManyRequestsException', 'RequestLimitExceeded', 'RequestThrottled', 'SlowDown')
+# errors worth another try that aren't throttling, the same ones botocore's own retries treat as transient
+TRANSIENT_ERROR_CODES = ('RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete', 'InternalError',
+                         'InternalFailure', 'ServiceUnavailable')
+TRANSIENT_STATUS_CODES = (500, 502, 503, 504)
+# starting calls per second for the APIs that throttle us during all-region runs
+DEFAULT_RATES = {'pricing': 10.0, 'cloudwatch': 20.0}
+DEFAULT_RATE = 10.0
+# without any throttling the rate keeps climbing up to this multiple of the starting rate
+MAX_RATE_FACTOR = 4
+DEFAULT_MAX_RETRIES = 8
+MAX_BACKOFF_SECONDS = 20.0
+
+
+def is_throttling_error(error):
+    import botocore.exceptions
+    return (isinstance(error, botocore.exceptions.ClientError) and
+            error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES)
+
+
+def is_transient_error(error):
+    # 5xx responses, and connections that failed or timed out before we got a response at all
+    import botocore.exceptions
+    if isinstance(error, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return True
+    return (isinstance(error, botocore.exceptions.ClientError) and
+            (error.response.get('Error', {}).get('Code') in TRANSIENT_ERROR_CODES or
+             error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') in TRANSIENT_STATUS_CODES))
+
+
+class AdaptiveRateLimiter(object):
+    """
+    Token bucket whose refill rate adapts to throttling.
+
+    Every throttled call halves the rate (down to min_rate) and every successful call nudges it back up towards
+    max_rate, so concurrent callers settle at roughly what the account quota allows.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, max_rate=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.max_rate = float(max_rate if max_rate is not None else rate)
+        self.min_rate = float(min_rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            # drop any saved up burst so the lower rate takes effect right away
+            self.tokens = min(self.tokens, 0)
+
+
+class ThrottleStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.throttles = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def add(self, calls=0, throttles=0, retries=0):
+        with self._lock:
+            self.calls += calls
+            self.throttles += throttles
+            self.retries += retries
+
+
+class RateLimitedCaller(object):
+    """
+    Common wrapper for calls to throttle-prone APIs: waits on a per-API rate limiter, retries throttling and transient
+    errors with jittered exponential backoff, and keeps call/throttle/retry counts per API.
+
+    The clients for these APIs make a single attempt per call (see clients.THROTTLED_SERVICES), so this is the only
+    place their calls are retried. Only throttling slows the limiter down.
+    """
+
+    def __init__(self, rates=None, max_retries=DEFAULT_MAX_RETRIES, sleep=time.sleep, clock=time.time):
+        self.rates = dict(DEFAULT_RATES)
+        if rates is not None:
+            self.rates.update(rates)
+        self.max_retries = max_retries
+        self._sleep = sleep
+        self._clock = clock
+        self._limiters = dict()
+        self._stats = dict()
+        self._lock = threading.Lock()
+
+    def get_limiter(self, api):
+        with self._lock:
+            if api not in self._limiters:
+                rate = self.rates.get(api, DEFAULT_RATE)
+                self._limiters[api] = AdaptiveRateLimiter(rate, max_rate=rate * MAX_RATE_FACTOR,
+                                                          clock=self._clock, sleep=self._sleep)
+                self._stats[api] = ThrottleStats()
+            return self._limiters[api]
+
+    def get_stats(self, api):
+        self.get_limiter(api)
+        return self._stats[api]
+
+    def call(self, api, func, **kwargs):
+        limiter = self.get_limiter(api)
+        stats = self._stats[api]
+        attempt = 0
+        while True:
+            limiter.acquire()
+            stats.add(calls=1)
+            try:
+                result = func(**kwargs)
+            except Exception as e:
+                if is_throttling_error(e):
+                    stats.add(throttles=1)
+                    limiter.on_throttle()
+                elif not is_transient_error(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                stats.add(retries=1)
+                self._sleep(random.uniform(0, min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt)))
+                attempt += 1
+            else:
+                limiter.on_success()
+                return result
+
+    def report(self):
+        for api in sorted(self._stats):
+            stats = self._stats[api]
+            if stats.throttles > 0:
+                print("{api}: {calls} calls, throttled {throttles} times, {retries} retries".format(
+                    api=api, calls=stats.calls, throttles=stats.throttles, retries=stats.retries))
+
+
+_default_caller = None
+_default_caller_lock = threading.Lock()
+
+
+def get_caller():
+    global _default_caller
+    if _default_caller is None:
+        with _default_caller_lock:
+            if _default_caller is None:
+                _default_caller = RateLimitedCaller()
+    return _default_caller
+
+
+def call(api, func, **kwargs):
+    # e.g. throttle.call('pricing', pricing.get_products, ServiceCode='AmazonEC2', Filters=filters)
+    return get_caller().call(api, func, **kwargs)
+
+
+def report():
+    get_caller().report()
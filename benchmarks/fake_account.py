@@ -0,0 +1,200 @@
+import json
+import time
+import random
+import datetime
+import threading
+
+# (instance type, Linux usd per hour); Windows is priced at twice that
+instance_prices = [('t3.micro', 0.0104), ('t3.large', 0.0832), ('m5.large', 0.096), ('m5.xlarge', 0.192),
+                   ('m5.4xlarge', 0.768), ('c5.xlarge', 0.17), ('c5.9xlarge', 1.53), ('r5.2xlarge', 0.504),
+                   ('p3.2xlarge', 3.06), ('x1.16xlarge', 6.669)]
+volume_type_codes = ['gp2', 'gp2', 'gp2', 'io1', 'st1', 'sc1', 'standard']
+# standard storage tiers: first 50 TB, next 450 TB, over 500 TB
+s3_tiers = [(0, 51200, 0.023), (51200, 512000, 0.022), (512000, 'Inf', 0.021)]
+storage_types = ['StandardStorage', 'StandardIAStorage', 'GlacierStorage']
+
+
+def make_price_item(usd, tiers=None, **attributes):
+    if tiers is None:
+        tiers = [(0, 'Inf', usd)]
+    price_dims = dict(('DIM.{}'.format(i), {'beginRange': str(begin), 'endRange': str(end),
+                                            'pricePerUnit': {'USD': str(tier_usd)}})
+                      for i, (begin, end, tier_usd) in enumerate(tiers))
+    return json.dumps({'product': {'attributes': attributes},
+                       'terms': {'OnDemand': {'TERM.1': {'priceDimensions': price_dims}}}})
+
+
+def _error(code, message, status=400):
+    from botocore.awsrequest import AWSResponse
+    return AWSResponse('', status, {}, None), {'Error': {'Code': code, 'Message': message},
+                                               'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+class FakeAccount(object):
+    """
+    A synthetic AWS account served in-process from botocore's before-call event, so no request leaves the machine.
+
+    install() hooks a boto3 session; every call made by that session's clients is answered from the generated
+    instances, volumes and buckets, optionally after sleeping for latency seconds to stand in for the network.
+    Calls are counted per (service, operation).
+    """
+
+    def __init__(self, region_names, n_instances=20000, n_volumes=50000, n_buckets=5000, latency=0.0,
+                 forbidden_bucket_rate=0.01, seed=0):
+        rng = random.Random(seed)
+        self.region_names = list(region_names)
+        self.latency = latency
+        self.calls = dict()
+        self.assumed_roles = []
+        self._lock = threading.Lock()
+
+        self.instances = dict((region_name, []) for region_name in self.region_names)
+        for i in range(n_instances):
+            region_name = self.region_names[i % len(self.region_names)]
+            instance = {'InstanceId': 'i-{:017x}'.format(i),
+                        'InstanceType': rng.choice(instance_prices)[0],
+                        'State': {'Code': 16, 'Name': 'running'},
+                        'KeyName': 'key-{}'.format(i % 7),
+                        'LaunchTime': datetime.datetime(2019, 1, 1) + datetime.timedelta(hours=i),
+                        'Placement': {'AvailabilityZone': region_name + 'a', 'Tenancy': 'default'},
+                        'SubnetId': 'subnet-{:08x}'.format(i % 97),
+                        'VpcId': 'vpc-{:08x}'.format(i % 13),
+                        'Architecture': 'x86_64',
+                        'Tags': [{'Key': 'Name', 'Value': 'instance-{}'.format(i)},
+                                 {'Key': 'Team', 'Value': 'team-{}'.format(i % 11)},
+                                 {'Key': 'Creator', 'Value': 'user-{}'.format(i % 29)}]}
+            if rng.random() < 0.1:
+                instance['Platform'] = 'windows'
+            self.instances[region_name].append(instance)
+
+        self.volumes = dict((region_name, []) for region_name in self.region_names)
+        for i in range(n_volumes):
+            region_name = self.region_names[i % len(self.region_names)]
+            region_instances = self.instances[region_name]
+            attachments = []
+            if len(region_instances) > 0 and rng.random() < 0.8:
+                attachments = [{'InstanceId': rng.choice(region_instances)['InstanceId'], 'State': 'attached'}]
+            self.volumes[region_name].append({'VolumeId': 'vol-{:017x}'.format(i),
+                                              'VolumeType': rng.choice(volume_type_codes),
+                                              'Size': rng.choice([8, 20, 100, 500, 1000, 4000]),
+                                              'State': 'in-use' if len(attachments) > 0 else 'available',
+                                              'Attachments': attachments})
+
+        self.buckets = []
+        self.bucket_regions = dict()
+        self.forbidden_buckets = set()
+        for i in range(n_buckets):
+            bucket_name = 'bucket-{:06d}'.format(i)
+            self.buckets.append({'Name': bucket_name, 'CreationDate': datetime.datetime(2018, 1, 1)})
+            self.bucket_regions[bucket_name] = rng.choice(self.region_names)
+            if rng.random() < forbidden_bucket_rate:
+                self.forbidden_buckets.add(bucket_name)
+        self.bucket_sizes = dict(((bucket_name, storage_type), rng.uniform(1e6, 5e13))
+                                 for bucket_name in self.bucket_regions for storage_type in storage_types
+                                 if storage_type == 'StandardStorage' or rng.random() < 0.3)
+
+    def install(self, session):
+        # session is a boto3 session, e.g. aurora.clients.get_pool().session
+        session.events.register('before-parameter-build', self._capture_params)
+        session.events.register('before-call', self._handle)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = dict()
+
+    def _capture_params(self, params, context, **kwargs):
+        # before-call only sees the serialized request, so keep the api parameters for the handler
+        context['fake_params'] = dict(params)
+
+    def _handle(self, model, context, **kwargs):
+        from botocore.awsrequest import AWSResponse
+        service_name = model.service_model.service_name
+        with self._lock:
+            key = (service_name, model.name)
+            self.calls[key] = self.calls.get(key, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        handler = getattr(self, '_' + model.name, None)
+        if handler is None:
+            return _error('UnsupportedOperation', 'not faked: {}.{}'.format(service_name, model.name))
+        result = handler(context.get('fake_params', {}), context.get('client_region'))
+        if isinstance(result, tuple):
+            return result
+        return AWSResponse('', 200, {}, None), result
+
+    @staticmethod
+    def _page(items, params, key, default_size):
+        start = int(params.get('NextToken') or 0)
+        size = params.get('MaxResults') or default_size
+        response = {key: items[start:start + size]}
+        if start + size < len(items):
+            response['NextToken'] = str(start + size)
+        return response
+
+    def _GetProducts(self, params, region_name):
+        filters = dict((f['Field'], f['Value']) for f in params.get('Filters', []))
+        if params['ServiceCode'] == 'AmazonS3':
+            return {'PriceList': [make_price_item(None, tiers=s3_tiers)]}
+        if 'volumeType' in filters:
+            return {'PriceList': [make_price_item(0.1)]}
+        price_list = []
+        for instance_type, usd in instance_prices:
+            for platform, factor in (('Linux', 1), ('Windows', 2)):
+                if filters.get('instanceType', instance_type) == instance_type and \
+                        filters.get('operatingSystem', platform) == platform:
+                    price_list.append(make_price_item(usd * factor, instanceType=instance_type,
+                                                      operatingSystem=platform))
+        return self._page(price_list, params, 'PriceList', 100)
+
+    def _DescribeInstances(self, params, region_name):
+        instances = self.instances.get(region_name, [])
+        instance_ids = set(params.get('InstanceIds', []))
+        for f in params.get('Filters', []):
+            if f['Name'] == 'instance-id':
+                instance_ids.update(f['Values'])
+        if len(instance_ids) > 0:
+            return {'Reservations': [{'Instances': [instance for instance in instances
+                                                    if instance['InstanceId'] in instance_ids]}]}
+        response = self._page(instances, params, 'Instances', 1000)
+        # one reservation per page is enough for the collectors
+        response['Reservations'] = [{'Instances': response.pop('Instances')}]
+        return response
+
+    def _DescribeVolumes(self, params, region_name):
+        return self._page(self.volumes.get(region_name, []), params, 'Volumes', 500)
+
+    def _DescribeRegions(self, params, region_name):
+        # the account has enabled exactly the regions it was made with
+        return {'Regions': [{'RegionName': name, 'OptInStatus': 'opt-in-not-required'} for name in self.region_names]}
+
+    def _ListBuckets(self, params, region_name):
+        return {'Buckets': list(self.buckets)}
+
+    def _HeadBucket(self, params, region_name):
+        if params['Bucket'] in self.forbidden_buckets:
+            return _error('403', 'Forbidden', status=403)
+        return {'ResponseMetadata': {'HTTPHeaders': {'x-amz-bucket-region': self.bucket_regions[params['Bucket']]}}}
+
+    def _GetBucketLocation(self, params, region_name):
+        if params['Bucket'] in self.forbidden_buckets:
+            return _error('AccessDenied', 'Access Denied', status=403)
+        bucket_region = self.bucket_regions[params['Bucket']]
+        return {'LocationConstraint': None if bucket_region == 'us-east-1' else bucket_region}
+
+    def _AssumeRole(self, params, region_name):
+        # every role leads back to this same account, only the credentials differ
+        with self._lock:
+            self.assumed_roles.append(params['RoleArn'])
+            n = len(self.assumed_roles)
+        return {'Credentials': {'AccessKeyId': 'ASIAFAKE{:012d}'.format(n), 'SecretAccessKey': 'fake',
+                                'SessionToken': 'fake-{}'.format(n),
+                                'Expiration': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+                                    seconds=params.get('DurationSeconds', 3600))}}
+
+    def _GetMetricData(self, params, region_name):
+        results = []
+        for query in params['MetricDataQueries']:
+            dimensions = dict((d['Name'], d['Value']) for d in query['MetricStat']['Metric']['Dimensions'])
+            size = self.bucket_sizes.get((dimensions['BucketName'], dimensions['StorageType']))
+            results.append({'Id': query['Id'], 'Values': [] if size is None else [size, size * 1.01]})
+        return {'MetricDataResults': results}
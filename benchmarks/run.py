@@ -0,0 +1,156 @@
+"""
+Scale benchmarks for the ec2, ebs and s3 collectors against a synthetic account (see fake_account.py).
+
+    python -m benchmarks.run --out benchmarks/results.json
+
+Every collector runs with a cold pricing cache and reports wall time, API calls per operation and peak memory
+(tracemalloc, which itself slows the run down somewhat, so compare runs made with the same settings).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import datetime
+import tracemalloc
+import subprocess
+import contextlib
+import click
+
+# the collectors only ever talk to the fake account, but botocore still wants credentials and a default region
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import tools
+from aurora import clients, pricing_cache, scan
+from benchmarks.fake_account import FakeAccount
+
+COLLECTORS = ['ec2', 'ebs', 's3']
+COMPARED_METRICS = ['wall_seconds', 'total_api_calls', 'peak_memory_mb']
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_collector(collector, region_names, workers):
+    from aurora import ec2_info, ebs_info, s3_info
+    if collector == 'ec2':
+        return ec2_info.collect(region_names, workers=workers)
+    elif collector == 'ebs':
+        return ebs_info.collect(region_names, workers=workers)
+    else:
+        return s3_info.collect(region_names, workers=workers)
+
+
+def measure(collector, account, region_names, workers, cache_dir, verbose=False):
+    # a fresh pricing cache and client pool so every collector starts cold
+    pricing_cache.configure(path=os.path.join(cache_dir, '{}.sqlite'.format(collector)))
+    clients.get_pool().clear()
+    account.reset_calls()
+    devnull = open(os.devnull, 'w')
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else devnull), \
+                contextlib.redirect_stderr(sys.stderr if verbose else devnull):
+            tracemalloc.start()
+            start = time.time()
+            results_df = run_collector(collector, region_names, workers)
+            wall_seconds = time.time() - start
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        devnull.close()
+    api_calls = dict(('{}.{}'.format(service_name, operation_name), n)
+                     for (service_name, operation_name), n in sorted(account.calls.items()))
+    return {'wall_seconds': round(wall_seconds, 3),
+            'peak_memory_mb': round(peak_bytes / 1e6, 1),
+            'rows': len(results_df),
+            'api_calls': api_calls,
+            'total_api_calls': sum(api_calls.values())}
+
+
+def compare(baseline, results):
+    if baseline.get('settings') != results['settings']:
+        print("Warning: the baseline was run with different settings ({})".format(baseline.get('settings')))
+    for collector, collector_results in sorted(results['collectors'].items()):
+        previous = baseline.get('collectors', {}).get(collector)
+        if previous is None:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            if previous[metric] > 0:
+                changes.append("{metric} {change:+.1f}%".format(
+                    metric=metric, change=100.0 * (collector_results[metric] - previous[metric]) / previous[metric]))
+        print("{collector} vs {revision}: {changes}".format(collector=collector, revision=baseline.get('revision'),
+                                                            changes=", ".join(changes)))
+
+
+@click.command()
+@click.option('--out', '-o', type=click.Path(dir_okay=False), default='benchmark_results.json', show_default=True,
+              help='JSON file to write the results to.')
+@click.option('--collectors', '-c', type=str, default=','.join(COLLECTORS), show_default=True,
+              help='Comma separated list of collectors to benchmark.')
+@click.option('--instances', type=int, default=20000, show_default=True)
+@click.option('--volumes', type=int, default=50000, show_default=True)
+@click.option('--buckets', type=int, default=5000, show_default=True)
+@click.option('--regions', 'n_regions', type=int, default=16, show_default=True,
+              help='Number of regions the resources are spread over.')
+@click.option('--latency', type=float, default=0.01, show_default=True,
+              help='Seconds each fake API call takes.')
+@click.option('--workers', '-w', type=int, default=scan.DEFAULT_WORKERS, show_default=True)
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('--baseline', '-b', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Results JSON from an earlier run to compare against.')
+@click.option('--verbose', '-v', is_flag=True, default=False, help="Show the collectors' own output.")
+def main(out, collectors=','.join(COLLECTORS), instances=20000, volumes=50000, buckets=5000, n_regions=16,
+         latency=0.01, workers=scan.DEFAULT_WORKERS, seed=0, baseline=None, verbose=False):
+    collector_names = [c.strip() for c in collectors.split(',') if c.strip() != '']
+    unknown = [c for c in collector_names if c not in COLLECTORS]
+    if len(unknown) > 0:
+        raise click.BadParameter("unknown collectors: {}".format(", ".join(unknown)), param_hint='--collectors')
+
+    region_names = tools.get_all_regions()[:n_regions]
+    print("Generating account: {i} instances, {v} volumes, {b} buckets across {r} regions".format(
+        i=instances, v=volumes, b=buckets, r=len(region_names)))
+    account = FakeAccount(region_names, n_instances=instances, n_volumes=volumes, n_buckets=buckets,
+                          latency=latency, seed=seed)
+    account.install(clients.get_pool().session)
+
+    results = {'revision': git_revision(),
+               'timestamp': datetime.datetime.utcnow().isoformat(),
+               'python': platform.python_version(),
+               'settings': {'instances': instances, 'volumes': volumes, 'buckets': buckets,
+                            'regions': len(region_names), 'latency': latency, 'workers': workers, 'seed': seed},
+               'collectors': dict()}
+    # import everything up front so the import cost doesn't count towards the first collector's time and memory
+    import pandas
+    import tqdm
+    from aurora import ec2_info, ebs_info, s3_info
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for collector in collector_names:
+            collector_results = measure(collector, account, region_names, workers, cache_dir, verbose=verbose)
+            print("{collector}: {wall_seconds}s, {total_api_calls} api calls, peak memory {peak_memory_mb} MB, "
+                  "{rows} rows".format(collector=collector, **collector_results))
+            results['collectors'][collector] = collector_results
+    finally:
+        shutil.rmtree(cache_dir)
+
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print("Wrote {}".format(out))
+
+    if baseline is not None:
+        with open(baseline, 'r') as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
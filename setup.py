@@ -38,16 +38,20 @@ setup(
         'console_scripts': [
             's3_info=aurora.s3_info:main',
             'ec2_info=aurora.ec2_info:main',
-            'ebs_info=aurora.ebs_info:main'
+            'ebs_info=aurora.ebs_info:main',
+            'pricing_api_info=aurora.pricing_api_info:main',
+            'aurora=aurora.cli:main'
         ],
     },
     install_requires=requirements,
+    extras_require={'parquet': ['pyarrow'], 'offers': ['ijson']},
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
     keywords='aurora',
     name='aurora',
     packages=find_packages(include=['aurora']),
+    py_modules=['tools'],
     setup_requires=setup_requirements,
     test_suite='tests',
     tests_require=test_requirements,
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the multi-account inventory."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto3.session
+
+from aurora import accounts, cli, clients, pricing_cache, snapshots
+from benchmarks.fake_account import FakeAccount
+
+
+class TestManifest(unittest.TestCase):
+    """Tests for `aurora.accounts.load_manifest`."""
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.out_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('accounts.csv', "account_id,role_arn,regions\n"
+                                          "# the account running the inventory\n"
+                                          "111111111111,,\n"
+                                          "222222222222,arn:aws:iam::222222222222:role/inventory,us-east-1;eu-west-1\n")
+        account_list = accounts.load_manifest(path)
+        self.assertEqual([account.account_id for account in account_list], ['111111111111', '222222222222'])
+        self.assertIsNone(account_list[0].role_arn)
+        self.assertIsNone(account_list[0].region_names)
+        self.assertEqual(account_list[1].region_names, ['us-east-1', 'eu-west-1'])
+
+    def test_json_duplicates(self):
+        path = self.write('accounts.json', '[{"account_id": "222222222222", "role_arn": "arn:a"}, '
+                                           '{"account_id": "222222222222", "role_arn": "arn:b"}]')
+        with self.assertRaises(ValueError):
+            accounts.load_manifest(path)
+
+
+class TestInventoryAccounts(unittest.TestCase):
+    """Runs `aurora.cli.inventory_accounts` against `benchmarks.fake_account.FakeAccount` standing in for STS too."""
+
+    region_names = ['us-east-1', 'us-west-2']
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        pricing_cache.configure(path=os.path.join(self.cache_dir, 'prices.sqlite'))
+        session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                        region_name='us-east-1')
+        self.account = FakeAccount(self.region_names, n_instances=40, n_volumes=10, n_buckets=4)
+        self.account.install(session)
+        clients.configure(session=session)
+        accounts.clear()
+
+    def tearDown(self):
+        accounts.clear()
+        clients.configure(session=boto3.session.Session())
+        pricing_cache.configure()
+        shutil.rmtree(self.cache_dir)
+
+    def test_results_are_merged_with_account_ids(self):
+        account_list = [accounts.Account('111111111111'),
+                        accounts.Account('222222222222', role_arn='arn:aws:iam::222222222222:role/inventory',
+                                         region_names=['us-west-2'])]
+        service_dfs, failed, finished_snapshots = cli.inventory_accounts(
+            account_list, ['ec2', 'ebs'], self.region_names, snapshots.SnapshotStore(':memory:'), workers=2)
+        self.assertEqual(failed, [])
+        ec2_df = service_dfs['ec2']
+        self.assertEqual(list(ec2_df.columns[:1]), ['account_id'])
+        self.assertEqual(ec2_df.groupby('account_id').size().to_dict(), {'111111111111': 40, '222222222222': 20})
+        self.assertEqual(set(ec2_df.loc[ec2_df['account_id'] == '222222222222', 'region_name']), {'us-west-2'})
+        self.assertEqual(set(service_dfs['ebs']['account_id']), {'111111111111', '222222222222'})
+        # one role assumed for the whole run, shared by both services and every region
+        self.assertEqual(self.account.assumed_roles, ['arn:aws:iam::222222222222:role/inventory'])
+        self.assertEqual(sorted(snapshot.service for snapshot in finished_snapshots),
+                         ['ebs:111111111111', 'ebs:222222222222', 'ec2:111111111111', 'ec2:222222222222'])
+
+    def test_account_pool_uses_assumed_credentials(self):
+        pool = accounts.get_account_pool(accounts.Account('222222222222', role_arn='arn:aws:iam::222222222222:role/x'))
+        self.assertIs(accounts.get_account_pool(accounts.Account('222222222222',
+                                                                 role_arn='arn:aws:iam::222222222222:role/x')), pool)
+        credentials = pool.session.get_credentials().get_frozen_credentials()
+        self.assertTrue(credentials.access_key.startswith('ASIAFAKE'))
+        # prices don't depend on the account
+        self.assertIs(pool.get_client('pricing', region_name='us-east-1'),
+                      clients.get_default_pool().get_client('pricing', region_name='us-east-1'))
+        with clients.using_pool(pool):
+            self.assertIs(clients.get_pool(), pool)
+        self.assertIs(clients.get_pool(), clients.get_default_pool())
+
+
+    def test_account_s3_clients(self):
+        # s3 clients get boto3's transfer methods injected, which must only happen once per client class
+        pool = accounts.get_account_pool(accounts.Account('222222222222', role_arn='arn:aws:iam::222222222222:role/x'))
+        s3 = pool.get_client('s3', region_name='us-east-1')
+        self.assertTrue(hasattr(s3, 'upload_file'))
+        self.assertEqual(len(s3.list_buckets()['Buckets']), 4)
+        self.assertEqual(self.account.calls[('s3', 'ListBuckets')], 1)
+
+    def test_s3_inventory_of_an_assumed_role_account(self):
+        account_list = [accounts.Account('222222222222', role_arn='arn:aws:iam::222222222222:role/inventory')]
+        service_dfs, failed, _ = cli.inventory_accounts(account_list, ['s3'], self.region_names,
+                                                        snapshots.SnapshotStore(':memory:'), workers=2)
+        self.assertEqual(failed, [])
+        self.assertEqual(service_dfs['s3']['bucket_name'].nunique(), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,6 @@
 import unittest
 from click.testing import CliRunner
 
-from aurora import aurora
 from aurora import cli
 
 
@@ -26,9 +25,10 @@ class TestAurora(unittest.TestCase):
     def test_command_line_interface(self):
         """Test the CLI."""
         runner = CliRunner()
-        result = runner.invoke(cli.main)
-        assert result.exit_code == 0
-        assert 'aurora.cli.main' in result.output
         help_result = runner.invoke(cli.main, ['--help'])
         assert help_result.exit_code == 0
+        assert 'inventory' in help_result.output
         assert '--help  Show this message and exit.' in help_result.output
+        inventory_help = runner.invoke(cli.main, ['inventory', '--help'])
+        assert inventory_help.exit_code == 0
+        assert '--services' in inventory_help.output
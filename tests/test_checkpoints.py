@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for run checkpoints and resuming."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import click
+
+from aurora import checkpoints, scan
+
+
+class TestRun(unittest.TestCase):
+    """Tests for `aurora.checkpoints.Run`."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_resume_sees_saved_units(self):
+        run = checkpoints.Run(root=self.root)
+        checkpoint = run.checkpoint('ec2')
+        checkpoint.save('us-east-1', ['i-1', 'i-2'])
+        checkpoint.save('us-west-2', ['i-3'], done=False)
+        checkpoint.fail('eu-west-1', RuntimeError('throttled'))
+
+        resumed = checkpoints.Run(run_id=run.run_id, root=self.root)
+        checkpoint = resumed.checkpoint('ec2')
+        self.assertTrue(checkpoint.done('us-east-1'))
+        self.assertEqual(checkpoint.load('us-east-1'), ['i-1', 'i-2'])
+        # partial progress can be loaded but the unit still has to be finished
+        self.assertFalse(checkpoint.done('us-west-2'))
+        self.assertEqual(checkpoint.load('us-west-2'), ['i-3'])
+        self.assertIsNone(checkpoint.load('eu-west-1'))
+        self.assertEqual(resumed.failed(), ['ec2/eu-west-1'])
+        # stages of a checkpoint don't share units
+        self.assertFalse(checkpoint.stage('sizes').done('us-east-1'))
+
+    def test_unknown_run(self):
+        with self.assertRaises(ValueError):
+            checkpoints.Run(run_id='20200101-000000-0000', root=self.root)
+
+    def test_finish(self):
+        run = checkpoints.Run(root=self.root)
+        run.checkpoint('ebs').fail('eu-west-1', RuntimeError('throttled'))
+        with self.assertRaises(click.ClickException) as raised:
+            run.finish()
+        self.assertIn('--resume {}'.format(run.run_id), raised.exception.message)
+        self.assertTrue(os.path.isdir(run.path))
+        # failures the caller knows of (e.g. a whole service) count too
+        with self.assertRaises(click.ClickException):
+            checkpoints.Run(root=self.root).finish(failed=['s3'])
+        # once everything has been collected the checkpoints go away
+        run.checkpoint('ebs').save('eu-west-1', [])
+        run.finish()
+        self.assertFalse(os.path.isdir(run.path))
+
+
+class TestResumeScan(unittest.TestCase):
+    """Tests for `aurora.scan.RegionScan` with a checkpoint."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.calls = []
+        self.broken = set(['eu-west-1'])
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def scan_func(self, region_name):
+        self.calls.append(region_name)
+        if region_name in self.broken:
+            raise RuntimeError('throttled')
+        yield region_name
+        yield region_name.upper()
+
+    def test_only_unfinished_regions_are_rescanned(self):
+        region_names = ['us-east-1', 'eu-west-1', 'us-west-2']
+        for workers in (1, 4):
+            del self.calls[:]
+            self.broken = set(['eu-west-1'])
+            run = checkpoints.Run(root=self.root)
+            results = [(region_name, list(result)) for region_name, result
+                       in scan.RegionScan(self.scan_func, region_names, workers=workers,
+                                          checkpoint=run.checkpoint('ec2'))]
+            self.assertEqual([region_name for region_name, _ in results], ['us-east-1', 'us-west-2'])
+            self.assertEqual(run.failed(), ['ec2/eu-west-1'])
+
+            del self.calls[:]
+            self.broken = set()
+            run = checkpoints.Run(run_id=run.run_id, root=self.root)
+            results = [(region_name, list(result)) for region_name, result
+                       in scan.RegionScan(self.scan_func, region_names, workers=workers,
+                                          checkpoint=run.checkpoint('ec2'))]
+            self.assertEqual(self.calls, ['eu-west-1'])
+            self.assertEqual(results, [('us-east-1', ['us-east-1', 'US-EAST-1']),
+                                       ('eu-west-1', ['eu-west-1', 'EU-WEST-1']),
+                                       ('us-west-2', ['us-west-2', 'US-WEST-2'])])
+            self.assertEqual(run.failed(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the combined inventory report."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import boto3.session
+import pandas as pd
+from click.testing import CliRunner
+
+from aurora import checkpoints, cli, clients, discovery, pricing_cache, snapshots
+from aurora.ec2_info import sorted_keys, tags_keys
+
+
+def service_frames():
+    ec2_df = pd.DataFrame({'InstanceId': ['i-1', 'i-2'], 'InstanceType': ['m5.large', 't3.micro'],
+                           'region_name': ['us-east-1', 'us-west-2'], 'usd_per_hr': [0.096, 0.0104],
+                           'usd_per_month': [70.08, 7.59], 'Team': ['maps', 'search']})
+    # the columns ec2_info.collect returns
+    ec2_df = ec2_df.reindex(columns=sorted_keys + ['region_name'])
+    ebs_df = pd.DataFrame({'id': ['vol-1'], 'volume_type': ['gp2'], 'region_name': ['us-east-1'],
+                           'size_gb': [100], 'usd_per_month': [10.0], 'Team': ['maps']})
+    s3_df = pd.DataFrame({'bucket_name': ['logs', 'logs'], 'volume_type': ['StandardStorage', 'GlacierStorage'],
+                          'region_name': ['eu-west-1', 'eu-west-1'], 'bucket_size_gb': [1000.0, 50000.0],
+                          'usd_per_month': [23.0, 200.0]})
+    return {'ec2': ec2_df, 'ebs': ebs_df, 's3': s3_df}
+
+
+class TestCombineReports(unittest.TestCase):
+    """Tests for `aurora.cli.combine_reports`."""
+
+    def test_columns_and_order(self):
+        report_df = cli.combine_reports(service_frames())
+        self.assertEqual(list(report_df.columns), ['service', 'resource_id', 'resource_type', 'region_name',
+                                                   'usd_per_month'] + tags_keys)
+        # most expensive first, whichever service it comes from
+        self.assertEqual(list(report_df['resource_id']), ['logs', 'i-1', 'logs', 'vol-1', 'i-2'])
+        self.assertEqual(list(report_df['resource_type']), ['GlacierStorage', 'm5.large', 'StandardStorage', 'gp2',
+                                                            't3.micro'])
+        self.assertEqual(list(report_df['service']), ['s3', 'ec2', 's3', 'ebs', 'ec2'])
+        self.assertEqual(list(report_df['usd_per_month']), [200.0, 70.08, 23.0, 10.0, 7.59])
+        self.assertEqual(list(report_df['Team'].fillna('')), ['', 'maps', '', 'maps', 'search'])
+
+    def test_account_id_column(self):
+        service_dfs = service_frames()
+        for results_df in service_dfs.values():
+            results_df['account_id'] = '111111111111'
+        report_df = cli.combine_reports(service_dfs)
+        self.assertEqual(list(report_df.columns[:2]), ['account_id', 'service'])
+
+    def test_no_services(self):
+        report_df = cli.combine_reports(dict())
+        self.assertEqual(len(report_df), 0)
+        self.assertEqual(list(report_df.columns[:2]), ['service', 'resource_id'])
+
+
+class TestInventoryCommand(unittest.TestCase):
+    """Tests for the output of `aurora inventory`, with the collectors stubbed out."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        snapshot_store = snapshots.SnapshotStore(':memory:')
+        patches = [mock.patch.object(cli, 'inventory_services', return_value=(service_frames(), [])),
+                   mock.patch.object(snapshots, 'SnapshotStore', lambda: snapshot_store),
+                   mock.patch.object(checkpoints, 'start',
+                                     lambda resume: checkpoints.Run(root=os.path.join(self.root, 'runs')))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        discovery.configure(enabled=False)
+        clients.configure(session=boto3.session.Session())
+        pricing_cache.configure()
+        shutil.rmtree(self.root)
+
+    def invoke(self, *args):
+        result = CliRunner().invoke(cli.main, ['inventory', '--no-history', '--region', 'us-east-1'] + list(args))
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def test_combined_report(self):
+        out = os.path.join(self.root, 'costs.csv')
+        self.invoke(out)
+        report_df = pd.read_csv(out)
+        self.assertEqual(list(report_df['resource_id']), ['logs', 'i-1', 'logs', 'vol-1', 'i-2'])
+
+    def test_per_service(self):
+        out = os.path.join(self.root, 'costs')
+        self.invoke(out, '--per-service')
+        self.assertEqual(sorted(os.listdir(out)), ['ebs.csv', 'ec2.csv', 's3.csv'])
+        # ec2 is laid out the way ec2_info writes it, the others keep their own columns
+        self.assertEqual(list(pd.read_csv(os.path.join(out, 'ec2.csv')).columns), sorted_keys)
+        ebs_df = pd.read_csv(os.path.join(out, 'ebs.csv'))
+        self.assertEqual(list(ebs_df.columns), ['id', 'volume_type', 'region_name', 'size_gb', 'usd_per_month',
+                                                'Team'])
+        self.assertEqual(list(pd.read_csv(os.path.join(out, 's3.csv'))['bucket_size_gb']), [1000.0, 50000.0])
+
+    def test_failed_service_fails_the_command(self):
+        service_dfs = service_frames()
+        del service_dfs['s3']
+        with mock.patch.object(cli, 'inventory_services', return_value=(service_dfs, ['s3'])):
+            result = CliRunner().invoke(cli.main, ['inventory', '--no-history', os.path.join(self.root, 'costs.csv')])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('1 failed units (s3)', result.output)
+        # what did finish is still written out
+        self.assertEqual(len(pd.read_csv(os.path.join(self.root, 'costs.csv'))), 3)
+
+    def test_per_service_parquet(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        out = os.path.join(self.root, 'costs')
+        self.invoke(out, '--per-service', '--format', 'parquet')
+        self.assertEqual(sorted(os.listdir(out)), ['ebs.parquet', 'ec2.parquet', 's3.parquet'])
+
+
+if __name__ == '__main__':
+    unittest.main()
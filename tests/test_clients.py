@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the shared client pool."""
+
+import unittest
+
+from aurora import clients
+
+
+class TestClientPool(unittest.TestCase):
+    """Tests for `aurora.clients`."""
+
+    def test_clients_are_cached_per_service_and_region(self):
+        pool = clients.ClientPool(max_pool_connections=7)
+        ec2 = pool.get_client('ec2', region_name='us-east-1')
+        self.assertIs(pool.get_client('ec2', region_name='us-east-1'), ec2)
+        self.assertIsNot(pool.get_client('ec2', region_name='us-west-2'), ec2)
+        self.assertEqual(ec2.meta.config.max_pool_connections, 7)
+
+    def test_throttled_services_leave_retries_to_the_rate_limiter(self):
+        pool = clients.ClientPool(max_attempts=5)
+        # botocore counts the first attempt as well as the retries
+        ec2 = pool.get_client('ec2', region_name='us-east-1')
+        self.assertEqual(ec2.meta.config.retries['total_max_attempts'], 6)
+        pricing = pool.get_client('pricing', region_name='us-east-1')
+        self.assertEqual(pricing.meta.config.retries['total_max_attempts'], 1)
+
+    def test_configure_keeps_the_session(self):
+        session = clients.get_pool().session
+        pool = clients.configure(max_attempts=3)
+        self.assertIs(pool.session, session)
+        self.assertIs(clients.get_pool(), pool)
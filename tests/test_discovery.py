@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for region discovery against the benchmark's fake AWS account."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto3.session
+
+from aurora import clients, discovery, ec2_info, pricing_cache, snapshots
+from benchmarks.fake_account import FakeAccount
+
+
+class TestDiscovery(unittest.TestCase):
+    """Tests for `aurora.discovery`."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        pricing_cache.configure(path=os.path.join(self.cache_dir, 'prices.sqlite'))
+        session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                        region_name='us-east-1')
+        # two instances round robin over three regions leave eu-west-1 without any
+        self.account = FakeAccount(['us-east-1', 'us-west-2', 'eu-west-1'], n_instances=2, n_volumes=3,
+                                   n_buckets=0)
+        self.account.install(session)
+        clients.configure(session=session)
+        discovery.configure(enabled=True)
+
+    def tearDown(self):
+        discovery.configure(enabled=False)
+        clients.configure(session=boto3.session.Session())
+        pricing_cache.configure()
+        shutil.rmtree(self.cache_dir)
+
+    def test_filter_regions(self):
+        snapshot = snapshots.Snapshot('ec2', store=snapshots.SnapshotStore(':memory:'))
+        region_names = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-east-1']
+        self.assertEqual(discovery.filter_regions('ec2', region_names, snapshot=snapshot), ['us-east-1', 'us-west-2'])
+        # the region that was probed empty counts as fully listed
+        self.assertEqual(snapshot.done, set(['eu-west-1']))
+        self.assertEqual(discovery.filter_regions('ebs', region_names), ['us-east-1', 'us-west-2', 'eu-west-1'])
+        self.assertEqual(discovery.filter_regions('s3', region_names), ['us-east-1', 'us-west-2', 'eu-west-1'])
+        # asked once per run, whichever collector asks
+        discovery.filter_regions('ec2', region_names)
+        self.assertEqual(self.account.calls[('ec2', 'DescribeRegions')], 1)
+        self.assertEqual(self.account.calls[('ec2', 'DescribeInstances')], 3)
+
+    def test_collect_skips_empty_regions(self):
+        results_df = ec2_info.collect(['us-east-1', 'us-west-2', 'eu-west-1'])
+        self.assertEqual(len(results_df), 2)
+        # a probe and a scan in each region with instances, just the probe in the empty one
+        self.assertEqual(self.account.calls[('ec2', 'DescribeInstances')], 5)
+        self.assertEqual(self.account.calls[('pricing', 'GetProducts')], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the EBS volume enrichment."""
+
+import json
+import math
+import unittest
+
+import botocore.exceptions
+
+from aurora import ebs_info, pricing_cache
+
+
+class StubEC2Client(object):
+    """Stands in for boto3.client('ec2'), where the instances in terminated no longer exist."""
+
+    def __init__(self, terminated=()):
+        self.terminated = set(terminated)
+        self.calls = []
+
+    def _instance(self, instance_id):
+        return {'InstanceId': instance_id, 'Tags': [{'Key': 'Team', 'Value': 'team-' + instance_id},
+                                                    {'Key': 'Colour', 'Value': 'red'}]}
+
+    def describe_instances(self, InstanceIds=None, Filters=None):
+        self.calls.append({'InstanceIds': InstanceIds, 'Filters': Filters})
+        if InstanceIds is not None:
+            missing = [instance_id for instance_id in InstanceIds if instance_id in self.terminated]
+            if len(missing) > 0:
+                raise botocore.exceptions.ClientError(
+                    {'Error': {'Code': 'InvalidInstanceID.NotFound',
+                               'Message': "The instance ID '{}' does not exist".format(missing[0])}},
+                    'DescribeInstances')
+        else:
+            InstanceIds = Filters[0]['Values']
+        instances = [self._instance(instance_id) for instance_id in InstanceIds if instance_id not in self.terminated]
+        return {'Reservations': [{'Instances': instances}]}
+
+
+class StubPricingClient(object):
+    """Stands in for boto3.client('pricing'), with on-demand EBS prices for the volume types in prices only."""
+
+    def __init__(self, prices):
+        self.prices = prices
+
+    def get_products(self, ServiceCode, Filters):
+        volume_type = [f['Value'] for f in Filters if f['Field'] == 'volumeType'][0]
+        if volume_type not in self.prices:
+            return {'PriceList': []}
+        price_list = {'terms': {'OnDemand': {'T1': {'priceDimensions': {
+            'R1': {'pricePerUnit': {'USD': str(self.prices[volume_type])}}}}}}}
+        return {'PriceList': [json.dumps(price_list)]}
+
+
+class TestGetEbsPrice(unittest.TestCase):
+    """Tests for `aurora.ebs_info.get_ebs_price`."""
+
+    def test_missing_price(self):
+        cache = pricing_cache.PricingCache(path=':memory:')
+        pricing = StubPricingClient({'General Purpose': 0.1})
+        self.assertEqual(ebs_info.get_ebs_price(pricing, 'US East (N. Virginia)', 'gp2', cache=cache), 0.1)
+        self.assertIsNone(ebs_info.get_ebs_price(pricing, 'US East (N. Virginia)', 'sc1', cache=cache))
+        # a missing price isn't cached, it's asked for again next time
+        self.assertIsNone(cache.get(cache.make_key('ebs', 'US East (N. Virginia)', 'sc1')))
+        rates_df = ebs_info.rate_table({'gp2': 0.1, 'sc1': None})
+        self.assertEqual(rates_df['rate_usd_per_gb'][0], 0.1)
+        self.assertTrue(math.isnan(rates_df['rate_usd_per_gb'][1]))
+
+
+class TestGetInstanceTags(unittest.TestCase):
+    """Tests for `aurora.ebs_info.get_instance_tags`."""
+
+    def test_chunks(self):
+        ec2 = StubEC2Client()
+        instance_ids = ['i-{}'.format(i) for i in range(5)]
+        instance_tags = ebs_info.get_instance_tags(ec2, instance_ids, chunk_size=2)
+        self.assertEqual([call['InstanceIds'] for call in ec2.calls], [['i-0', 'i-1'], ['i-2', 'i-3'], ['i-4']])
+        # only the tags in tags_keys are kept
+        self.assertEqual(instance_tags['i-3'], {'Team': 'team-i-3'})
+        self.assertEqual(sorted(instance_tags), instance_ids)
+
+    def test_terminated_instance_falls_back_to_filter(self):
+        ec2 = StubEC2Client(terminated=['i-2'])
+        instance_ids = ['i-{}'.format(i) for i in range(4)]
+        instance_tags = ebs_info.get_instance_tags(ec2, instance_ids, chunk_size=2)
+        # only the chunk with the terminated instance is asked again, by filter
+        self.assertEqual(ec2.calls, [{'InstanceIds': ['i-0', 'i-1'], 'Filters': None},
+                                     {'InstanceIds': ['i-2', 'i-3'], 'Filters': None},
+                                     {'InstanceIds': None,
+                                      'Filters': [{'Name': 'instance-id', 'Values': ['i-2', 'i-3']}]}])
+        self.assertEqual(sorted(instance_tags), ['i-0', 'i-1', 'i-3'])
+
+    def test_other_errors_are_raised(self):
+        class DeniedEC2Client(StubEC2Client):
+            def describe_instances(self, **kwargs):
+                raise botocore.exceptions.ClientError({'Error': {'Code': 'UnauthorizedOperation', 'Message': ''}},
+                                                      'DescribeInstances')
+
+        with self.assertRaises(botocore.exceptions.ClientError):
+            ebs_info.get_instance_tags(DeniedEC2Client(), ['i-0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the EC2 raw resource table and cost stage."""
+
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from aurora import ec2_info
+
+
+class TestInstancesFrame(unittest.TestCase):
+    """Tests for `aurora.ec2_info.instances_frame` and `aurora.ec2_info.price_instances`."""
+
+    def setUp(self):
+        self.instances = [{'InstanceId': 'i-1', 'InstanceType': 'm5.large',
+                           'Tags': [{'Key': 'Name', 'Value': 'web'}, {'Key': 'Team', 'Value': 'maps'},
+                                    {'Key': 'ignored', 'Value': 'x'}]},
+                          {'InstanceId': 'i-2', 'InstanceType': 'm5.large', 'Platform': 'windows'},
+                          {'InstanceId': 'i-3', 'InstanceType': 'p3.2xlarge'}]
+
+    def test_tags_and_platform_columns(self):
+        instances_df = ec2_info.instances_frame(self.instances, 'us-east-1')
+        self.assertEqual(list(instances_df['Name'].fillna('')), ['web', '', ''])
+        self.assertEqual(list(instances_df['Team'].fillna('')), ['maps', '', ''])
+        self.assertNotIn('ignored', instances_df.columns)
+        self.assertEqual(list(instances_df['Platform']), ['Linux', 'windows', 'Linux'])
+        self.assertEqual(list(instances_df['region_name'].unique()), ['us-east-1'])
+
+    def test_price_instances(self):
+        instances_df = ec2_info.instances_frame(self.instances, 'us-east-1')
+        instances_df['usd_per_hr'] = float('nan')
+        rates_df = ec2_info.rate_table({('m5.large', 'Linux'): '0.096', ('m5.large', 'Windows'): '0.188'})
+        with mock.patch('tools.get_price', return_value='3.06') as get_price:
+            instances_df = ec2_info.price_instances(instances_df, rates_df, 'us-east-1', 'US East (N. Virginia)')
+        # only the instance type missing from the rate table is looked up directly
+        self.assertEqual(get_price.call_count, 1)
+        self.assertEqual(get_price.call_args[1]['instance_type'], 'p3.2xlarge')
+        self.assertEqual(list(instances_df['usd_per_hr']), [0.096, 0.188, 3.06])
+        pd.testing.assert_series_equal(instances_df['usd_per_month'], instances_df['usd_per_hr'] * 24 * 30,
+                                       check_names=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""End to end tests of the collectors against the benchmark's fake AWS account."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto3.session
+
+from aurora import clients, pricing_cache, snapshots
+from aurora import ebs_info, ec2_info, s3_info
+from benchmarks.fake_account import FakeAccount
+
+
+class TestCollectors(unittest.TestCase):
+    """Runs `collect` for every service against a small `benchmarks.fake_account.FakeAccount`."""
+
+    region_names = ['us-east-1', 'us-west-2', 'eu-west-1']
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        pricing_cache.configure(path=os.path.join(self.cache_dir, 'prices.sqlite'))
+        session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                        region_name='us-east-1')
+        self.account = FakeAccount(self.region_names, n_instances=300, n_volumes=600, n_buckets=40,
+                                   forbidden_bucket_rate=0.1)
+        self.account.install(session)
+        clients.configure(session=session)
+
+    def tearDown(self):
+        clients.configure(session=boto3.session.Session())
+        pricing_cache.configure()
+        shutil.rmtree(self.cache_dir)
+
+    def test_ec2(self):
+        results_df = ec2_info.collect(self.region_names, max_results=50, workers=2)
+        self.assertEqual(len(results_df), 300)
+        self.assertFalse(results_df['usd_per_hr'].isnull().any())
+        # one price index per region, three pages of instances in each
+        self.assertEqual(self.account.calls[('pricing', 'GetProducts')], 3)
+        self.assertEqual(self.account.calls[('ec2', 'DescribeInstances')], 6)
+
+    def test_ebs(self):
+        results_df = ebs_info.collect(self.region_names, workers=2)
+        self.assertEqual(len(results_df), 600)
+        self.assertEqual(set(results_df['region_name']), set(self.region_names))
+        attached = results_df['ec2_instance_id'] != 'NA'
+        self.assertTrue((results_df.loc[attached, 'Team'].str.startswith('team-')).all())
+
+    def test_ebs_incremental_picks_up_instance_tags(self):
+        snapshot_store = snapshots.SnapshotStore(':memory:')
+        snapshot = snapshots.Snapshot('ebs', store=snapshot_store)
+        ebs_info.collect(self.region_names, workers=2, snapshot=snapshot)
+        snapshot.commit()
+        # the team of one instance is renamed, its volumes themselves don't change
+        instance = self.account.instances['us-east-1'][0]
+        instance['Tags'] = [tag if tag['Key'] != 'Team' else {'Key': 'Team', 'Value': 'renamed'}
+                            for tag in instance['Tags']]
+        snapshot = snapshots.Snapshot('ebs', store=snapshot_store, incremental=True)
+        results_df = ebs_info.collect(self.region_names, workers=2, snapshot=snapshot)
+        attached = results_df['ec2_instance_id'] == instance['InstanceId']
+        self.assertGreater(attached.sum(), 0)
+        self.assertTrue((results_df.loc[attached, 'Team'] == 'renamed').all())
+        self.assertEqual(snapshot.carried, 600 - attached.sum())
+        self.assertEqual(set(row['resource_id'] for row in snapshot.diff()), set(results_df.loc[attached, 'id']))
+
+    def test_s3(self):
+        results_df = s3_info.collect(self.region_names, workers=4)
+        self.assertEqual(results_df['bucket_name'].nunique(), 40)
+        self.assertEqual(self.account.calls[('s3', 'HeadBucket')], 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
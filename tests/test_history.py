@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the local cost history."""
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from aurora import checkpoints, history
+
+DAY = 24 * 3600
+
+
+class TestHistoryStore(unittest.TestCase):
+    """Tests for `aurora.history.HistoryStore`."""
+
+    def setUp(self):
+        self.store = history.HistoryStore(path=':memory:')
+        self.now = time.time()
+
+    def ebs_frame(self, usd_per_month):
+        return pd.DataFrame({'id': ['vol-1', 'vol-2', 'vol-3'],
+                             'volume_type': ['gp2', 'gp2', 'io1'],
+                             'region_name': ['us-east-1', 'us-east-1', 'us-west-2'],
+                             'usd_per_month': usd_per_month,
+                             'Team': ['maps', 'search', None]})
+
+    def test_runs_in_a_bucket_are_averaged(self):
+        self.store.record('run-1', 'ebs', self.ebs_frame([10.0, 20.0, 30.0]), run_at=self.now - 2 * DAY)
+        self.store.record('run-2', 'ebs', self.ebs_frame([20.0, 20.0, 30.0]), run_at=self.now - 2 * DAY)
+        self.store.record('run-3', 'ebs', self.ebs_frame([40.0, 20.0, 30.0]), run_at=self.now)
+        self.store.record('run-3', 's3', pd.DataFrame({'bucket_name': ['b'], 'volume_type': ['Standard'],
+                                                       'region_name': ['us-east-1'], 'usd_per_month': [5.0]}),
+                          run_at=self.now)
+
+        results_df = self.store.query(by=['team'], where={'service': ['ebs'], 'team': ['maps']})
+        self.assertEqual(list(results_df['usd_per_month']), [15.0, 40.0])
+        self.assertEqual(list(results_df['day']), [history.make_run_date(self.now - 2 * DAY),
+                                                   history.make_run_date(self.now)])
+
+        results_df = self.store.query(by=['service'], bucket='run', days=1)
+        self.assertEqual(list(results_df['run']), ['run-3', 'run-3'])
+        self.assertEqual(list(results_df['service']), ['ebs', 's3'])
+        self.assertEqual(list(results_df['usd_per_month']), [90.0, 5.0])
+
+    def test_recording_a_run_again_replaces_it(self):
+        self.store.record('run-1', 'ebs', self.ebs_frame([10.0, 20.0, 30.0]), run_at=self.now)
+        self.store.record('run-1', 'ebs', self.ebs_frame([1.0, 2.0, 3.0]), run_at=self.now)
+        results_df = self.store.query()
+        self.assertEqual(list(results_df['usd_per_month']), [6.0])
+        self.assertEqual(list(results_df['resources']), [3.0])
+
+    def test_unfinished_runs_are_ignored(self):
+        recorder = history.Recorder(self.store, 'run-1', 'ebs', run_at=self.now)
+        recorder.write(self.ebs_frame([10.0, 20.0, 30.0]))
+        self.assertEqual(len(self.store.query()), 0)
+
+    def test_runs_with_failures_are_ignored(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        run = checkpoints.Run(root=root)
+        run.checkpoint('ebs').fail('us-west-2', RuntimeError('throttled'))
+        recorder = history.Recorder(self.store, run.run_id, 'ebs', run_at=self.now, run=run)
+        recorder.write(self.ebs_frame([10.0, 20.0, 30.0]))
+        recorder.close()
+        self.assertEqual(len(self.store.query()), 0)
+        # once the resumed run gets the failed region, the whole run is recorded
+        run.checkpoint('ebs').save('us-west-2', [])
+        recorder = history.Recorder(self.store, run.run_id, 'ebs', run_at=self.now, run=run)
+        recorder.write(self.ebs_frame([10.0, 20.0, 30.0]))
+        recorder.close()
+        self.assertEqual(list(self.store.query()['usd_per_month']), [60.0])
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            self.store.query(by=['usd_per_month; DROP TABLE costs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
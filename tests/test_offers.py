@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for importing AWS offer files."""
+
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+from aurora import offers
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+header = ['SKU', 'OfferTermCode', 'RateCode', 'TermType', 'PriceDescription', 'StartingRange', 'EndingRange', 'Unit',
+          'PricePerUnit', 'Currency', 'Product Family', 'serviceCode', 'Location', 'Instance Type', 'Tenancy',
+          'Operating System', 'Pre Installed S/W', 'Capacity Status', 'Volume Type']
+rows = [
+    ['A', 'T1', 'R1', 'OnDemand', '', '0', 'Inf', 'Hrs', '0.0960000000', 'USD', 'Compute Instance', 'AmazonEC2',
+     'US East (N. Virginia)', 'm5.large', 'Shared', 'Linux', 'NA', 'Used', ''],
+    # reserved, dedicated, capacity reservation and pre-installed software prices are all skipped
+    ['A', 'T2', 'R2', 'Reserved', '', '0', 'Inf', 'Hrs', '0.0600000000', 'USD', 'Compute Instance', 'AmazonEC2',
+     'US East (N. Virginia)', 'm5.large', 'Shared', 'Linux', 'NA', 'Used', ''],
+    ['B', 'T1', 'R3', 'OnDemand', '', '0', 'Inf', 'Hrs', '0.1010000000', 'USD', 'Compute Instance', 'AmazonEC2',
+     'US East (N. Virginia)', 'm5.large', 'Dedicated', 'Linux', 'NA', 'Used', ''],
+    ['C', 'T1', 'R4', 'OnDemand', '', '0', 'Inf', 'Hrs', '0.0000000000', 'USD', 'Compute Instance', 'AmazonEC2',
+     'US East (N. Virginia)', 'm5.large', 'Shared', 'Windows', 'NA', 'UnusedCapacityReservation', ''],
+    ['D', 'T1', 'R5', 'OnDemand', '', '0', 'Inf', 'Hrs', '0.1880000000', 'USD', 'Compute Instance', 'AmazonEC2',
+     'US East (N. Virginia)', 'm5.large', 'Shared', 'Windows', 'NA', 'Used', ''],
+    ['E', 'T1', 'R6', 'OnDemand', '', '0', 'Inf', 'Hrs', '0.3000000000', 'USD', 'Compute Instance', 'AmazonEC2',
+     'US East (N. Virginia)', 'm5.large', 'Shared', 'Windows', 'SQL Std', 'Used', ''],
+    ['F', 'T1', 'R7', 'OnDemand', '', '0', 'Inf', 'GB-Mo', '0.1000000000', 'USD', 'Storage', 'AmazonEC2',
+     'US East (N. Virginia)', '', '', '', '', '', 'General Purpose'],
+    ['G', 'T1', 'R8', 'OnDemand', '', '0', '51200', 'GB-Mo', '0.0230000000', 'USD', 'Storage', 'AmazonS3',
+     'US East (N. Virginia)', '', '', '', '', '', 'Standard'],
+    ['G', 'T1', 'R9', 'OnDemand', '', '51200', 'Inf', 'GB-Mo', '0.0220000000', 'USD', 'Storage', 'AmazonS3',
+     'US East (N. Virginia)', '', '', '', '', '', 'Standard'],
+]
+
+
+def json_offer(offer_code, rows):
+    # the same products and prices laid out like the json version of an offer file
+    columns = dict((name, i) for i, name in enumerate(header))
+    products = dict()
+    terms = dict()
+    for row in rows:
+        sku = row[columns['SKU']]
+        attributes = dict((attribute, row[columns[name]]) for name, attribute in offers.csv_attributes.items()
+                          if name != 'Product Family' and row[columns[name]] != '')
+        products[sku] = {'sku': sku, 'productFamily': row[columns['Product Family']], 'attributes': attributes}
+        offer_term = terms.setdefault(row[columns['TermType']], dict()).setdefault(sku, dict()).setdefault(
+            sku + '.' + row[columns['OfferTermCode']], {'sku': sku, 'priceDimensions': dict()})
+        offer_term['priceDimensions'][sku + '.' + row[columns['RateCode']]] = {
+            'beginRange': row[columns['StartingRange']], 'endRange': row[columns['EndingRange']],
+            'unit': row[columns['Unit']], 'pricePerUnit': {'USD': row[columns['PricePerUnit']]}}
+    return {'formatVersion': 'v1.0', 'offerCode': offer_code, 'products': products, 'terms': terms}
+
+
+class TestOfferImport(unittest.TestCase):
+    """Tests for `aurora.offers`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.offer_path = os.path.join(self.tmp_dir, 'index.csv')
+        with open(self.offer_path, 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(['FormatVersion', 'v1.0'])
+            writer.writerow(['OfferCode', 'AmazonEC2'])
+            writer.writerow(header)
+            writer.writerows(rows)
+        self.store_path = os.path.join(self.tmp_dir, 'offers.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_import_csv(self):
+        counts = offers.import_offer_file(self.offer_path, store_path=self.store_path)
+        self.assertEqual(counts, {'ec2': 2, 'ebs': 1, 's3': 2})
+        store = offers.OfferStore(self.store_path)
+        self.assertEqual(store.get_ec2_index('US East (N. Virginia)'),
+                         {('m5.large', 'Linux'): '0.0960000000', ('m5.large', 'Windows'): '0.1880000000'})
+        self.assertEqual(store.get_ec2_price('US East (N. Virginia)', 'm5.large', 'Windows'), '0.1880000000')
+        self.assertIsNone(store.get_ec2_price('US East (N. Virginia)', 'c5.large', 'Linux'))
+        self.assertEqual(store.get_ebs_price('US East (N. Virginia)', 'General Purpose'), 0.1)
+        self.assertEqual(store.get_s3_tiers('US East (N. Virginia)', 'Standard'),
+                         [{'min_bytes': 0.0, 'max_bytes': 51200.0, 'price_per_gb': 0.023},
+                          {'min_bytes': 51200.0, 'max_bytes': float('inf'), 'price_per_gb': 0.022}])
+        self.assertIsNone(store.get_s3_tiers('US West (Oregon)', 'Standard'))
+
+    @unittest.skipUnless(ijson, 'importing json offer files requires ijson')
+    def test_import_json(self):
+        ec2_path = os.path.join(self.tmp_dir, 'ec2.json')
+        s3_path = os.path.join(self.tmp_dir, 's3.json')
+        # an offer file only ever holds one service
+        service_code = header.index('serviceCode')
+        with open(ec2_path, 'w') as f:
+            json.dump(json_offer('AmazonEC2', [row for row in rows if row[service_code] == 'AmazonEC2']), f)
+        with open(s3_path, 'w') as f:
+            json.dump(json_offer('AmazonS3', [row for row in rows if row[service_code] == 'AmazonS3']), f)
+        self.assertEqual(offers.import_offer_file(ec2_path, store_path=self.store_path), {'ec2': 2, 'ebs': 1, 's3': 0})
+        self.assertEqual(offers.import_offer_file(s3_path, store_path=self.store_path), {'ec2': 0, 'ebs': 0, 's3': 2})
+        store = offers.OfferStore(self.store_path)
+        self.assertEqual(store.get_ec2_index('US East (N. Virginia)'),
+                         {('m5.large', 'Linux'): '0.0960000000', ('m5.large', 'Windows'): '0.1880000000'})
+        self.assertEqual(store.get_ebs_price('US East (N. Virginia)', 'General Purpose'), 0.1)
+        self.assertEqual(store.get_s3_tiers('US East (N. Virginia)', 'Standard'),
+                         [{'min_bytes': 0.0, 'max_bytes': 51200.0, 'price_per_gb': 0.023},
+                          {'min_bytes': 51200.0, 'max_bytes': float('inf'), 'price_per_gb': 0.022}])
+
+    def test_reimport_replaces_tiers(self):
+        offers.import_offer_file(self.offer_path, store_path=self.store_path)
+        offers.import_offer_file(self.offer_path, store_path=self.store_path)
+        store = offers.OfferStore(self.store_path)
+        self.assertEqual(len(store.get_s3_tiers('US East (N. Virginia)', 'Standard')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
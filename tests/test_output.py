@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the csv and parquet writers and frame helpers."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from aurora import output
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestWriters(unittest.TestCase):
+    """Tests for `aurora.output.ParquetWriter` and `aurora.output.CsvWriter`."""
+
+    columns = ['InstanceId', 'Placement', 'Team', 'usd_per_month', 'region_name']
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_region_partitions(self):
+        path = os.path.join(self.out_dir, 'ec2')
+        writer = output.open_writer(path, 'parquet', columns=self.columns)
+        # no Team tags at all in the first region
+        writer.write(pd.DataFrame([{'InstanceId': 'i-1', 'Placement': {'AvailabilityZone': 'us-east-1a'},
+                                    'usd_per_month': 7.2, 'region_name': 'us-east-1'}]), 'us-east-1')
+        writer.write(pd.DataFrame([{'InstanceId': 'i-2', 'Placement': '', 'Team': 'geo', 'usd_per_month': 14.4,
+                                    'region_name': 'us-west-2'},
+                                   {'InstanceId': 'i-3', 'Placement': '', 'Team': 'geo', 'usd_per_month': 1.0,
+                                    'region_name': 'eu-west-1'}]))
+        writer.close()
+
+        self.assertEqual(sorted(os.listdir(path)),
+                         ['region_name=eu-west-1', 'region_name=us-east-1', 'region_name=us-west-2'])
+        results_df = pd.read_parquet(path).sort_values(by='InstanceId')
+        self.assertEqual(list(results_df['InstanceId']), ['i-1', 'i-2', 'i-3'])
+        self.assertEqual(list(results_df['region_name'].astype(str)), ['us-east-1', 'us-west-2', 'eu-west-1'])
+        self.assertEqual(results_df['Placement'].iloc[0], '{"AvailabilityZone": "us-east-1a"}')
+        self.assertTrue(pd.isnull(results_df['Team'].iloc[0]))
+        self.assertEqual(results_df['Team'].iloc[1], 'geo')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_unpriced_region_first(self):
+        path = os.path.join(self.out_dir, 'ec2')
+        writer = output.open_writer(path, 'parquet', columns=self.columns)
+        # the price list has nothing for the first region, so its usd_per_month are all missing
+        writer.write(pd.DataFrame([{'InstanceId': 'i-1', 'usd_per_month': None, 'region_name': 'ap-east-1'}]),
+                     'ap-east-1')
+        writer.write(pd.DataFrame([{'InstanceId': 'i-2', 'usd_per_month': float('nan'), 'region_name': 'me-south-1'}]),
+                     'me-south-1')
+        writer.write(pd.DataFrame([{'InstanceId': 'i-3', 'usd_per_month': 14.4, 'region_name': 'us-east-1'}]),
+                     'us-east-1')
+        writer.close()
+        results_df = pd.read_parquet(path).sort_values(by='InstanceId')
+        self.assertEqual(results_df['usd_per_month'].dtype, float)
+        self.assertEqual(list(results_df['usd_per_month'].fillna(0)), [0, 0, 14.4])
+
+    def test_csv_header_only_when_empty(self):
+        path = os.path.join(self.out_dir, 'ec2.csv')
+        writer = output.open_writer(path, 'csv', columns=self.columns)
+        writer.close()
+        self.assertEqual(list(pd.read_csv(path).columns), self.columns)
+
+    def test_sort_csv(self):
+        path = os.path.join(self.out_dir, 'ebs.csv')
+        writer = output.open_writer(path, 'csv', columns=['id', 'usd_per_month', 'ec2_instance_id', 'Team'])
+        writer.write(pd.DataFrame({'id': ['vol-1', 'vol-2'], 'usd_per_month': [3.5, None],
+                                   'ec2_instance_id': ['NA', 'i-1']}))
+        writer.write(pd.DataFrame({'id': ['vol-3', 'vol-4', 'vol-5'], 'usd_per_month': [10.0, 1.25, 3.5],
+                                   'ec2_instance_id': ['i-2', 'NA', 'i-3']}))
+        writer.close()
+        # three rows at a time means two sorted runs to merge
+        output.sort_csv(path, 'usd_per_month', ascending=False, drop_empty=['Team'], chunk_rows=3)
+        with open(path) as f:
+            self.assertEqual(f.read().splitlines(), ['id,usd_per_month,ec2_instance_id',
+                                                     'vol-3,10.0,i-2',
+                                                     'vol-1,3.5,NA',
+                                                     'vol-5,3.5,i-3',
+                                                     'vol-4,1.25,NA',
+                                                     'vol-2,,i-1'])
+        self.assertEqual(os.listdir(self.out_dir), ['ebs.csv'])
+
+
+class TestCompactFrames(unittest.TestCase):
+    """Tests for `aurora.output.categorize` and `aurora.output.concat_frames`."""
+
+    def test_concat_keeps_categories(self):
+        frames = [output.categorize(pd.DataFrame({'InstanceType': ['m5.large', 'm5.large'], 'usd_per_hr': [0.1, 0.1],
+                                                  'region_name': ['us-east-1', 'us-east-1']}),
+                                    ['InstanceType', 'region_name']),
+                  output.categorize(pd.DataFrame({'InstanceType': ['c5.xlarge'], 'usd_per_hr': [0.2],
+                                                  'region_name': ['us-west-2']}), ['InstanceType', 'region_name'])]
+        results_df = output.concat_frames(frames, columns=['region_name', 'InstanceType', 'usd_per_hr'])
+        self.assertIsInstance(results_df['InstanceType'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(results_df['InstanceType'].astype(str)), ['m5.large', 'm5.large', 'c5.xlarge'])
+        self.assertEqual(list(results_df['region_name'].astype(str)), ['us-east-1', 'us-east-1', 'us-west-2'])
+        self.assertEqual(list(results_df.columns), ['region_name', 'InstanceType', 'usd_per_hr'])
+        # categoricals are written out as plain text
+        normalized_df = output.normalize_frame(results_df)
+        self.assertEqual(normalized_df['InstanceType'].iloc[2], 'c5.xlarge')
+
+    def test_concat_nothing(self):
+        self.assertEqual(list(output.concat_frames([], columns=['id', 'usd_per_month']).columns),
+                         ['id', 'usd_per_month'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the Pricing API attribute catalog."""
+
+import unittest
+
+from aurora import pricing_api_info, pricing_cache
+
+
+class StubPricingClient(object):
+    """Stands in for boto3.client('pricing'), paging location values two at a time."""
+
+    attributes = {'volumeType': ['Cold HDD', 'General Purpose', 'Magnetic'],
+                  'location': ['Asia Pacific (Tokyo)', 'EU (Ireland)', 'US East (N. Virginia)', 'US West (Oregon)']}
+
+    def __init__(self):
+        self.calls = 0
+
+    def describe_services(self, ServiceCode):
+        self.calls += 1
+        if ServiceCode != 'AmazonEC2':
+            return {'Services': []}
+        return {'Services': [{'ServiceCode': ServiceCode, 'AttributeNames': sorted(self.attributes)}]}
+
+    def get_attribute_values(self, ServiceCode, AttributeName, MaxResults, NextToken=None):
+        self.calls += 1
+        start = int(NextToken or 0)
+        values = self.attributes[AttributeName]
+        response = {'AttributeValues': [{'Value': value} for value in values[start:start + 2]]}
+        if start + 2 < len(values):
+            response['NextToken'] = str(start + 2)
+        return response
+
+
+class TestCatalog(unittest.TestCase):
+    """Tests for `aurora.pricing_api_info.get_catalog`."""
+
+    def setUp(self):
+        self.pricing = StubPricingClient()
+        self.cache = pricing_cache.PricingCache(path=':memory:')
+
+    def test_every_page_of_every_attribute(self):
+        catalog = pricing_api_info.get_catalog('AmazonEC2', workers=2, pricing=self.pricing, cache=self.cache)
+        self.assertEqual(catalog, StubPricingClient.attributes)
+        # describe_services, then 2 pages of volumeType and 2 of location
+        self.assertEqual(self.pricing.calls, 5)
+        # served from the cache the second time round
+        pricing_api_info.get_catalog('AmazonEC2', pricing=self.pricing, cache=self.cache)
+        self.assertEqual(self.pricing.calls, 5)
+
+    def test_unknown_service_code(self):
+        with self.assertRaises(ValueError):
+            pricing_api_info.get_catalog('AmazonEC3', pricing=self.pricing, cache=self.cache)
+
+    def test_find_unknown_values(self):
+        self.assertIsNone(pricing_api_info.find_unknown_values('AmazonEC2', 'volumeType', ['Magnetic'],
+                                                               cache=self.cache))
+        pricing_api_info.get_catalog('AmazonEC2', attribute_names=['volumeType'], pricing=self.pricing,
+                                     cache=self.cache)
+        self.assertEqual(pricing_api_info.find_unknown_values('AmazonEC2', 'volumeType',
+                                                              ['Magnetic', 'Provisioned IOPS'], cache=self.cache),
+                         ['Provisioned IOPS'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the local pricing cache."""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import tools
+from aurora import pricing_cache
+
+
+def make_price_item(usd, instance_type='m5.large', platform='Linux'):
+    return json.dumps({'product': {'attributes': {'instanceType': instance_type, 'operatingSystem': platform}},
+                       'terms': {'OnDemand': {'ABC.123': {'priceDimensions': {'ABC.123.456': {
+                           'pricePerUnit': {'USD': usd}}}}}}})
+
+
+class StubPricingClient(object):
+    """Stands in for boto3.client('pricing'), returning a fixed price list and counting calls."""
+
+    def __init__(self, price_list, page_size=None):
+        self.price_list = price_list
+        self.page_size = page_size or max(len(price_list), 1)
+        self.calls = 0
+
+    def get_products(self, **kwargs):
+        self.calls += 1
+        start = int(kwargs.get('NextToken', 0))
+        end = start + self.page_size
+        response = {'PriceList': self.price_list[start:end]}
+        if end < len(self.price_list):
+            response['NextToken'] = str(end)
+        return response
+
+
+class TestPricingCache(unittest.TestCase):
+    """Tests for `aurora.pricing_cache`."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.cache_dir, 'prices.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def get_price(self, client, cache):
+        return tools.get_price(region_name='us-east-1', instance_type='m5.large', platform='Linux',
+                               region_description='US East (N. Virginia)', client=client, cache=cache)
+
+    def test_memoizes_within_process(self):
+        client = StubPricingClient([make_price_item('0.0960000000')])
+        cache = pricing_cache.PricingCache(path=self.cache_path)
+        for _ in range(3):
+            self.assertEqual(float(self.get_price(client, cache)), 0.096)
+        self.assertEqual(client.calls, 1)
+
+    def test_persists_across_processes(self):
+        client = StubPricingClient([make_price_item('0.0960000000')])
+        self.get_price(client, pricing_cache.PricingCache(path=self.cache_path))
+        self.get_price(client, pricing_cache.PricingCache(path=self.cache_path))
+        self.assertEqual(client.calls, 1)
+
+    def test_expired_and_refresh(self):
+        client = StubPricingClient([make_price_item('0.0960000000')])
+        self.get_price(client, pricing_cache.PricingCache(path=self.cache_path))
+        self.get_price(client, pricing_cache.PricingCache(path=self.cache_path, ttl_days=0))
+        self.assertEqual(client.calls, 2)
+        self.get_price(client, pricing_cache.PricingCache(path=self.cache_path, refresh=True))
+        self.assertEqual(client.calls, 3)
+
+    def test_skips_zero_price(self):
+        client = StubPricingClient([make_price_item('0.0000000000'), make_price_item('0.1920000000')])
+        cache = pricing_cache.PricingCache(path=self.cache_path)
+        self.assertEqual(float(self.get_price(client, cache)), 0.192)
+
+
+class TestPriceIndex(unittest.TestCase):
+    """Tests for the regional EC2 price index in `tools`."""
+
+    def test_pages_through_all_products(self):
+        client = StubPricingClient([make_price_item('0.0960000000', 'm5.large', 'Linux'),
+                                    make_price_item('0.1880000000', 'm5.large', 'Windows'),
+                                    make_price_item('0.0000000000', 'c5.xlarge', 'Linux'),
+                                    make_price_item('0.1700000000', 'c5.xlarge', 'Linux'),
+                                    make_price_item('0.9990000000', 'm5.large', 'Linux')],
+                                   page_size=2)
+        price_index = tools.build_price_index(client, 'US East (N. Virginia)')
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(price_index, {('m5.large', 'Linux'): '0.0960000000',
+                                       ('m5.large', 'Windows'): '0.1880000000',
+                                       ('c5.xlarge', 'Linux'): '0.1700000000'})
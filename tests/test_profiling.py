@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the --profile instrumentation."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto3.session
+
+from aurora import clients, ec2_info, pricing_cache, profiling
+from benchmarks.fake_account import FakeAccount
+
+
+class TestProfiler(unittest.TestCase):
+    """Tests for `aurora.profiling`."""
+
+    region_names = ['us-east-1', 'us-west-2']
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        pricing_cache.configure(path=os.path.join(self.cache_dir, 'prices.sqlite'))
+        session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                        region_name='us-east-1')
+        FakeAccount(self.region_names, n_instances=100, n_volumes=0, n_buckets=0).install(session)
+        clients.configure(session=session)
+
+    def tearDown(self):
+        profiling.disable()
+        clients.configure(session=boto3.session.Session())
+        pricing_cache.configure()
+        shutil.rmtree(self.cache_dir)
+
+    def test_counts_calls_and_stages(self):
+        profiler = profiling.enable()
+        ec2_info.collect(self.region_names, max_results=20, workers=2)
+        profile = profiler.to_dict()
+        calls = dict(((c['service'], c['operation'], c['region']), c['count']) for c in profile['api_calls'])
+        self.assertEqual(calls[('ec2', 'DescribeInstances', 'us-west-2')], 3)
+        self.assertEqual(calls[('pricing', 'GetProducts', 'us-east-1')], 2)
+        self.assertEqual(profile['stages']['ec2.pricing']['count'], 2)
+
+    def test_stage_is_a_no_op_when_disabled(self):
+        with profiling.stage('ec2.pricing'):
+            pass
+        self.assertIsNone(profiling.get_profiler())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the region registry."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from aurora import regions
+
+
+class TestRegionRegistry(unittest.TestCase):
+    """Tests for `aurora.regions`."""
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.index_dir, 'regions.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def test_lookups(self):
+        registry = regions.RegionRegistry.from_endpoints()
+        self.assertIn('us-east-1', registry.get_all_regions())
+        self.assertEqual(registry.get_description('us-east-1'), 'US East (N. Virginia)')
+        self.assertEqual(registry.get_description('us-east-1a'), 'US East (N. Virginia)')
+        self.assertEqual(registry.get_region_name('US East (N. Virginia)'), 'us-east-1')
+
+    def test_index_round_trip(self):
+        self.assertIsNone(regions.RegionRegistry.from_index(self.index_path))
+        built = regions.build_index(self.index_path)
+        loaded = regions.RegionRegistry.from_index(self.index_path)
+        self.assertEqual(loaded.descriptions, built.descriptions)
+
+    def test_registry_writes_the_index(self):
+        self.addCleanup(setattr, regions, '_registry', regions._registry)
+        regions._registry = None
+        registry = regions.get_registry(self.index_path)
+        self.assertEqual(regions.RegionRegistry.from_index(self.index_path).descriptions, registry.descriptions)
+        # the next process reads the index rather than botocore's endpoints
+        regions._registry = None
+        with open(self.index_path, 'w') as f:
+            f.write('{{"botocore_version": "{}", "regions": [["us-east-1", "Indexed"]]}}'.format(
+                regions._botocore_version()))
+        self.assertEqual(regions.get_registry(self.index_path).get_description('us-east-1'), 'Indexed')
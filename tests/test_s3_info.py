@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the S3 sizing and pricing stages."""
+
+import datetime
+import unittest
+from collections import OrderedDict
+
+import botocore.exceptions
+import numpy as np
+import pandas as pd
+
+from aurora import s3_info
+
+
+class StubCloudWatchClient(object):
+    """
+    Stands in for boto3.client('cloudwatch'), returning one day of data for StandardStorage only, split over
+    pages_per_request responses when asked to.
+    """
+
+    def __init__(self, pages_per_request=1):
+        self.pages_per_request = pages_per_request
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, NextToken=None, **kwargs):
+        self.calls.append((len(MetricDataQueries), NextToken))
+        page = 0 if NextToken is None else int(NextToken)
+        results = []
+        for query in MetricDataQueries:
+            dimensions = {d['Name']: d['Value'] for d in query['MetricStat']['Metric']['Dimensions']}
+            values = [2e9, 1e9] if dimensions['StorageType'] == 'StandardStorage' else []
+            # the datapoints of every query are spread over the pages
+            results.append({'Id': query['Id'], 'Values': values[page::self.pages_per_request]})
+        response = {'MetricDataResults': results}
+        if page + 1 < self.pages_per_request:
+            response['NextToken'] = str(page + 1)
+        return response
+
+
+class StubS3Client(object):
+    """Stands in for boto3.client('s3'), forbidding any lookups for buckets whose name starts with 'locked'."""
+
+    def __init__(self, bucket_regions):
+        self.bucket_regions = bucket_regions
+
+    def _check(self, bucket_name, operation_name):
+        if bucket_name.startswith('locked'):
+            raise botocore.exceptions.ClientError({'Error': {'Code': '403', 'Message': 'Forbidden'}}, operation_name)
+
+    def head_bucket(self, Bucket):
+        self._check(Bucket, 'HeadBucket')
+        return {'ResponseMetadata': {'HTTPHeaders': {'x-amz-bucket-region': self.bucket_regions[Bucket]}}}
+
+    def get_bucket_location(self, Bucket):
+        self._check(Bucket, 'GetBucketLocation')
+        return {'LocationConstraint': self.bucket_regions[Bucket]}
+
+
+class TestGetBucketSizes(unittest.TestCase):
+    """Tests for `aurora.s3_info.get_bucket_sizes`."""
+
+    def setUp(self):
+        self.bucket_names = ['bucket-{}'.format(i) for i in range(100)]
+        self.now = datetime.datetime.now()
+
+    def test_batches_queries(self):
+        cloudwatch = StubCloudWatchClient()
+        bucket_sizes = s3_info.get_bucket_sizes(cloudwatch, self.bucket_names, self.now, self.now, np.min)
+        # 100 buckets x 8 storage types fit in two requests
+        self.assertEqual(cloudwatch.calls, [(500, None), (300, None)])
+        # storage types without any data are left out
+        self.assertEqual(len(bucket_sizes), 100)
+        self.assertEqual(bucket_sizes[('bucket-42', 'StandardStorage')], 1e9)
+
+    def test_follows_next_token(self):
+        cloudwatch = StubCloudWatchClient(pages_per_request=2)
+        bucket_sizes = s3_info.get_bucket_sizes(cloudwatch, self.bucket_names[:10], self.now, self.now, np.max)
+        self.assertEqual(cloudwatch.calls, [(80, None), (80, '1')])
+        # the datapoints of both pages are aggregated together
+        self.assertEqual(bucket_sizes[('bucket-7', 'StandardStorage')], 2e9)
+
+
+class TestS3Info(unittest.TestCase):
+    """Tests for `aurora.s3_info`."""
+
+    def test_resolve_bucket_regions_fallback(self):
+        client = StubS3Client({'a': 'eu-west-1', 'b': 'us-west-2'})
+        buckets = [{'Name': name} for name in ['locked-0', 'a', 'locked-1', 'b', 'locked-2']]
+        bucket_regions = s3_info.resolve_bucket_regions(client, buckets, workers=4)
+        # forbidden buckets take the region of the bucket listed before them
+        self.assertEqual(list(bucket_regions.items()), [('locked-0', 'us-east-1'), ('a', 'eu-west-1'),
+                                                        ('locked-1', 'eu-west-1'), ('b', 'us-west-2'),
+                                                        ('locked-2', 'us-west-2')])
+
+    def test_lookup_tier_prices(self):
+        price_df = pd.DataFrame([
+            {'region_name': 'us-east-1', 'storage_type': 'StandardStorage', 'min_bytes': 51200.0,
+             'max_bytes': 512000.0, 'price_per_gb': 0.022},
+            {'region_name': 'us-east-1', 'storage_type': 'StandardStorage', 'min_bytes': 0.0,
+             'max_bytes': 51200.0, 'price_per_gb': 0.023},
+            {'region_name': 'us-east-1', 'storage_type': 'StandardStorage', 'min_bytes': 512000.0,
+             'max_bytes': float('inf'), 'price_per_gb': 0.021},
+            {'region_name': 'us-east-1', 'storage_type': 'GlacierStorage', 'min_bytes': 0.0,
+             'max_bytes': float('inf'), 'price_per_gb': 0.004},
+        ])
+        prices = s3_info.lookup_tier_prices(s3_info.build_tier_index(price_df),
+                                            np.array(['us-east-1'] * 5 + ['us-west-2']),
+                                            np.array(['StandardStorage'] * 4 + ['GlacierStorage', 'StandardStorage']),
+                                            np.array([10.0, 51200.0, 60000.0, 1e6, 5.0, 10.0]))
+        np.testing.assert_array_equal(prices, [0.023, 0.023, 0.022, 0.021, 0.004, np.nan])
+
+    def test_price_buckets_by_gb(self):
+        price_df = pd.DataFrame([
+            {'region_name': 'us-east-1', 'storage_type': 'StandardStorage', 'min_bytes': 0.0,
+             'max_bytes': 51200.0, 'price_per_gb': 0.023},
+            {'region_name': 'us-east-1', 'storage_type': 'StandardStorage', 'min_bytes': 51200.0,
+             'max_bytes': 512000.0, 'price_per_gb': 0.022},
+            {'region_name': 'us-east-1', 'storage_type': 'StandardStorage', 'min_bytes': 512000.0,
+             'max_bytes': float('inf'), 'price_per_gb': 0.021},
+        ])
+        bucket_sizes = {('small', 'StandardStorage'): 47e12, ('large', 'StandardStorage'): 60e12}
+        results_df = s3_info.price_buckets(OrderedDict([('small', 'us-east-1'), ('large', 'us-east-1')]),
+                                           bucket_sizes, price_df)
+        # the tier bounds are in GB, so 47 TB is still in the first 50 TB tier
+        self.assertEqual(list(results_df['price_per_gb']), [0.023, 0.022])
+        self.assertEqual(list(results_df['usd_per_month']), [47000 * 0.023, 60000 * 0.022])
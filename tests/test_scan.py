@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the parallel region scan."""
+
+import time
+import unittest
+
+from aurora import scan
+
+
+def scan_func(region_name):
+    if region_name == 'ap-east-1':
+        raise RuntimeError('region not enabled')
+    # make the first regions finish last
+    time.sleep(0.01 * (3 - int(region_name[-1])))
+    return [region_name]
+
+
+class TestRegionScan(unittest.TestCase):
+    """Tests for `aurora.scan.RegionScan`."""
+
+    region_names = ['us-east-1', 'ap-east-1', 'us-east-2', 'us-west-2']
+
+    def test_results_keep_region_order(self):
+        for workers in (1, 4):
+            region_scan = scan.RegionScan(scan_func, self.region_names, workers=workers)
+            results = list(region_scan)
+            self.assertEqual([region_name for region_name, _ in results], ['us-east-1', 'us-east-2', 'us-west-2'])
+            self.assertEqual(list(region_scan.errors), ['ap-east-1'])
+
+    def test_region_failing_partway_yields_nothing(self):
+        def scan_pages(region_name):
+            yield region_name + '/page-1'
+            if region_name == 'us-west-2':
+                raise RuntimeError('throttled')
+            yield region_name + '/page-2'
+
+        for workers in (1, 4):
+            region_scan = scan.RegionScan(scan_pages, ['us-east-1', 'us-west-2', 'eu-west-1'], workers=workers)
+            results = [(region_name, list(pages)) for region_name, pages in region_scan]
+            self.assertEqual(results, [('us-east-1', ['us-east-1/page-1', 'us-east-1/page-2']),
+                                       ('eu-west-1', ['eu-west-1/page-1', 'eu-west-1/page-2'])])
+            self.assertEqual(list(region_scan.errors), ['us-west-2'])
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the cost table HTTP endpoint."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pandas as pd
+
+from aurora import cli, history, serve, snapshots
+
+
+class TestServe(unittest.TestCase):
+    """Tests for `aurora.serve.make_server` and `aurora.serve.CostTables`."""
+
+    def setUp(self):
+        self.tables = serve.CostTables()
+        self.server = serve.make_server(self.tables, port=0)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def refresh(self, ebs_usd=2.0, failed=()):
+        service_dfs = dict()
+        if 'ec2' not in failed:
+            service_dfs['ec2'] = pd.DataFrame({'InstanceId': ['i-1', 'i-2'], 'InstanceType': ['m5.large', 't3.micro'],
+                                               'region_name': ['us-east-1', 'us-west-2'],
+                                               'usd_per_month': [70.0, 7.5], 'Team': ['maps', 'search']})
+        service_dfs['ebs'] = pd.DataFrame({'id': ['vol-1'], 'volume_type': ['gp2'], 'region_name': ['us-east-1'],
+                                           'usd_per_month': [ebs_usd], 'Team': ['maps']})
+        self.tables.update(service_dfs, failed=failed)
+
+    def get(self, path, headers=None):
+        try:
+            response = urlopen(Request(self.url + path, headers=headers or dict()))
+        except HTTPError as e:
+            return e.code, e.headers, e.read()
+        return response.status, response.headers, response.read()
+
+    def test_not_ready_until_first_refresh(self):
+        status, headers, _ = self.get('/costs')
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['Retry-After'], '60')
+
+    def test_filters(self):
+        self.refresh()
+        status, _, body = self.get('/costs?tag=team:maps&region=us-east-1')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(row['resource_id'] for row in json.loads(body.decode('utf-8'))), ['i-1', 'vol-1'])
+        _, _, body = self.get('/costs?service=ec2&format=csv')
+        self.assertEqual(body.decode('utf-8').splitlines()[1:],
+                         ['ec2,i-1,m5.large,us-east-1,70.0,,,maps,,,', 'ec2,i-2,t3.micro,us-west-2,7.5,,,search,,,'])
+        self.assertEqual(self.get('/costs?tag=Colour:red')[0], 400)
+
+    def test_etags(self):
+        self.refresh()
+        status, headers, _ = self.get('/costs?service=ebs')
+        etag = headers['ETag']
+        self.assertEqual(self.get('/costs?service=ebs', headers={'If-None-Match': etag})[0], 304)
+        # another query, or the same one after a refresh, is a new answer
+        self.assertEqual(self.get('/costs?service=ec2', headers={'If-None-Match': etag})[0], 200)
+        self.refresh(ebs_usd=3.0, failed=['ec2'])
+        status, headers, body = self.get('/costs', headers={'If-None-Match': etag})
+        self.assertEqual(status, 200)
+        # a failed service keeps serving its previous results
+        self.assertEqual(sorted(row['usd_per_month'] for row in json.loads(body.decode('utf-8'))), [3.0, 7.5, 70.0])
+        _, _, body = self.get('/status')
+        self.assertEqual(json.loads(body.decode('utf-8'))['failed'], ['ec2'])
+
+
+
+class TestRefresher(unittest.TestCase):
+    """Tests for `aurora.serve.Refresher.refresh`, with the collectors stubbed out."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.history_store = history.HistoryStore(':memory:')
+        snapshot_store = snapshots.SnapshotStore(':memory:')
+        patches = [mock.patch.object(cli, 'inventory_services', side_effect=self.inventory_services),
+                   mock.patch.object(history, 'get_store', lambda: self.history_store),
+                   mock.patch.object(snapshots, 'SnapshotStore', lambda: snapshot_store)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.tables = serve.CostTables()
+        self.refresher = serve.Refresher(self.tables, ['ec2', 'ebs'], ['us-east-1', 'us-west-2'],
+                                         checkpoint_root=os.path.join(self.root, 'runs'))
+        self.failed_regions = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def inventory_services(self, service_names, region_names, service_snapshots, service_checkpoints=None, **kwargs):
+        # every region of ec2 works, ebs fails in failed_regions
+        for region_name in region_names:
+            service_checkpoints['ec2'].save(region_name, None)
+            if region_name in self.failed_regions:
+                service_checkpoints['ebs'].fail(region_name, RuntimeError('throttled'))
+            else:
+                service_checkpoints['ebs'].save(region_name, None)
+        return {'ec2': pd.DataFrame({'InstanceId': ['i-1'], 'InstanceType': ['m5.large'],
+                                     'region_name': ['us-east-1'], 'usd_per_month': [70.0]}),
+                'ebs': pd.DataFrame({'id': ['vol-{}'.format(i) for i in range(2 - len(self.failed_regions))],
+                                     'volume_type': 'gp2', 'region_name': 'us-west-2', 'usd_per_month': 1.0})}, []
+
+    def test_region_failure_keeps_the_last_complete_results(self):
+        self.refresher.refresh()
+        self.assertEqual(self.tables.status()['resources'], {'ec2': 1, 'ebs': 2})
+        self.failed_regions = ['us-east-1']
+        self.refresher.refresh()
+        status = self.tables.status()
+        self.assertEqual(status['failed'], ['ebs'])
+        # the partial ebs inventory is neither served nor recorded
+        self.assertEqual(status['resources'], {'ec2': 1, 'ebs': 2})
+        runs = self.history_store._connect().execute(
+            'SELECT service, COUNT(*) FROM runs GROUP BY service ORDER BY service').fetchall()
+        self.assertEqual(runs, [('ebs', 1), ('ec2', 2)])
+        # refreshes are never resumed, so their checkpoints don't pile up
+        self.assertEqual(os.listdir(os.path.join(self.root, 'runs')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
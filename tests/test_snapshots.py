@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the incremental inventory snapshots."""
+
+import unittest
+
+from aurora import snapshots
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for `aurora.snapshots.Snapshot`."""
+
+    def setUp(self):
+        self.store = snapshots.SnapshotStore(':memory:')
+        snapshot = snapshots.Snapshot('ec2', store=self.store)
+        for resource_id, region_name, instance_type in [('i-1', 'us-east-1', 'm5.large'),
+                                                        ('i-2', 'us-east-1', 'm5.large'),
+                                                        ('i-3', 'us-west-2', 'c5.xlarge')]:
+            snapshot.add(region_name, resource_id, snapshots.make_fingerprint(instance_type),
+                         {'usd_per_hr': 0.1})
+        snapshot.mark_done('us-east-1')
+        snapshot.mark_done('us-west-2')
+        snapshot.commit()
+
+    def test_lookup_only_unchanged_when_incremental(self):
+        snapshot = snapshots.Snapshot('ec2', store=self.store)
+        self.assertIsNone(snapshot.lookup('i-1', snapshots.make_fingerprint('m5.large')))
+        snapshot = snapshots.Snapshot('ec2', store=self.store, incremental=True)
+        self.assertEqual(snapshot.lookup('i-1', snapshots.make_fingerprint('m5.large')), {'usd_per_hr': 0.1})
+        self.assertIsNone(snapshot.lookup('i-1', snapshots.make_fingerprint('m5.xlarge')))
+        self.assertIsNone(snapshot.lookup('i-4', snapshots.make_fingerprint('m5.large')))
+        self.assertEqual(snapshot.carried, 1)
+
+    def test_diff_skips_regions_not_listed(self):
+        snapshot = snapshots.Snapshot('ec2', store=self.store, incremental=True)
+        snapshot.add('us-east-1', 'i-1', snapshots.make_fingerprint('m5.xlarge'), {'usd_per_hr': 0.2})
+        snapshot.add('us-east-1', 'i-4', snapshots.make_fingerprint('m5.large'), {'usd_per_hr': 0.1})
+        # us-west-2 failed this time, so i-3 is not reported as removed
+        snapshot.mark_done('us-east-1')
+        diff_rows = snapshot.commit()
+        self.assertEqual([(row['change'], row['resource_id']) for row in diff_rows],
+                         [('added', 'i-4'), ('removed', 'i-2'), ('changed', 'i-1')])
+        self.assertEqual(sorted(self.store.load('ec2')), ['i-1', 'i-3', 'i-4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
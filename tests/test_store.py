@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the shared SQLite store setup."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from aurora import store
+
+
+class CounterStore(store.SQLiteStore):
+    """A store with a single table of counts."""
+
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS counts (name TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS counts_n ON counts (n);
+"""
+
+    def __init__(self, path=':memory:'):
+        super(CounterStore, self).__init__(path)
+
+    def add(self, name):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT OR IGNORE INTO counts VALUES (?, 0)', (name,))
+            conn.execute('UPDATE counts SET n = n + 1 WHERE name = ?', (name,))
+            conn.commit()
+
+    def get(self, name):
+        with self._lock:
+            return self._connect().execute('SELECT n FROM counts WHERE name = ?', (name,)).fetchone()[0]
+
+
+class TestSQLiteStore(unittest.TestCase):
+    """Tests for `aurora.store`."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_creates_the_file_on_first_use(self):
+        path = os.path.join(self.root, 'nested', 'counts.sqlite')
+        counter_store = CounterStore(path)
+        self.assertFalse(os.path.exists(path))
+        counter_store.add('a')
+        counter_store.add('a')
+        self.assertTrue(os.path.exists(path))
+        # the schema is only created once, so a second store sees the same rows
+        self.assertEqual(CounterStore(path).get('a'), 2)
+
+    def test_default_store(self):
+        default_store = store.DefaultStore(CounterStore)
+        self.assertIs(default_store.get(), default_store.get())
+        configured = default_store.configure(path=os.path.join(self.root, 'counts.sqlite'))
+        self.assertIs(default_store.get(), configured)
+        self.assertEqual(configured.path, os.path.join(self.root, 'counts.sqlite'))
+
+
+if __name__ == '__main__':
+    unittest.main()
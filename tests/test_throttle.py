@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the adaptive rate limiter and throttling-aware retries."""
+
+import json
+import unittest
+
+import boto3.session
+import botocore.awsrequest
+import botocore.exceptions
+
+from aurora import clients, throttle
+
+
+class FakeClock(object):
+    """Clock whose sleep just moves time forward, so the tests don't actually wait."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ThrottlingStubClient(object):
+    """Stands in for a boto3 client whose first few calls are throttled."""
+
+    def __init__(self, throttled_calls, error_code='ThrottlingException'):
+        self.throttled_calls = throttled_calls
+        self.error_code = error_code
+        self.calls = 0
+
+    def get_products(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.throttled_calls:
+            raise botocore.exceptions.ClientError({'Error': {'Code': self.error_code, 'Message': 'Rate exceeded'}},
+                                                  'GetProducts')
+        return {'PriceList': []}
+
+
+class ThrottlingEndpoint(object):
+    """Answers a client's requests at the HTTP layer (before-send), failing the first few (throttled with a 400)."""
+
+    def __init__(self, throttled_calls, status=400, error_code='ThrottlingException'):
+        self.throttled_calls = throttled_calls
+        self.status = status
+        self.error_code = error_code
+        self.requests = 0
+
+    def __call__(self, request, **kwargs):
+        self.requests += 1
+        if self.requests <= self.throttled_calls:
+            status, body = self.status, {'__type': self.error_code, 'message': 'Rate exceeded'}
+        else:
+            status, body = 200, {'FormatVersion': 'aws_v1', 'PriceList': []}
+        return botocore.awsrequest.AWSResponse(request.url, status, {'Content-Type': 'application/x-amz-json-1.1'},
+                                               StubRawResponse(json.dumps(body).encode('utf-8')))
+
+
+class StubRawResponse(object):
+
+    def __init__(self, content):
+        self.content = content
+
+    def stream(self, **kwargs):
+        yield self.content
+
+
+class TestRateLimitedCaller(unittest.TestCase):
+    """Tests for `aurora.throttle`."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.caller = throttle.RateLimitedCaller(rates={'pricing': 4.0}, max_retries=3,
+                                                 sleep=self.clock.sleep, clock=self.clock.time)
+
+    def test_retries_throttled_calls(self):
+        client = ThrottlingStubClient(throttled_calls=2)
+        self.assertEqual(self.caller.call('pricing', client.get_products, ServiceCode='AmazonEC2'),
+                         {'PriceList': []})
+        stats = self.caller.get_stats('pricing')
+        self.assertEqual((stats.calls, stats.throttles, stats.retries), (3, 2, 2))
+        # two throttles halved the rate twice before the success nudged it back up
+        self.assertAlmostEqual(self.caller.get_limiter('pricing').rate, 2.6)
+
+    def test_gives_up_after_max_retries(self):
+        client = ThrottlingStubClient(throttled_calls=10)
+        with self.assertRaises(botocore.exceptions.ClientError):
+            self.caller.call('pricing', client.get_products)
+        self.assertEqual(client.calls, 4)
+
+    def test_other_errors_are_not_retried(self):
+        client = ThrottlingStubClient(throttled_calls=10, error_code='AccessDeniedException')
+        with self.assertRaises(botocore.exceptions.ClientError):
+            self.caller.call('pricing', client.get_products)
+        self.assertEqual(client.calls, 1)
+
+    def test_sees_throttling_of_real_clients(self):
+        # botocore must not retry throttled pricing calls itself, or the limiter never hears about them
+        session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                        region_name='us-east-1')
+        pricing = clients.ClientPool(session=session).get_client('pricing', region_name='us-east-1')
+        endpoint = ThrottlingEndpoint(throttled_calls=3)
+        pricing.meta.events.register('before-send.pricing.GetProducts', endpoint)
+        self.assertEqual(self.caller.call('pricing', pricing.get_products, ServiceCode='AmazonEC2')['PriceList'], [])
+        self.assertEqual(endpoint.requests, 4)
+        stats = self.caller.get_stats('pricing')
+        self.assertEqual((stats.calls, stats.throttles, stats.retries), (4, 3, 3))
+
+    def test_retries_transient_errors(self):
+        session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                        region_name='us-east-1')
+        pricing = clients.ClientPool(session=session).get_client('pricing', region_name='us-east-1')
+        endpoint = ThrottlingEndpoint(throttled_calls=2, status=503, error_code='ServiceUnavailable')
+        pricing.meta.events.register('before-send.pricing.GetProducts', endpoint)
+        self.assertEqual(self.caller.call('pricing', pricing.get_products, ServiceCode='AmazonEC2')['PriceList'], [])
+        self.assertEqual(endpoint.requests, 3)
+        stats = self.caller.get_stats('pricing')
+        self.assertEqual((stats.calls, stats.throttles, stats.retries), (3, 0, 2))
+        # a failing server isn't a sign to slow down
+        self.assertGreaterEqual(self.caller.get_limiter('pricing').rate, 4.0)
+
+    def test_retries_timeouts(self):
+        calls = []
+
+        def get_products():
+            calls.append(1)
+            if len(calls) == 1:
+                raise botocore.exceptions.ReadTimeoutError(endpoint_url='https://api.pricing.us-east-1.amazonaws.com')
+            return {'PriceList': []}
+
+        self.assertEqual(self.caller.call('pricing', get_products), {'PriceList': []})
+        self.assertEqual(len(calls), 2)
+
+    def test_rate_limits_calls(self):
+        limiter = throttle.AdaptiveRateLimiter(4.0, clock=self.clock.time, sleep=self.clock.sleep)
+        for _ in range(12):
+            limiter.acquire()
+            limiter.on_success()
+        # a burst of 4 goes straight through, the other 8 are spaced out at 4 per second
+        self.assertAlmostEqual(self.clock.now, 2.0)
@@ -1,6 +1,5 @@
-import boto3
 import json
-from pkg_resources import resource_filename
+from aurora import clients, offers, pricing_cache, regions, throttle
 
 # Search product filter
 FLT = '[{{"Field": "tenancy", "Value": "shared", "Type": "TERM_MATCH"}},'\
@@ -10,57 +9,131 @@ FLT = '[{{"Field": "tenancy", "Value": "shared", "Type": "TERM_MATCH"}},'\
       '{{"Field": "location", "Value": "{r}", "Type": "TERM_MATCH"}}]'
 
 
+# Filters shared by every on-demand Linux/Windows/etc. instance in a region (used to build a regional price index)
+INDEX_FLT = '[{{"Field": "tenancy", "Value": "shared", "Type": "TERM_MATCH"}},'\
+            '{{"Field": "preInstalledSw", "Value": "NA", "Type": "TERM_MATCH"}},'\
+            '{{"Field": "location", "Value": "{r}", "Type": "TERM_MATCH"}}]'
+
+
+def get_on_demand_usd(product):
+    od = product['terms']['OnDemand']
+    id1 = list(od)[0]
+    id2 = list(od[id1]['priceDimensions'])[0]
+    return od[id1]['priceDimensions'][id2]['pricePerUnit']['USD']
+
+
 def get_price_dims(client, region_description, instance_type, platform):
     f = FLT.format(r=region_description,
                    t=instance_type,
                    o=platform)
-    data = client.get_products(ServiceCode='AmazonEC2', Filters=json.loads(f))
-    od = json.loads(data['PriceList'][0])['terms']['OnDemand']
-    id1 = list(od)[0]
-    id2 = list(od[id1]['priceDimensions'])[0]
-    usd = od[id1]['priceDimensions'][id2]['pricePerUnit']['USD']
+    data = throttle.call('pricing', client.get_products, ServiceCode='AmazonEC2', Filters=json.loads(f))
+    usd = get_on_demand_usd(json.loads(data['PriceList'][0]))
     if float(usd) == 0 and len(data['PriceList']) > 1:
-        od = json.loads(data['PriceList'][1])['terms']['OnDemand']
-        id1 = list(od)[0]
-        id2 = list(od[id1]['priceDimensions'])[0]
-        usd = od[id1]['priceDimensions'][id2]['pricePerUnit']['USD']
-
+        usd = get_on_demand_usd(json.loads(data['PriceList'][1]))
 
     return usd
 
 
-# Get current AWS price for an on-demand instance
-def get_price(region_name, instance_type, platform, region_description=None):
+# Page through every on-demand instance price in a region once, keyed by (instanceType, operatingSystem)
+def build_price_index(client, region_description):
+    price_index = dict()
+    kwargs = {'ServiceCode': 'AmazonEC2',
+              'Filters': json.loads(INDEX_FLT.format(r=region_description))}
+    while True:
+        data = throttle.call('pricing', client.get_products, **kwargs)
+        for price_item in data['PriceList']:
+            product = json.loads(price_item)
+            attributes = product.get('product', {}).get('attributes', {})
+            if 'instanceType' not in attributes or 'OnDemand' not in product.get('terms', {}):
+                continue
+            key = (attributes['instanceType'], attributes.get('operatingSystem', ''))
+            # like get_price_dims, keep the first listed price unless it is $0 and another one comes along
+            if key not in price_index or float(price_index[key]) == 0:
+                price_index[key] = get_on_demand_usd(product)
+        if not data.get('NextToken'):
+            break
+        kwargs['NextToken'] = data['NextToken']
+
+    return price_index
+
+
+# Get the regional price index (served from the local pricing cache when possible)
+def get_price_index(region_description, client=None, cache=None):
+    if cache is None:
+        cache = pricing_cache.get_cache()
+
+    def fetch():
+        store = offers.get_store()
+        price_index = store.get_ec2_index(region_description) if store is not None else None
+        if price_index is None:
+            pricing = client
+            if pricing is None:
+                pricing = clients.get_client('pricing', region_name='us-east-1')
+            price_index = build_price_index(client=pricing, region_description=region_description)
+        # json can't hold tuple keys, so the cached copy is a list of [instance_type, platform, usd]
+        return [[instance_type, platform, usd] for (instance_type, platform), usd in price_index.items()]
+
+    rows = cache.get_or_fetch(cache.make_key('ec2-index', region_description), fetch)
+
+    return {(instance_type, platform): usd for instance_type, platform, usd in rows}
+
+
+# Get current AWS price for an on-demand instance (served from the local pricing cache when possible)
+def get_price(region_name, instance_type, platform, region_description=None, client=None, cache=None):
     if region_description is None:
         region_description = get_region_description(region_name)
-    client = boto3.client('pricing', region_name='us-east-1')
-    usd = get_price_dims(client=client,
-                         region_description=region_description,
-                         instance_type=instance_type,
-                         platform=platform)
+    if cache is None:
+        cache = pricing_cache.get_cache()
+
+    def fetch():
+        store = offers.get_store()
+        if store is not None:
+            # imported offer file prices, if there are any for this instance type
+            usd = store.get_ec2_price(region_description, instance_type, platform)
+            if usd is not None:
+                return usd
+        pricing = client
+        if pricing is None:
+            pricing = clients.get_client('pricing', region_name='us-east-1')
+        return get_price_dims(client=pricing,
+                              region_description=region_description,
+                              instance_type=instance_type,
+                              platform=platform)
+
+    key = cache.make_key('ec2', region_description, instance_type, platform)
+    usd = cache.get_or_fetch(key, fetch)
 
     return usd
 
 
 def get_all_regions():
 
-    endpoint_file = resource_filename('botocore', 'data/endpoints.json')
-    with open(endpoint_file, 'r') as f:
-        data = json.load(f)
-    regions = list(data['partitions'][0]['regions'].keys())
+    return regions.get_registry().get_all_regions()
 
-    return regions
+
+# Expand the in_region argument of the cli commands ('all' or a single region code) into a list of region codes
+def resolve_regions(in_region):
+    expected_region_names = get_all_regions()
+    if in_region == 'all':
+        # process all regions
+        region_names = expected_region_names
+    else:
+        # check that the specified region is valid
+        if in_region not in expected_region_names:
+            raise ValueError("in_region not recognized: {}".format(in_region))
+        else:
+            region_names = [in_region]
+
+    return region_names
 
 
 # Translate region code to region name
 def get_region_description(region_name):
-    if len(region_name.split('-')[2]) > 1:
-        # reformat to drop the last letter
-        region_name = region_name[:-1]
-    endpoint_file = resource_filename('botocore', 'data/endpoints.json')
-    with open(endpoint_file, 'r') as f:
-        data = json.load(f)
-    return data['partitions'][0]['regions'][region_name]['description']
+
+    return regions.get_registry().get_description(region_name)
 
 
+# Translate region name back to region code
+def get_region_name(region_description):
 
+    return regions.get_registry().get_region_name(region_description)